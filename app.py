@@ -1,17 +1,34 @@
+import hashlib
 import json
+import mimetypes
 import os
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from functools import wraps
 
+import click
 from flask import (
     Flask, render_template, request, jsonify, abort,
-    session, redirect, url_for, flash
+    session, redirect, url_for, flash, g, send_from_directory, Response
 )
 from werkzeug.utils import secure_filename
 from test_routes import test_bp
 
+import assets
+import availability
+import checkin
 import database as db
+import explain_check
+import images
+import jobs
+import metrics
+import migrations
+import pagecache
+import pricing
+import qrcodes
+import search
+import slowlog
+import tickets
 
 # Получаем абсолютный путь к текущей директории
 template_dir = os.path.abspath(os.path.dirname(__file__))
@@ -29,11 +46,271 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
-# Автоматически генерируем расписание сеансов на 7 дней вперед при запуске проекта
-try:
-    db.generate_weekly_schedule()
-except Exception as e:
-    print(f"Не удалось сгенерировать расписание при запуске: {e}")
+# Фоновые задачи (отмена неоплаченных заказов и т.п.) запускаются в каждом
+# воркере при первом запросе; выполняет их только один воркер-лидер.
+# Выключите, если задачи крутятся отдельным процессом `flask run-jobs`.
+app.config['JOBS_ENABLED'] = os.environ.get('MGORKI_JOBS', '1') != '0'
+
+# Применять миграции схемы при старте (иначе - командой `flask db-migrate` при деплое)
+app.config['AUTO_MIGRATE'] = os.environ.get('MGORKI_AUTO_MIGRATE', '0') == '1'
+if app.config['AUTO_MIGRATE']:
+    migrations.migrate()
+
+
+# Метрики запросов, БД и шаблонов для /admin/metrics (см. metrics.py)
+metrics.init_app(app)
+# Журнал медленных запросов для /admin/slow-queries (см. slowlog.py)
+slowlog.init()
+# Токен для сборщика Prometheus: Authorization: Bearer <токен>
+METRICS_TOKEN = os.environ.get('MGORKI_METRICS_TOKEN')
+
+
+@app.before_request
+def start_background_jobs():
+    if app.config['JOBS_ENABLED']:
+        jobs.runner.start()
+
+
+# Чтение с реплик (database.DB_REPLICAS): после записи клиент ещё
+# REPLICA_CONFIG['pin_seconds'] читает с основной - окно хранится в сессии,
+# чтобы страница оплаты или билета в другом воркере увидела новый заказ
+@app.before_request
+def route_database_reads():
+    if db.DB_REPLICAS:
+        db.begin_routing(session.get('db_primary_until', 0))
+
+
+@app.after_request
+def remember_database_writes(response):
+    pin_until = db.routing_pin()
+    if pin_until is not None:
+        session['db_primary_until'] = pin_until
+    return response
+
+
+# ===================================================================================
+# СТАТИКА (имена с хэшем и сжатые копии, см. assets.py)
+# ===================================================================================
+
+assets.load_manifest()
+
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    """url_for('static', filename='styles/a.css') -> /static/dist/styles/a.<хэш>.css"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = assets.asset_path(values['filename'])
+
+
+def static_file(filename):
+    """Статика: готовая .br/.gz копия по Accept-Encoding, immutable для имён с хэшем"""
+    encoded, encoding = assets.encoded_variant(filename, request.headers.get('Accept-Encoding'))
+    if encoded:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(app.static_folder, encoded, mimetype=mimetype)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = app.send_static_file(filename)
+    if filename.startswith(assets.ASSET_CONFIG['dist_dir'] + '/'):
+        response.vary.add('Accept-Encoding')
+    if assets.is_immutable(filename):
+        response.headers['Cache-Control'] = assets.IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+app.view_functions['static'] = static_file
+
+
+# ===================================================================================
+# АДАПТИВНЫЕ КАРТИНКИ (srcset, см. images.py)
+# ===================================================================================
+
+# Ширина карточки в сетке: 1 колонка на телефоне, 2 на планшете, 3 на десктопе
+CARD_IMAGE_SIZES = '(max-width: 768px) 100vw, (max-width: 1200px) 50vw, 33vw'
+# Фото на страницах музея/программы/афиши: половина ширины, на узком экране - вся
+DETAIL_IMAGE_SIZES = '(max-width: 900px) 100vw, 50vw'
+
+
+def _static_url(path):
+    return url_for('static', filename=path)
+
+
+@app.template_global()
+def image_tag(path, **kwargs):
+    """<picture> со srcset для картинки из static: {{ image_tag(item.img_card, alt=...) }}"""
+    return images.image_tag(path, _static_url, **kwargs)
+
+
+app.jinja_env.globals.update(CARD_IMAGE_SIZES=CARD_IMAGE_SIZES, DETAIL_IMAGE_SIZES=DETAIL_IMAGE_SIZES)
+
+
+# ===================================================================================
+# ПРЕДЗАГРУЗКА ИЗОБРАЖЕНИЙ (Link: rel=preload)
+# ===================================================================================
+
+# Сколько первых карточек главной страницы предзагружать
+PRELOAD_CARD_IMAGES = 3
+HERO_DEFAULT_IMAGE = 'images/hero/Page_1.jpg'
+HERO_MOBILE_IMAGE = 'images/hero/Page_1_mobile.png'
+HERO_MOBILE_MEDIA = '(max-width: 768px)'
+HERO_DESKTOP_MEDIA = '(min-width: 769px)'
+
+_preload_cache = {}
+
+
+def preload_images(key, rows, build):
+    """Запомнить для ответа заголовок Link со списком картинок для предзагрузки.
+
+    build(*rows) возвращает список (путь в static, media или None[, sizes]).
+    Если для картинки есть уменьшенные копии и задан sizes, предзагружается
+    WebP через imagesrcset - тот же файл, который потом выберет <picture>. Результат
+    кэшируется по key, версии data_content и самим спискам строк из кэша БД:
+    пока строки те же, заголовок повторно не собирается.
+    """
+    version = db.get_table_version('data_content')
+    cached = _preload_cache.get(key)
+    if (cached is None or cached[0] != version or len(cached[1]) != len(rows)
+            or any(a is not b for a, b in zip(cached[1], rows))):
+        links = []
+        for path, media, *sizes in build(*rows):
+            if not path:
+                continue
+            link = f'<{url_for("static", filename=path)}>; rel=preload; as=image'
+            meta = images.get_meta(path) if sizes else None
+            if meta:
+                link = (f'<{url_for("static", filename=meta["webp"][0][1])}>; rel=preload; as=image; '
+                        f'type="image/webp"; imagesrcset="{images.srcset(meta["webp"], _static_url)}"; '
+                        f'imagesizes="{sizes[0]}"')
+            if media:
+                link += f'; media="{media}"'
+            links.append(link)
+        cached = (version, rows, ', '.join(links))
+        _preload_cache[key] = cached
+    g.preload_links = cached[2]
+
+
+@app.after_request
+def add_preload_links(response):
+    links = g.pop('preload_links', None)
+    if links and response.status_code == 200:
+        response.headers.add('Link', links)
+    return response
+
+
+def _homepage_preload(hero_images, museums):
+    hero = hero_images[0]['img_card'] if hero_images else HERO_DEFAULT_IMAGE
+    preload = [(hero, HERO_DESKTOP_MEDIA), (HERO_MOBILE_IMAGE, HERO_MOBILE_MEDIA)]
+    preload += [(m['img_card'], None, CARD_IMAGE_SIZES) for m in museums[:PRELOAD_CARD_IMAGES]]
+    return preload
+
+
+# ===================================================================================
+# УСЛОВНЫЕ ОТВЕТЫ (ETag / Last-Modified для страниц с материалами)
+# ===================================================================================
+
+def _templates_digest():
+    """Хэш всех шаблонов: новая версия шаблонов - новые ETag"""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(app.template_folder)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + f.read())
+    return digest.hexdigest()[:16]
+
+
+TEMPLATES_DIGEST = _templates_digest()
+
+
+def _as_utc(value):
+    """TIMESTAMP из MySQL (время сервера без зоны) -> UTC с точностью до секунды"""
+    return value.astimezone(timezone.utc).replace(microsecond=0) if value else None
+
+
+def conditional_content(validator, categories=()):
+    """ETag и Last-Modified по версиям записей data_content.
+
+    validator(**view_args) возвращает список строк с версиями (из
+    get_content_revision / get_category_revision) или None, если
+    записи нет - тогда страница отдаётся как обычно (например, 404).
+    Если клиент прислал совпадающий If-None-Match (или не старше
+    If-Modified-Since), ответ 304 уходит сразу: без выборки полных
+    строк и без рендера шаблона.
+
+    Анонимным посетителям страница отдаётся из pagecache по тому же
+    ETag; categories - списки data_content на странице без id в адресе,
+    их правка удаляет копию из кэша.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # В отладке шаблоны меняются без перезапуска, хэш шаблонов устаревает
+            revisions = None if app.debug else validator(**kwargs)
+            if not revisions or None in revisions:
+                return view(*args, **kwargs)
+
+            parts = [request.endpoint, sorted(kwargs.items()), TEMPLATES_DIGEST, assets.build_id(), images.variants_stamp()]
+            parts += [sorted(row.items()) for row in revisions]
+            etag = hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:32]
+            modified = [row['updated_at'] for row in revisions if row.get('updated_at')]
+            last_modified = _as_utc(max(modified)) if modified else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since)
+
+            def render():
+                # Link с предзагрузкой попадает в сохранённую копию страницы
+                return add_preload_links(app.make_response(view(*args, **kwargs)))
+
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                if pagecache.applies():
+                    response = pagecache.serve(etag, pagecache.page_tags(kwargs, categories), render)
+                else:
+                    response = render()
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Кэшировать можно, но перед показом - свериться с сервером
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+HOMEPAGE_CATEGORIES = ('museums', 'virtual_exhibitions', 'poster', 'hero_section')
+
+
+def _homepage_revisions():
+    return [db.get_category_revision(c) for c in HOMEPAGE_CATEGORIES]
+
+
+def _museums_revisions():
+    return [db.get_category_revision('museums')]
+
+
+def _static_revisions():
+    """Страница без материалов из БД: версия - только шаблоны и статика"""
+    return [{}]
+
+
+def _about_us_revisions(museum_id=None):
+    if museum_id is None:
+        return [db.get_category_revision('museums')]
+    return [db.get_content_revision(museum_id)]
+
+
+def _exhibition_revisions(exhibition_id):
+    return [db.get_content_revision(exhibition_id)]
+
+
+def _poster_revisions(poster_id):
+    return [db.get_content_revision(poster_id)]
 
 
 # ===================================================================================
@@ -41,6 +318,7 @@ except Exception as e:
 # ===================================================================================
 
 @app.route('/')
+@conditional_content(_homepage_revisions, HOMEPAGE_CATEGORIES)
 def homepage():
     """Главная страница с карточками из БД"""
     museums = db.get_content_by_category('museums') or []
@@ -48,6 +326,8 @@ def homepage():
     posters = db.get_content_by_category('poster') or []
     hero_images = db.get_content_by_category('hero_section') or []
 
+    preload_images('homepage', (hero_images, museums), _homepage_preload)
+
     return render_template('homepage.html',
                            museums=museums,
                            virtual_exhibitions=virtual_exhibitions,
@@ -57,6 +337,7 @@ def homepage():
 
 @app.route('/about-us')
 @app.route('/about-us/<int:museum_id>')
+@conditional_content(_about_us_revisions, ('museums',))
 def about_us(museum_id=None):
     if museum_id is None:
         museums = db.get_content_by_category('museums')
@@ -66,6 +347,9 @@ def about_us(museum_id=None):
         if not museum:
             abort(404)
 
+    if museum:
+        preload_images(('about_us', museum['id']), (museum,), lambda m: [(m['main_image'], None, DETAIL_IMAGE_SIZES)])
+
     return render_template('about_us.html', museum=museum)
 
 
@@ -82,23 +366,38 @@ def order(museum_id=None):
             abort(404)
 
     today = datetime.now().date()
-    week_later = today + timedelta(days=7)
 
     event_id = museum['id'] if museum else 1
-    sessions = db.get_active_sessions(event_id, today, week_later) or []
-    
-    event_category = museum['category'] if museum else 'museums'
+    # Снимок мест из микрокэша; дальше страница обновляет их через /api/sessions/<id>/stream
+    seats = availability.get_availability(event_id, *availability.default_window(today))
+    if seats is None:
+        seats = {'event_id': event_id, 'sessions': []}
+    calendar_days = _calendar_days(seats['sessions'])
+
     ticket_cat_type = 'museum'
     
     ticket_categories = db.get_ticket_categories_by_type(ticket_cat_type) or []
 
     return render_template('order.html',
                            museum=museum,
-                           sessions=sessions,
+                           seats=seats,
+                           calendar_days=calendar_days,
                            ticket_categories=ticket_categories,
                            today=today)
 
 
+WEEKDAYS = ('ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ', 'ВС')
+
+
+def _calendar_days(sessions, limit=7):
+    """Даты календаря страницы заказа (первые limit дней, где есть сеансы)"""
+    days = []
+    for iso_date in sorted({s['date'] for s in sessions})[:limit]:
+        day = datetime.strptime(iso_date, '%Y-%m-%d').date()
+        days.append({'date': day, 'day_of_week': WEEKDAYS[day.weekday()], 'weekend': day.weekday() >= 5})
+    return days
+
+
 @app.route('/create-order', methods=['POST'])
 def create_order():
     """Создание заказа"""
@@ -129,61 +428,61 @@ def create_order():
         if len(full_name.strip().split()) < 2:
             return jsonify({'success': False, 'error': 'Введите Фамилию и Имя полностью'})
 
-        if not tickets_data or sum(tickets_data.values()) == 0:
+        # Цены и допустимость Пушкинской карты - из снимка в памяти, без запросов к БД
+        try:
+            cart = pricing.quote(tickets_data, payment_method=payment_method)
+        except pricing.QuoteError as err:
+            return jsonify({'success': False, 'error': str(err)})
+        if not cart['total_tickets']:
             return jsonify({'success': False, 'error': 'Выберите хотя бы один билет'})
 
-        session_obj = db.get_session_by_date_time(museum_id, session_date, session_time)
-        if not session_obj:
-            return jsonify({'success': False, 'error': 'Сеанс не найден'})
-
-        total_tickets = sum(int(qty) for qty in tickets_data.values())
-        if session_obj['available_tickets'] < total_tickets:
-            return jsonify({'success': False, 'error': 'Недостаточно доступных билетов'})
-
-        total_amount = 0
-        first_category_id = None
-
-        for category_id, quantity in tickets_data.items():
-            if int(quantity) > 0:
-
-                if first_category_id is None:
-                    first_category_id = int(category_id)
-
-                category = db.get_ticket_category_by_id(int(category_id))
-                if category:
-                    total_amount += float(category['price']) * int(quantity)
-
-        booking_code = secrets.token_hex(8).upper()
-        booking_id = db.create_booking(
-            session_id=session_obj['id'],
-            ticket_category_id=first_category_id,
-            user_email=email,
-            user_phone=phone,
-            quantity=total_tickets,
-            total_price=total_amount,
-            payment_method=payment_method,
-            booking_code=booking_code
-        )
+        total_tickets = cart['total_tickets']
+        total_amount = cart['total_amount']
+        first_category_id = cart['lines'][0]['category_id']
 
+        # Места, бронь и заказ - одна транзакция на одном соединении: один COMMIT,
+        # а при любой ошибке откатывается всё, и места возвращаются сами
         order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{secrets.token_hex(4).upper()}"
-        qr_token = secrets.token_urlsafe(32)
-
-        order_id = db.create_order(
-            full_name=full_name,
-            email=email,
-            phone=phone,
-            country_code=country_code,
-            booking_id=booking_id,
-            order_number=order_number,
-            qr_code_token=qr_token,
-            total_amount=total_amount
-        )
-
-        new_available = session_obj['available_tickets'] - total_tickets
-        current_sold = session_obj.get('sold_tickets', 0)
-        new_sold = current_sold + total_tickets
-
-        db.update_session_tickets(session_obj['id'], new_available, new_sold)
+        try:
+            with db.transaction() as tx:
+                # Места списываются атомарно: без гонки между чтением и записью остатка
+                status, session_id = db.reserve_seats(museum_id, session_date, session_time, total_tickets)
+                if status != db.RESERVE_OK:
+                    tx.rollback()
+                    if status == db.RESERVE_NOT_FOUND:
+                        return jsonify({'success': False, 'error': 'Сеанс не найден'})
+                    if status == db.RESERVE_SOLD_OUT:
+                        return jsonify({'success': False, 'error': 'Недостаточно доступных билетов'})
+                    return jsonify({'success': False, 'error': 'Не удалось забронировать места, попробуйте ещё раз'})
+
+                booking_id = db.create_booking(
+                    session_id=session_id,
+                    ticket_category_id=first_category_id,
+                    user_email=email,
+                    user_phone=phone,
+                    quantity=total_tickets,
+                    total_price=total_amount,
+                    payment_method=payment_method,
+                    booking_code=secrets.token_hex(8).upper()
+                )
+                order_id = booking_id and db.create_order(
+                    full_name=full_name,
+                    email=email,
+                    phone=phone,
+                    country_code=country_code,
+                    booking_id=booking_id,
+                    order_number=order_number,
+                    qr_code_token=secrets.token_urlsafe(32),
+                    total_amount=total_amount
+                )
+                if not order_id:
+                    tx.rollback()
+        except db.TransactionError:
+            order_id = None
+
+        if not order_id:
+            return jsonify({'success': False, 'error': 'Не удалось создать заказ, попробуйте ещё раз'})
+        availability.invalidate(int(museum_id))
 
         return jsonify({
             'success': True,
@@ -207,6 +506,9 @@ def payment(order_id):
         abort(404)
     if order_data.get('payment_status') == 'paid':
         return redirect(url_for('ticket', order_id=order_id))
+    if order_data.get('order_status') == 'cancelled':
+        # Бронь истекла, места уже вернулись в продажу
+        abort(410)
     return render_template('payment.html', order=order_data)
 
 
@@ -217,12 +519,46 @@ def process_payment(order_id):
     if not order_data:
         abort(404)
 
-    # Обновляем статус оплаты в БД
-    db.execute_query("UPDATE orders SET payment_status = 'paid' WHERE id = %s", (order_id,), fetch=False)
+    # Оплата, подтверждение брони и подписанный токен - одна транзакция
+    try:
+        with db.transaction() as tx:
+            # Оплачиваем только живой заказ: фоновая задача могла успеть его отменить
+            updated = db.execute_update("""
+                UPDATE orders SET payment_status = 'paid'
+                WHERE id = %s AND payment_status = 'unpaid' AND order_status <> 'cancelled'
+            """, (order_id,))
+            paid_now = bool(updated and updated[0])
+            if paid_now and order_data.get('booking_id'):
+                db.execute_update("UPDATE ticket_bookings SET booking_status = 'confirmed' WHERE id = %s",
+                                  (order_data['booking_id'],))
+                try:
+                    with tx.savepoint():
+                        issue_ticket_token(order_id)
+                except db.TransactionError:
+                    # Заказ всё равно оплачен: остаётся случайный токен, QR проверяется по БД
+                    pass
+    except db.TransactionError:
+        abort(503)
+
+    if not paid_now:
+        order_data = db.get_order_by_id(order_id)
+        if not order_data or order_data.get('payment_status') != 'paid':
+            abort(410)
 
     return redirect(url_for('ticket', order_id=order_id))
 
 
+def issue_ticket_token(order_id):
+    """Заменить случайный токен оплаченного заказа подписанным (см. tickets.py)"""
+    order_ticket = db.get_order_ticket(order_id)
+    if not order_ticket:
+        return None
+    token = tickets.mint(order_id, order_ticket['session_id'], order_ticket['session_date'])
+    if db.set_order_qr_token(order_id, token) is None:
+        return None
+    return token
+
+
 @app.route('/ticket/<int:order_id>')
 def ticket(order_id):
     """Страница с билетом и QR-кодом после успешной оплаты"""
@@ -232,46 +568,124 @@ def ticket(order_id):
     if order_data.get('payment_status') != 'paid':
         return redirect(url_for('payment', order_id=order_id))
 
-    # Формируем URL для QR-кода на основе токена
-    qr_data = request.host_url.rstrip('/') + url_for('verify_qr', token=order_data.get('qr_code_token'))
-    # Используем публичный API для генерации картинки QR
-    qr_image_url = f"https://api.qrserver.com/v1/create-qr-code/?size=250x250&data={qr_data}"
+    # Картинку QR рисует само приложение, см. qr_image
+    token = order_data.get('qr_code_token')
+    return render_template('ticket.html', order=order_data,
+                           qr_image_url=url_for('qr_image', token=token, fmt='png'),
+                           qr_svg_url=url_for('qr_image', token=token, fmt='svg'))
+
+
+@app.route('/qr-image/<token>', defaults={'fmt': 'png'})
+@app.route('/qr-image/<token>.<any(png, svg):fmt>')
+def qr_image(token, fmt):
+    """QR-код билета (PNG или SVG): рисуется один раз, дальше отдаётся из кэша"""
+    qr_data = request.host_url.rstrip('/') + url_for('verify_qr', token=token)
+    key, body = qrcodes.get_cached(qr_data, fmt)
+    if body is None:
+        # Рисуем только для настоящих билетов, чтобы кэш нельзя было забить мусором
+        if tickets.is_signed(token):
+            if tickets.verify(token)[0] == tickets.INVALID:
+                abort(404)
+        elif not db.execute_query("SELECT id FROM orders WHERE qr_code_token = %s", (token,)):
+            abort(404)
+        key, body = qrcodes.get_or_render(qr_data, fmt)
+
+    response = app.response_class(body, mimetype=qrcodes.FORMATS[fmt])
+    response.set_etag(key)
+    # Картинка для токена никогда не меняется; private - это билет конкретного покупателя
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+
+# Ответ сканеру на один билет: текст и HTTP-статус по результату checkin
+CHECKIN_MESSAGES = {
+    checkin.OK: ("Билет действителен. Заказ №{order_id}", 200),
+    checkin.VALID: ("Билет действителен. Заказ №{order_id}. Проход отмечается сканером на входе", 200),
+    checkin.DUPLICATE: ("Билет уже использован. Заказ №{order_id}", 409),
+    checkin.DUPLICATE_IN_BATCH: ("Билет уже использован. Заказ №{order_id}", 409),
+    checkin.INVALID: ("Недействительный QR-код", 403),
+    checkin.NOT_YET_VALID: ("Билет ещё не действует: сеанс в другой день", 403),
+    checkin.EXPIRED: ("Срок действия билета истёк", 403),
+    checkin.CANCELLED: ("Заказ отменён", 403),
+    checkin.UNPAID: ("Заказ не оплачен", 403),
+    checkin.ERROR: ("Не удалось проверить билет, попробуйте ещё раз", 503),
+}
+
+# Ключ для сканеров на входе (заголовок X-Checkin-Key); без него /api/checkin - только из админки
+CHECKIN_KEY = os.environ.get('MGORKI_CHECKIN_KEY')
+
 
-    return render_template('ticket.html', order=order_data, qr_image_url=qr_image_url)
+def scanner_authorized():
+    """Запрос от сканера на входе (X-Checkin-Key) или из сессии админки"""
+    key = request.headers.get('X-Checkin-Key', '')
+    return bool(session.get('logged_in') or (CHECKIN_KEY and secrets.compare_digest(key, CHECKIN_KEY)))
 
 
 @app.route('/qr/<token>')
 def verify_qr(token):
-    """Маршрут для проверки QR-кода (заглушка)"""
-    order_data = db.execute_query("SELECT * FROM orders WHERE qr_code_token = %s", (token,))
-    if not order_data:
-        return "Недействительный QR-код"
-    return f"Билет действителен. Заказ: {order_data[0]['order_number']}"
+    """Проверка одного билета (та же логика, что у /api/checkin).
+
+    Проход отмечается только для сканера или админа; остальным (покупатель
+    навёл камеру на свой билет, превью ссылки в почте) - лишь ответ,
+    действителен ли билет.
+    """
+    if not scanner_authorized():
+        result = checkin.peek(token)
+    else:
+        result = checkin.check_in([token])[0]
+    message, status_code = CHECKIN_MESSAGES[result['status']]
+    return message.format(order_id=result['order_id']), status_code
+
+
+@app.route('/api/checkin', methods=['POST'])
+def api_checkin():
+    """Пачка сканов: {"tokens": [...]} -> результат по каждому токену в том же порядке"""
+    if not scanner_authorized():
+        return jsonify({'success': False, 'error': 'Нужна авторизация сканера'}), 401
+
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens')
+    if not isinstance(tokens, list) or not tokens:
+        return jsonify({'success': False, 'error': 'Передайте список tokens'}), 400
+    if len(tokens) > checkin.CHECKIN_CONFIG['max_batch']:
+        return jsonify({'success': False,
+                        'error': f"Не больше {checkin.CHECKIN_CONFIG['max_batch']} токенов за раз"}), 400
+
+    results = checkin.check_in(tokens)
+    return jsonify({'success': True,
+                    'accepted': sum(r['status'] == checkin.OK for r in results),
+                    'results': results})
 
 
 @app.route('/museum_programs/<int:exhibition_id>')
+@conditional_content(_exhibition_revisions)
 def museum_programs(exhibition_id):
     exhibition = db.get_content_by_id(exhibition_id)
     if not exhibition:
         abort(404)
+    preload_images(('museum_programs', exhibition_id), (exhibition,), lambda e: [(e['img_card'], None, DETAIL_IMAGE_SIZES)])
     return render_template('museum_programs.html', exhibition=exhibition)
 
 
 @app.route('/poster')
+@conditional_content(_museums_revisions, ('museums',))
 def poster():
     museums = db.get_content_by_category('museums') or []
     return render_template('poster.html', museums=museums)
 
 
 @app.route('/poster_detail/<int:poster_id>')
+@conditional_content(_poster_revisions)
 def poster_detail(poster_id):
     poster_obj = db.get_content_by_id(poster_id)
     if not poster_obj:
         abort(404)
+    preload_images(('poster_detail', poster_id), (poster_obj,), lambda p: [(p['img_card'], None, DETAIL_IMAGE_SIZES)])
     return render_template('poster_detail.html', poster=poster_obj)
 
 
 @app.route('/about_the_museum')
+@conditional_content(_static_revisions)
 def about_the_museum():
     return render_template('about_the_museum.html')
 
@@ -279,13 +693,13 @@ def about_the_museum():
 @app.route('/api/search')
 def api_search():
     q = request.args.get('q', '')
-    if not q or len(q) < 2:
+    if not q or len(q.strip()) < 2:
         return jsonify([])
-    
-    results = db.search_content(q)
+
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
     formatted = []
-    
-    for r in (results or []):
+
+    for r in search.search(q, limit):
         url = '#'
         if r['category'] == 'museums':
             url = url_for('about_us', museum_id=r['id'])
@@ -293,24 +707,66 @@ def api_search():
             url = url_for('museum_programs', exhibition_id=r['id'])
         elif r['category'] == 'poster':
             url = url_for('poster_detail', poster_id=r['id'])
-            
-        desc = r['short_description_card'] or ''
-        # Очищаем от HTML тегов если есть
-        import re
-        desc = re.sub(r'<[^>]+>', '', desc)
-        if len(desc) > 100:
-            desc = desc[:100] + '...'
-            
+
         formatted.append({
-            'title': r['title_card'],
-            'desc': desc,
+            'title': r['title'],
+            'desc': r['desc'],
             'url': url,
             'image': url_for('static', filename=r['img_card']) if r['img_card'] else ''
         })
-        
+
     return jsonify(formatted)
 
 
+@app.route('/api/quote', methods=['POST'])
+def api_quote():
+    """Стоимость корзины: {"tickets": {category_id: quantity}, "payment_method": ...}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        cart = pricing.quote(data.get('tickets', {}), payment_method=data.get('payment_method'))
+    except pricing.QuoteError as err:
+        return jsonify({'success': False, 'error': str(err)}), 400
+    return jsonify(dict(pricing.quote_to_json(cart), success=True))
+
+
+@app.route('/api/sessions/<int:event_id>')
+def api_sessions(event_id):
+    """Свободные места события: ?from=YYYY-MM-DD&to=YYYY-MM-DD (по умолчанию - неделя)"""
+    date_from, date_to = availability.default_window()
+    if request.args.get('from') or request.args.get('to'):
+        date_from = _parse_date_arg('from')
+        date_to = _parse_date_arg('to')
+        if (not date_from or not date_to or date_to < date_from
+                or (date_to - date_from).days > availability.AVAILABILITY_CONFIG['max_window_days']):
+            return jsonify({'success': False, 'error': 'Некорректный диапазон дат'}), 400
+
+    seats = availability.get_availability(event_id, date_from, date_to)
+    if seats is None:
+        return jsonify({'success': False, 'error': 'Не удалось получить сеансы'}), 503
+    response = jsonify(seats)
+    response.headers['Cache-Control'] = f"public, max-age={int(availability.AVAILABILITY_CONFIG['ttl'])}"
+    return response
+
+
+@app.route('/api/sessions/<int:event_id>/stream')
+def api_sessions_stream(event_id):
+    """Server-Sent Events: снимок мест, затем только изменения available_tickets"""
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if request.method == 'HEAD':
+        # Тела у HEAD нет - подписка не нужна
+        return Response(mimetype='text/event-stream', headers=headers)
+    subscription = availability.stream.subscribe(event_id)
+    if subscription is None:
+        response = jsonify({'success': False, 'error': 'Слишком много подключений'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    response = Response(availability.stream.events(event_id, subscription),
+                        mimetype='text/event-stream', headers=headers)
+    response.call_on_close(lambda: availability.stream.unsubscribe(event_id, subscription))
+    return response
+
+
 # ===================================================================================
 # АДМИН ПАНЕЛЬ
 # ===================================================================================
@@ -349,22 +805,51 @@ def logout():
     return redirect(url_for('login'))
 
 
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Метрики процесса в формате Prometheus (админ или токен сборщика)"""
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and secrets.compare_digest(auth, f'Bearer {METRICS_TOKEN}')
+    if not session.get('logged_in') and not token_ok:
+        abort(401)
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/admin/slow-queries')
+@login_required
+def admin_slow_queries():
+    """Запросы к БД по отпечаткам: время, строки, медленные примеры и EXPLAIN"""
+    return render_template('admin/slow_queries.html', log=slowlog.get_slow_queries(),
+                           fmt_time=lambda ts: datetime.fromtimestamp(ts).strftime('%d.%m %H:%M:%S'))
+
+
+@app.route('/admin/slow-queries.json')
+@login_required
+def admin_slow_queries_json():
+    return jsonify(slowlog.get_slow_queries())
+
+
+@app.route('/admin/slow-queries/reset', methods=['POST'])
+@login_required
+def admin_slow_queries_reset():
+    slowlog.slow_log.reset()
+    flash('Статистика запросов сброшена')
+    return redirect(url_for('admin_slow_queries'))
+
+
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    # Статистика для дашборда
-    orders = db.get_all_orders() or []
-    count_museums = len(db.get_content_by_category('museums') or [])
-    count_orders = len(orders)
-    recent_orders = orders[:5]
+    # Статистика для дашборда: счётчики вместо выборки всех заказов
+    museums = db.get_content_by_category('museums') or []
 
     return render_template('admin/content_list.html',
                            title_page="Дашборд (Музеи)",
-                           items=db.get_content_by_category('museums'),
+                           items=museums,
                            category='museums',
-                           count_museums=count_museums,
-                           count_orders=count_orders,
-                           recent_orders=recent_orders)
+                           count_museums=len(museums),
+                           order_stats=db.get_order_stats(),
+                           recent_orders=db.get_recent_orders(5) or [])
 
 
 @app.route('/admin/content/<category>')
@@ -424,8 +909,11 @@ def admin_edit(category, content_id):
                 filename = secure_filename(file_obj.filename)
                 new_path = f"images/{subfolder}/{filename}"
                 file_obj.save(os.path.join(save_dir, filename))
-                
+                # Уменьшенные копии для srcset (WebP + JPEG/PNG)
+                images.process(new_path)
+
                 if current_path and current_path != new_path:
+                    images.remove_variants(current_path)
                     old_file_path = os.path.join(static_dir, current_path)
                     if os.path.exists(old_file_path):
                         try:
@@ -467,6 +955,7 @@ def admin_delete(item_id):
         img_fields = ['img_card', 'main_image', 'block_image_1', 'block_image_2', 'block_image_3']
         for field in img_fields:
             if item.get(field):
+                images.remove_variants(item[field])
                 file_path = os.path.join(static_dir, item[field])
                 if os.path.exists(file_path):
                     try:
@@ -481,8 +970,38 @@ def admin_delete(item_id):
 @app.route('/admin/orders')
 @login_required
 def admin_orders():
-    orders = db.get_all_orders()
-    return render_template('admin/orders_list.html', orders=orders)
+    filters = _admin_orders_filters()
+    orders, next_cursor = db.get_orders_page(before_id=request.args.get('before', type=int), **filters)
+    return render_template('admin/orders_list.html',
+                           orders=orders or [],
+                           filters=filters,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('before'),
+                           order_stats=db.get_order_stats())
+
+
+ORDER_STATUS_FILTERS = ('new', 'awaiting_payment', 'paid', 'completed', 'cancelled')
+PAYMENT_STATUS_FILTERS = ('unpaid', 'paid', 'refunded')
+
+
+def _parse_date_arg(name):
+    value = request.args.get(name, '')
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def _admin_orders_filters():
+    """Фильтры списка заказов из строки запроса (неизвестные значения игнорируются)"""
+    order_status = request.args.get('status')
+    payment_status = request.args.get('payment')
+    return {
+        'order_status': order_status if order_status in ORDER_STATUS_FILTERS else None,
+        'payment_status': payment_status if payment_status in PAYMENT_STATUS_FILTERS else None,
+        'date_from': _parse_date_arg('date_from'),
+        'date_to': _parse_date_arg('date_to')
+    }
 
 
 @app.route('/admin/orders/update_status/<int:order_id>', methods=['POST'])
@@ -492,7 +1011,7 @@ def admin_update_order_status(order_id):
     if new_status:
         db.update_order_status(order_id, new_status)
         flash(f'Статус заказа #{order_id} успешно обновлен.')
-    return redirect(url_for('admin_orders'))
+    return redirect(request.referrer or url_for('admin_orders'))
 
 
 # --- КАТЕГОРИИ БИЛЕТОВ ---
@@ -540,8 +1059,39 @@ def admin_ticket_categories_delete(cat_id):
 @app.route('/admin/sessions')
 @login_required
 def admin_sessions():
-    sessions = db.get_all_sessions_with_events()
-    return render_template('admin/sessions_list.html', sessions=sessions)
+    filters = _admin_sessions_filters()
+    sessions, next_cursor = db.get_sessions_page(after=request.args.get('after'), **filters)
+    all_events = ((db.get_content_by_category('museums') or [])
+                  + (db.get_content_by_category('virtual_exhibitions') or [])
+                  + (db.get_content_by_category('poster') or []))
+    return render_template('admin/sessions_list.html',
+                           sessions=sessions or [],
+                           filters=filters,
+                           all_events=all_events,
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('after'))
+
+
+@app.route('/admin/sessions/count')
+@login_required
+def admin_sessions_count():
+    """Число сеансов под теми же фильтрами, что и список (JSON)"""
+    total = db.count_sessions(**_admin_sessions_filters())
+    if total is None:
+        return jsonify({'success': False, 'error': 'Ошибка БД'}), 500
+    return jsonify({'success': True, 'total': total})
+
+
+def _admin_sessions_filters():
+    """Фильтры расписания из строки запроса: даты, событие, активность"""
+    active = request.args.get('active')
+    return {
+        'date_from': _parse_date_arg('date_from'),
+        'date_to': _parse_date_arg('date_to'),
+        'event_id': request.args.get('event_id', type=int),
+        'is_active': {'1': True, '0': False}.get(active)
+    }
+
 
 @app.route('/admin/sessions/edit/<int:session_id>', methods=['GET', 'POST'])
 @login_required
@@ -578,7 +1128,7 @@ def admin_sessions_edit(session_id):
 def admin_sessions_delete(session_id):
     db.delete_session(session_id)
     flash('Сеанс удален.')
-    return redirect(url_for('admin_sessions'))
+    return redirect(request.referrer or url_for('admin_sessions'))
 
 
 @app.errorhandler(404)
@@ -597,5 +1147,84 @@ def bad_gateway(e):
 def gateway_timeout(e):
     return render_template('504.html'), 504
 
+
+# ===================================================================================
+# КОМАНДЫ CLI
+# ===================================================================================
+
+@app.cli.command('generate-schedule')
+@click.option('--days', type=int, default=None, help='На сколько дней вперёд (по умолчанию из SCHEDULE_CONFIG)')
+@click.option('--times', default=None, help='Время сеансов через запятую, например 10:00,14:00,18:00')
+def generate_schedule_command(days, times):
+    """Достроить расписание сеансов (запускать при деплое или по cron раз в сутки)"""
+    slot_times = [t.strip() for t in times.split(',') if t.strip()] if times else None
+    stats = db.generate_weekly_schedule(horizon_days=days, slot_times=slot_times)
+    if stats is None:
+        raise click.ClickException('Не удалось сгенерировать расписание')
+
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Выполнить все задачи один раз и выйти')
+def run_jobs_command(once):
+    """Фоновые задачи отдельным процессом (вместо потока в веб-воркерах)"""
+    if once:
+        for name, result in jobs.runner.run_all().items():
+            click.echo(f"{name}: {result}")
+        jobs.runner.leader.release_all()
+        return
+    try:
+        jobs.runner.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@app.cli.command('db-migrate')
+@click.option('--status', 'show_status', is_flag=True, help='Показать применённые и новые миграции')
+def db_migrate_command(show_status):
+    """Применить новые миграции схемы (идемпотентно)"""
+    if show_status:
+        rows = migrations.status()
+        if rows is None:
+            raise click.ClickException('Не удалось прочитать schema_migrations')
+        for version, name, applied in rows:
+            click.echo(f"{'✔' if applied else ' '} {version:>3}  {name}")
+        return
+    done = migrations.migrate(log=click.echo)
+    if done is None:
+        raise click.ClickException('Миграции не применены')
+    click.echo(f"Применено миграций: {len(done)}")
+
+
+@app.cli.command('db-explain')
+def db_explain_command():
+    """EXPLAIN горячих запросов: ошибка, если есть полный проход без индекса"""
+    errors = explain_check.check(log=click.echo)
+    if errors:
+        for error in errors:
+            click.echo(error, err=True)
+        raise click.ClickException(f'Запросов с полным проходом: {len(errors)}')
+    click.echo('Полных проходов по таблицам без индекса нет')
+
+
+@app.cli.command('backfill-images')
+@click.option('--force', is_flag=True, help='Перерисовать копии, даже если они уже есть')
+def backfill_images_command(force):
+    """Нарезать копии для srcset для всех картинок из data_content"""
+    columns = ', '.join(images.IMAGE_COLUMNS)
+    rows = db.execute_query(f"SELECT {columns} FROM data_content")
+    if rows is None:
+        raise click.ClickException('Не удалось прочитать data_content')
+    paths = [row[column] for row in rows for column in images.IMAGE_COLUMNS]
+    processed = images.backfill(paths, force=force, log=click.echo)
+    click.echo(f"Обработано картинок: {processed}")
+
+
+@app.cli.command('build-assets')
+@click.option('--clean', is_flag=True, help='Удалить файлы прошлых сборок')
+def build_assets_command(clean):
+    """Собрать статику с хэшами в именах и сжатыми копиями (static/dist)"""
+    assets.build(clean=clean, log=click.echo)
+
+
 if __name__ == '__main__':
     app.run(debug=True)
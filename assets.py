@@ -0,0 +1,210 @@
+"""
+Статика с хэшем содержимого в имени и заранее сжатыми копиями.
+
+Сборка (при деплое) копирует файлы из ASSET_CONFIG['dirs'] в static/dist
+под именами вида styles/homepage.<хэш>.css, переписывает url(...) внутри
+CSS на такие же имена, кладёт рядом .gz и .br и пишет manifest.json:
+{"styles/homepage.css": "dist/styles/homepage.<хэш>.css", ...}.
+
+В приложении url_for('static', filename='styles/homepage.css') сам
+подставляет имя из манифеста, а ответы на dist/... идут с
+Cache-Control: immutable и сжатой копией по Accept-Encoding.
+Нет манифеста - всё работает как раньше, с исходными файлами.
+
+    flask --app app build-assets          # --clean - удалить файлы прошлых сборок
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+ASSET_CONFIG = {
+    'static_dir': os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static'),
+    'dist_dir': 'dist',
+    'dirs': ['styles', 'js', 'font', 'images/icon', 'images/logo', 'images/hero', 'images/history'],
+    'compress': ('.css', '.js', '.svg', '.otf', '.ttf', '.json', '.txt'),
+    'min_compress_size': 512
+}
+
+# Файлы с хэшем в имени не меняются никогда
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Копии картинок из images.py тоже названы по содержимому
+IMMUTABLE_PREFIXES = ('dist/', 'images/variants/')
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+_manifest = {}
+_build_id = None
+_encoded = {}         # (путь, кодировка) -> есть ли сжатая копия
+_lock = threading.Lock()
+
+
+# ===================================================================================
+# СБОРКА
+# ===================================================================================
+
+def _static_path(path):
+    return os.path.join(ASSET_CONFIG['static_dir'], path)
+
+
+def _hashed_name(path, content):
+    stem, ext = os.path.splitext(path)
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return f"{ASSET_CONFIG['dist_dir']}/{stem}.{digest}{ext}"
+
+
+def _rewrite_css(path, content, manifest):
+    """url(../font/x.otf) -> относительная ссылка на хэшированную копию"""
+    source_dir = os.path.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^(data:|https?:|//|#|/)', url):
+            return match.group(0)
+        clean_url = url.split('?')[0].split('#')[0]
+        suffix = url[len(clean_url):]
+        target = os.path.normpath(os.path.join(source_dir, clean_url)).replace(os.sep, '/')
+        # Сам CSS переедет в dist/<path>, поэтому ссылку считаем от нового места
+        new_target = manifest.get(target, target)
+        new_dir = f"{ASSET_CONFIG['dist_dir']}/{source_dir}"
+        relative = os.path.relpath(new_target, new_dir).replace(os.sep, '/')
+        return f"url({quote}{relative}{suffix}{quote})"
+
+    text = content.decode('utf-8')
+    return _CSS_URL.sub(replace, text).encode('utf-8')
+
+
+def _write(path, content):
+    target = _static_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, target)
+
+
+def _compress(path, content):
+    """Сжатые копии рядом с файлом; пишутся, только если они меньше оригинала"""
+    written = []
+    if (not path.endswith(ASSET_CONFIG['compress'])
+            or len(content) < ASSET_CONFIG['min_compress_size']):
+        return written
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gz) < len(content):
+        _write(path + '.gz', gz)
+        written.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        return written
+    br = brotli.compress(content, quality=11)
+    if len(br) < len(content):
+        _write(path + '.br', br)
+        written.append('br')
+    return written
+
+
+def _collect_sources():
+    sources = []
+    for directory in ASSET_CONFIG['dirs']:
+        for root, _, files in os.walk(_static_path(directory)):
+            for name in files:
+                full_path = os.path.join(root, name)
+                sources.append(os.path.relpath(full_path, ASSET_CONFIG['static_dir']).replace(os.sep, '/'))
+    # CSS - последними: к этому моменту известны хэши шрифтов и картинок
+    return sorted(sources, key=lambda p: (p.endswith('.css'), p))
+
+
+def build(clean=False, log=print):
+    """Собрать dist и manifest.json. Возвращает манифест"""
+    manifest = {}
+    stats = {'files': 0, 'bytes': 0, 'gzip': 0, 'br': 0}
+    for path in _collect_sources():
+        with open(_static_path(path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = _rewrite_css(path, content, manifest)
+        hashed = _hashed_name(path, content)
+        if not os.path.exists(_static_path(hashed)):
+            _write(hashed, content)
+        for encoding in _compress(hashed, content):
+            stats[encoding] += 1
+        manifest[path] = hashed
+        stats['files'] += 1
+        stats['bytes'] += len(content)
+
+    _write(f"{ASSET_CONFIG['dist_dir']}/manifest.json",
+           json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8'))
+    log(f"Файлов: {stats['files']} ({stats['bytes'] // 1024} КБ), gzip: {stats['gzip']}, br: {stats['br']}")
+
+    if clean:
+        keep = set(manifest.values())
+        removed = 0
+        for root, _, files in os.walk(_static_path(ASSET_CONFIG['dist_dir'])):
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), ASSET_CONFIG['static_dir']).replace(os.sep, '/')
+                base = rel[:-3] if rel.endswith(('.gz', '.br')) else rel
+                if base not in keep and not rel.endswith('manifest.json'):
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        log(f"Удалено файлов прошлых сборок: {removed}")
+
+    load_manifest()
+    return manifest
+
+
+# ===================================================================================
+# ВО ВРЕМЯ РАБОТЫ
+# ===================================================================================
+
+def load_manifest():
+    """Прочитать manifest.json (нет файла - пустой манифест)"""
+    global _manifest, _build_id
+    try:
+        with open(_static_path(f"{ASSET_CONFIG['dist_dir']}/manifest.json"), 'rb') as f:
+            raw = f.read()
+        manifest = json.loads(raw)
+        build_id = hashlib.sha256(raw).hexdigest()[:10]
+    except (OSError, ValueError):
+        manifest, build_id = {}, None
+    with _lock:
+        _manifest = manifest
+        _build_id = build_id
+        _encoded.clear()
+    return manifest
+
+
+def asset_path(filename):
+    """Путь хэшированной копии или исходный путь, если файла нет в манифесте"""
+    return _manifest.get(filename, filename)
+
+
+def build_id():
+    """Хэш текущего манифеста (меняется с каждой сборкой статики)"""
+    return _build_id
+
+
+def is_immutable(filename):
+    return filename.startswith(IMMUTABLE_PREFIXES)
+
+
+def encoded_variant(filename, accept_encoding):
+    """(файл .br/.gz, кодировка) лучшей сжатой копии, которую примет клиент, или (None, None)"""
+    if not filename.startswith(ASSET_CONFIG['dist_dir'] + '/'):
+        return None, None
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding not in accepted:
+            continue
+        key = (filename, encoding)
+        exists = _encoded.get(key)
+        if exists is None:
+            exists = os.path.isfile(_static_path(filename + suffix))
+            _encoded[key] = exists
+        if exists:
+            return filename + suffix, encoding
+    return None, None
@@ -0,0 +1,283 @@
+"""
+Свободные места на сеансах: JSON для страницы заказа и живые обновления.
+
+Снимок мест события за окно дат живёт в памяти процесса ttl секунд.
+Одновременные промахи по одному ключу не идут в БД каждый: запрос
+выполняет первый, остальные ждут его результат.
+
+Поток событий (Server-Sent Events) обслуживает один опрашивающий поток
+на процесс: раз в poll_interval он берёт снимок каждого события, на
+которое кто-то подписан (через тот же кэш), и рассылает подписчикам
+только изменившиеся available_tickets. Сколько бы страниц заказа ни
+было открыто, БД видит не больше одного запроса на событие за интервал.
+
+Каждое открытое соединение потока держит поток воркера, поэтому
+приложение с потоками событий нужно запускать с потоковыми (gthread)
+или gevent-воркерами. Число подписчиков на процесс ограничено
+max_subscribers; сверх него поток отвечает 503, и страница переходит
+на редкий опрос JSON.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import date, timedelta
+
+import database as db
+
+AVAILABILITY_CONFIG = {
+    'ttl': 2.0,                # сколько живёт снимок мест в памяти, сек
+    'window_days': 7,          # окно дат по умолчанию (как на странице заказа)
+    'max_window_days': 31,
+    'max_entries': 256,
+    'poll_interval': 2.0,      # как часто поток событий перечитывает места
+    'keepalive': 15,           # пустой комментарий, чтобы прокси не рвали соединение
+    'stream_max_age': 300,     # потом браузер сам переподключится (retry)
+    'retry_ms': 3000,
+    'max_subscribers': 1000,   # на процесс
+    'queue_size': 32
+}
+
+
+def _hhmm(value):
+    seconds = int(db._as_time(value).total_seconds())
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+def default_window(today=None):
+    today = today or date.today()
+    return today, today + timedelta(days=AVAILABILITY_CONFIG['window_days'])
+
+
+# ===================================================================================
+# МИКРОКЭШ
+# ===================================================================================
+
+class _Flight:
+    """Загрузка, которую ждут все одновременные промахи по ключу"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class MicroCache:
+    """Кэш на секунды с объединением одновременных промахов"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}    # ключ -> (истекает, значение)
+        self._flights = {}    # ключ -> _Flight
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+
+    def get_or_load(self, key, loader):
+        """Значение из кэша или loader(); None не кэшируется"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._stats['hits'] += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+                self._stats['misses'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not owner:
+            flight.done.wait()
+            return flight.value
+
+        value = None
+        try:
+            value = loader()
+        finally:
+            with self._lock:
+                if value is not None:
+                    self._prune()
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+                flight.value = value
+                del self._flights[key]
+            flight.done.set()
+        return value
+
+    def _prune(self):
+        if len(self._entries) < self.max_entries:
+            return
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        while len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+
+    def invalidate(self, match):
+        """Удалить ключи, для которых match(key) истинно"""
+        with self._lock:
+            for key in [k for k in self._entries if match(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['entries'] = len(self._entries)
+        return result
+
+
+_cache = MicroCache(AVAILABILITY_CONFIG['ttl'], AVAILABILITY_CONFIG['max_entries'])
+
+
+def _load(event_id, date_from, date_to):
+    rows = db.get_sessions_availability(event_id, date_from, date_to)
+    if rows is None:
+        return None
+    return {
+        'event_id': event_id,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'sessions': [{'id': row['id'],
+                      'date': row['session_date'].isoformat(),
+                      'time': _hhmm(row['session_time']),
+                      'available': row['available_tickets']} for row in rows]
+    }
+
+
+def get_availability(event_id, date_from=None, date_to=None):
+    """Снимок мест: {'event_id', 'from', 'to', 'sessions': [{id, date, time, available}]} или None"""
+    if date_from is None or date_to is None:
+        date_from, date_to = default_window()
+    return _cache.get_or_load((event_id, date_from, date_to),
+                              lambda: _load(event_id, date_from, date_to))
+
+
+def invalidate(event_id):
+    """Сбросить снимки события (после продажи или возврата мест в этом процессе)"""
+    _cache.invalidate(lambda key: key[0] == event_id)
+
+
+# ===================================================================================
+# ПОТОК СОБЫТИЙ
+# ===================================================================================
+
+class AvailabilityStream:
+    """Один опрашивающий поток на процесс и очереди подписчиков"""
+
+    def __init__(self, poll_interval=None, max_subscribers=None):
+        self.poll_interval = poll_interval or AVAILABILITY_CONFIG['poll_interval']
+        self.max_subscribers = max_subscribers or AVAILABILITY_CONFIG['max_subscribers']
+        self._subscribers = {}    # event_id -> set очередей
+        self._count = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'polls': 0, 'published': 0, 'dropped': 0, 'rejected': 0}
+
+    def subscribe(self, event_id):
+        """Очередь изменений события или None, если подписчиков уже слишком много"""
+        subscription = queue.Queue(AVAILABILITY_CONFIG['queue_size'])
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                return None
+            self._subscribers.setdefault(event_id, set()).add(subscription)
+            self._count += 1
+            # Поток не пережил fork или закончился, когда подписчиков не осталось
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._poll_forever, name='mgorki-availability',
+                                                daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, event_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(event_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[event_id]
+
+    def _publish(self, event_id, changes):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(changes)
+                self._stats['published'] += 1
+            except queue.Full:
+                # Клиент не читает: пропускаем, при переподключении он получит снимок
+                self._stats['dropped'] += 1
+
+    def _poll_forever(self):
+        last = {}    # event_id -> {session_id: available}
+        while True:
+            with self._lock:
+                event_ids = list(self._subscribers)
+                if not event_ids:
+                    self._thread = None
+                    return
+            for event_id in event_ids:
+                try:
+                    snapshot = get_availability(event_id)
+                except Exception as e:
+                    print(f"Ошибка опроса свободных мест: {e}")
+                    snapshot = None
+                if snapshot is None:
+                    continue
+                current = {s['id']: s['available'] for s in snapshot['sessions']}
+                previous = last.get(event_id)
+                if previous is not None:
+                    changes = {session_id: available for session_id, available in current.items()
+                               if previous.get(session_id) != available}
+                    # Сеанс сняли с продажи - мест больше нет
+                    changes.update({session_id: 0 for session_id in previous.keys() - current.keys()})
+                    if changes:
+                        self._publish(event_id, changes)
+                last[event_id] = current
+            for event_id in set(last) - set(event_ids):
+                del last[event_id]
+            self._stats['polls'] += 1
+            time.sleep(self.poll_interval)
+
+    def events(self, event_id, subscription):
+        """Тело ответа text/event-stream; отписывается, когда клиент ушёл.
+
+        Генератор, который так и не начали читать (клиент ушёл до первого
+        куска), finally не выполнит - поэтому маршрут ещё и вешает
+        unsubscribe на закрытие ответа (повторная отписка ничего не делает).
+        """
+        try:
+            yield f"retry: {AVAILABILITY_CONFIG['retry_ms']}\n\n"
+            # Снимок при (пере)подключении: изменения, пока клиента не было, не теряются
+            snapshot = get_availability(event_id)
+            if snapshot is not None:
+                yield f"event: snapshot\ndata: {json.dumps(snapshot, separators=(',', ':'))}\n\n"
+            deadline = time.monotonic() + AVAILABILITY_CONFIG['stream_max_age']
+            while time.monotonic() < deadline:
+                try:
+                    changes = subscription.get(timeout=AVAILABILITY_CONFIG['keepalive'])
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: availability\ndata: {json.dumps(changes, separators=(',', ':'))}\n\n"
+        finally:
+            self.unsubscribe(event_id, subscription)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['subscribers'] = self._count
+            result['events'] = {event_id: len(s) for event_id, s in self._subscribers.items()}
+            result['polling'] = self._thread is not None and self._thread.is_alive()
+        return result
+
+
+stream = AvailabilityStream()
+
+
+def get_availability_stats():
+    return {'cache': _cache.stats(), 'stream': stream.stats()}
@@ -0,0 +1,128 @@
+"""
+Нагрузочная проверка списания мест: сотни покупателей одновременно
+покупают билеты на один сеанс session_schedule.
+
+Запуск (нужна БД из db_museum.sql, настройки берутся из database.DB_CONFIG):
+
+    python benchmarks/bench_inventory.py --buyers 500 --capacity 50
+    python benchmarks/bench_inventory.py --mode legacy   # старое чтение + запись
+
+Скрипт создаёт временный сеанс, запускает покупателей одновременно
+(через Barrier), проверяет, что продано не больше мест, чем было,
+и печатает пропускную способность и задержки. Сеанс удаляется в конце.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database as db  # noqa: E402
+
+BENCH_EVENT_ID = 0
+BENCH_DATE = '2099-12-31'
+
+
+def buy_atomic(session_date, session_time, quantity):
+    status, _ = db.reserve_seats(BENCH_EVENT_ID, session_date, session_time, quantity)
+    return status == db.RESERVE_OK
+
+
+def buy_legacy(session_date, session_time, quantity):
+    """Прежняя схема create_order: прочитать остаток, посчитать, записать"""
+    session_obj = db.get_session_by_date_time(BENCH_EVENT_ID, session_date, session_time)
+    if not session_obj or session_obj['available_tickets'] < quantity:
+        return False
+    db.update_session_tickets(session_obj['id'],
+                              session_obj['available_tickets'] - quantity,
+                              session_obj['sold_tickets'] + quantity)
+    return True
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(args):
+    db.POOL_CONFIG.update(pool_size=args.pool_size, max_overflow=0, pool_timeout=60)
+
+    session_time = time.strftime('%H:%M:%S', time.gmtime(random.randint(0, 86399)))
+    session_id = db.execute_query("""
+        INSERT INTO session_schedule
+        (event_id, session_date, session_time, day_of_week, total_tickets, available_tickets, sold_tickets, is_active)
+        VALUES (%s, %s, %s, 'ВС', %s, %s, 0, 1)
+    """, (BENCH_EVENT_ID, BENCH_DATE, session_time, args.capacity, args.capacity), fetch=False)
+    if not session_id:
+        print("Не удалось создать тестовый сеанс (проверьте DB_CONFIG)")
+        return 2
+
+    buy = buy_atomic if args.mode == 'atomic' else buy_legacy
+    barrier = threading.Barrier(args.buyers)
+    latencies = []
+    bought = []
+    lock = threading.Lock()
+
+    def buyer():
+        quantity = random.randint(1, args.max_quantity)
+        barrier.wait()
+        started = time.perf_counter()
+        ok = buy(BENCH_DATE, session_time, quantity)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if ok:
+                bought.append(quantity)
+
+    threads = [threading.Thread(target=buyer) for _ in range(args.buyers)]
+    try:
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - started
+
+        row = db.get_session_by_id(session_id)
+        sold_by_buyers = sum(bought)
+        oversold = (sold_by_buyers > args.capacity
+                    or row['available_tickets'] < 0
+                    or row['available_tickets'] + row['sold_tickets'] != args.capacity
+                    or row['sold_tickets'] != sold_by_buyers)
+
+        print(f"Режим:                {args.mode}")
+        print(f"Покупателей:          {args.buyers} (пул {args.pool_size} соединений)")
+        print(f"Мест в сеансе:        {args.capacity}")
+        print(f"Успешных покупок:     {len(bought)}, мест продано {sold_by_buyers}")
+        print(f"В БД:                 available={row['available_tickets']}, sold={row['sold_tickets']}")
+        print(f"Пропускная способность: {args.buyers / wall:.0f} попыток/с за {wall * 1000:.0f} мс")
+        print(f"Задержка, мс:         p50={percentile(latencies, 50) * 1000:.1f} "
+              f"p95={percentile(latencies, 95) * 1000:.1f} "
+              f"p99={percentile(latencies, 99) * 1000:.1f} "
+              f"mean={statistics.mean(latencies) * 1000:.1f}")
+        print(f"Пул:                  {db.get_pool_stats()}")
+        print("ПЕРЕПРОДАЖА!" if oversold else "Перепродажи нет")
+        return 1 if oversold else 0
+    finally:
+        db.delete_session(session_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buyers', type=int, default=300, help='число одновременных покупателей')
+    parser.add_argument('--capacity', type=int, default=50, help='мест в сеансе')
+    parser.add_argument('--max-quantity', type=int, default=4, help='максимум билетов в одной покупке')
+    parser.add_argument('--pool-size', type=int, default=32, help='размер пула соединений')
+    parser.add_argument('--mode', choices=['atomic', 'legacy'], default='atomic')
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+"""
+Нагрузочный прогон публичных маршрутов и покупки билета.
+
+Сценарии (каждый - свой набор одновременных "посетителей"):
+
+    browse    главная, страница музея, страница заказа, места сеансов, афиша
+    search    поиск по мере набора: /api/search на каждую букву слова
+    booking   наплыв покупателей на один сеанс: страница заказа, /create-order,
+              оплата и билет; сеанс создаётся на время прогона и удаляется
+
+Нужна БД из db_museum.sql (настройки - database.DB_CONFIG): из неё
+берутся id музеев, афиши, категории билетов и слова для поиска.
+
+    python benchmarks/bench_routes.py --url http://127.0.0.1:5000
+    python benchmarks/bench_routes.py --in-process --scenarios search --concurrency 8
+    python benchmarks/compare.py benchmarks/results/<было>.json benchmarks/results/<стало>.json
+
+--url гоняет запущенный сервер (например, gunicorn -k gthread) по HTTP
+с keep-alive; --in-process вызывает приложение напрямую через тестовый
+клиент Flask - без сети, но в одном процессе с генератором нагрузки.
+Для каждого сценария и маршрута печатаются пропускная способность и
+задержки p50/p95/p99; результат с коммитом и параметрами прогона
+сохраняется в JSON (benchmarks/results/ по умолчанию).
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import database as db  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCENARIOS = ('browse', 'search', 'booking')
+
+BENCH_DATE = '2099-12-31'
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PHONE = '+7 (900) 000-00-00'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ===================================================================================
+# КЛИЕНТЫ
+# ===================================================================================
+
+class HttpClient:
+    """HTTP/1.1 с keep-alive, одно соединение на поток-посетитель"""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.timeout = timeout
+        self._connection = None
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, form=None):
+        """(статус, тело); редиректы не выполняются"""
+        body = urlencode(form) if form is not None else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form is not None else {}
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = self._connect()
+            try:
+                self._connection.request(method, path, body=body, headers=headers)
+                response = self._connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Сервер закрыл keep-alive соединение - одна повторная попытка
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class InProcessClient:
+    """Тестовый клиент Flask: приложение в этом же процессе"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self._client.open(path, method=method, data=form)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+# ===================================================================================
+# ЗАМЕРЫ
+# ===================================================================================
+
+class Recorder:
+    """Задержки и исходы по маршрутам одного сценария"""
+
+    def __init__(self):
+        self.routes = {}    # маршрут -> {'latencies': [...], 'errors': 0, 'outcomes': {...}}
+        self._lock = threading.Lock()
+        self.active = True
+
+    def record(self, route, seconds, error=False, outcome=None):
+        if not self.active:
+            return
+        with self._lock:
+            data = self.routes.setdefault(route, {'latencies': [], 'errors': 0, 'outcomes': {}})
+            data['latencies'].append(seconds)
+            if error:
+                data['errors'] += 1
+            if outcome:
+                data['outcomes'][outcome] = data['outcomes'].get(outcome, 0) + 1
+
+
+def _latency_summary(latencies):
+    return {
+        'p50': round(percentile(latencies, 50) * 1000, 2),
+        'p95': round(percentile(latencies, 95) * 1000, 2),
+        'p99': round(percentile(latencies, 99) * 1000, 2),
+        'mean': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        'max': round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def summarize(recorder, wall, concurrency):
+    routes = {}
+    everything = []
+    errors = 0
+    for route, data in sorted(recorder.routes.items()):
+        everything += data['latencies']
+        errors += data['errors']
+        routes[route] = {
+            'requests': len(data['latencies']),
+            'errors': data['errors'],
+            'throughput_rps': round(len(data['latencies']) / wall, 1),
+            'latency_ms': _latency_summary(data['latencies']),
+        }
+        if data['outcomes']:
+            routes[route]['outcomes'] = data['outcomes']
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(wall, 2),
+        'requests': len(everything),
+        'errors': errors,
+        'throughput_rps': round(len(everything) / wall, 1),
+        'latency_ms': _latency_summary(everything),
+        'routes': routes,
+    }
+
+
+def timed(client, recorder, route, method, path, form=None, ok=(200, 304)):
+    """Один запрос с замером; (статус, тело) или (None, None) при сетевой ошибке"""
+    started = time.perf_counter()
+    try:
+        status, body = client.request(method, path, form)
+    except Exception as e:
+        recorder.record(route, time.perf_counter() - started, error=True, outcome=type(e).__name__)
+        return None, None
+    recorder.record(route, time.perf_counter() - started, error=status not in ok)
+    return status, body
+
+
+# ===================================================================================
+# КАТАЛОГ
+# ===================================================================================
+
+def load_catalog():
+    """id музеев, афиш и выставок, категории билетов и слова для поиска из БД"""
+    museums = db.get_content_by_category('museums') or []
+    posters = db.get_content_by_category('poster') or []
+    exhibitions = db.get_content_by_category('virtual_exhibitions') or []
+    categories = db.get_ticket_categories_by_type('museum') or []
+    if not museums or not categories:
+        return None
+    words = set()
+    for row in museums + posters + exhibitions:
+        for text in (row.get('title_card'), row.get('short_description_card')):
+            words.update(w.strip('.,:;!?«»"()').lower() for w in (text or '').split())
+    return {
+        'museums': [row['id'] for row in museums],
+        'posters': [row['id'] for row in posters],
+        'exhibitions': [row['id'] for row in exhibitions],
+        'categories': [row['id'] for row in categories],
+        'words': sorted(w for w in words if len(w) >= 3) or ['музей'],
+    }
+
+
+# ===================================================================================
+# СЦЕНАРИИ
+# ===================================================================================
+
+def browse(client, recorder, rnd, catalog, context):
+    museum_id = rnd.choice(catalog['museums'])
+    timed(client, recorder, 'GET /', 'GET', '/')
+    timed(client, recorder, 'GET /about-us/<id>', 'GET', f'/about-us/{museum_id}')
+    timed(client, recorder, 'GET /order/<id>', 'GET', f'/order/{museum_id}')
+    timed(client, recorder, 'GET /api/sessions/<id>', 'GET', f'/api/sessions/{museum_id}')
+    timed(client, recorder, 'GET /poster', 'GET', '/poster')
+    if catalog['posters']:
+        timed(client, recorder, 'GET /poster_detail/<id>', 'GET', f"/poster_detail/{rnd.choice(catalog['posters'])}")
+    if catalog['exhibitions']:
+        timed(client, recorder, 'GET /museum_programs/<id>', 'GET',
+              f"/museum_programs/{rnd.choice(catalog['exhibitions'])}")
+
+
+def search(client, recorder, rnd, catalog, context):
+    # Набор по буквам; иногда второе слово после пробела
+    word = rnd.choice(catalog['words'])
+    prefix = rnd.choice(catalog['words']) + ' ' if rnd.random() < 0.3 else ''
+    for length in range(2, len(word) + 1):
+        query = urlencode({'q': prefix + word[:length]})
+        timed(client, recorder, 'GET /api/search', 'GET', f'/api/search?{query}')
+        if context['typing_delay']:
+            time.sleep(context['typing_delay'])
+
+
+def booking(client, recorder, rnd, catalog, context):
+    museum_id = context['museum_id']
+    timed(client, recorder, 'GET /order/<id>', 'GET', f'/order/{museum_id}')
+    timed(client, recorder, 'GET /api/sessions/<id>', 'GET', f'/api/sessions/{museum_id}')
+
+    quantity = rnd.randint(1, context['max_quantity'])
+    form = {
+        'full_name': 'Нагрузочный Тест',
+        'email': BENCH_EMAIL,
+        'phone': BENCH_PHONE,
+        'accept_terms': 'on',
+        'payment_method': 'bank_card',
+        'session_date': BENCH_DATE,
+        'session_time': context['session_time'],
+        'museum_id': str(museum_id),
+        'tickets_data': json.dumps({str(rnd.choice(catalog['categories'])): quantity}),
+    }
+    started = time.perf_counter()
+    try:
+        status, body = client.request('POST', '/create-order', form)
+        result = json.loads(body) if status == 200 else {}
+    except Exception as e:
+        recorder.record('POST /create-order', time.perf_counter() - started, error=True, outcome=type(e).__name__)
+        return
+    elapsed = time.perf_counter() - started
+    if result.get('success'):
+        recorder.record('POST /create-order', elapsed, outcome='created')
+    elif result.get('error') == 'Недостаточно доступных билетов':
+        # Места кончились - ожидаемый исход наплыва, не ошибка
+        recorder.record('POST /create-order', elapsed, outcome='sold_out')
+        context['sold_out'].set()
+        return
+    else:
+        recorder.record('POST /create-order', elapsed, error=True, outcome=result.get('error') or f'HTTP {status}')
+        return
+
+    order_id = result['order_id']
+    with context['lock']:
+        context['sold'] += quantity
+    timed(client, recorder, 'GET /payment/<id>', 'GET', f'/payment/{order_id}')
+    timed(client, recorder, 'POST /process-payment/<id>', 'POST', f'/process-payment/{order_id}', form={},
+          ok=(302, 303))
+    timed(client, recorder, 'GET /ticket/<id>', 'GET', f'/ticket/{order_id}')
+
+
+def _create_bench_session(museum_id, capacity):
+    session_time = time.strftime('%H:%M:%S', time.gmtime(random.randint(0, 86399)))
+    session_id = db.execute_query("""
+        INSERT INTO session_schedule
+        (event_id, session_date, session_time, day_of_week, total_tickets, available_tickets, sold_tickets, is_active)
+        VALUES (%s, %s, %s, 'ВС', %s, %s, 0, 1)
+    """, (museum_id, BENCH_DATE, session_time, capacity, capacity), fetch=False)
+    return session_id, session_time
+
+
+def _drop_bench_session(session_id):
+    """Заказы, брони и сам сеанс прогона"""
+    db.execute_query("""
+        DELETE o FROM orders o JOIN ticket_bookings b ON b.id = o.booking_id WHERE b.session_id = %s
+    """, (session_id,), fetch=False)
+    db.execute_query("DELETE FROM ticket_bookings WHERE session_id = %s", (session_id,), fetch=False)
+    db.delete_session(session_id)
+
+
+# ===================================================================================
+# ПРОГОН
+# ===================================================================================
+
+def run_scenario(name, make_client, catalog, args):
+    scenario = globals()[name]
+    context = {'typing_delay': args.typing_delay / 1000, 'max_quantity': args.max_quantity,
+               'sold': 0, 'lock': threading.Lock(), 'sold_out': threading.Event()}
+    session_id = None
+    if name == 'booking':
+        context['museum_id'] = catalog['museums'][0]
+        session_id, context['session_time'] = _create_bench_session(context['museum_id'], args.capacity)
+        if not session_id:
+            print("Не удалось создать сеанс для booking (проверьте DB_CONFIG)")
+            return None
+
+    recorder = Recorder()
+    recorder.active = args.warmup <= 0
+    barrier = threading.Barrier(args.concurrency)
+
+    def visitor(number):
+        rnd = random.Random(args.seed * 1000 + number)
+        client = make_client()
+        barrier.wait()
+        deadline = time.monotonic() + args.warmup + args.duration
+        try:
+            while time.monotonic() < deadline and not context['sold_out'].is_set():
+                scenario(client, recorder, rnd, catalog, context)
+                if args.think:
+                    time.sleep(rnd.expovariate(1000 / args.think))
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=visitor, args=(i,), daemon=True) for i in range(args.concurrency)]
+    try:
+        for t in threads:
+            t.start()
+        if args.warmup > 0:
+            time.sleep(args.warmup)
+            recorder.active = True
+        measure_from = time.perf_counter()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - measure_from
+    finally:
+        if session_id:
+            row = db.get_session_by_id(session_id)
+            context['session'] = row
+            _drop_bench_session(session_id)
+
+    summary = summarize(recorder, wall, args.concurrency)
+    if name == 'booking':
+        row = context.get('session') or {}
+        summary['booking'] = {
+            'capacity': args.capacity,
+            'sold_by_visitors': context['sold'],
+            'sold_in_db': row.get('sold_tickets'),
+            'oversold': bool(row) and (row['sold_tickets'] > args.capacity or row['available_tickets'] < 0),
+        }
+    return summary
+
+
+def print_summary(name, summary):
+    print(f"\n== {name}: {summary['concurrency']} посетителей, {summary['duration_s']} с")
+    print(f"{'маршрут':<32} {'запросов':>9} {'ошибок':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    rows = list(summary['routes'].items()) + [('ВСЕГО', summary)]
+    for route, data in rows:
+        lat = data['latency_ms']
+        print(f"{route:<32} {data['requests']:>9} {data['errors']:>7} {data['throughput_rps']:>8.1f} "
+              f"{lat['p50']:>8.1f} {lat['p95']:>8.1f} {lat['p99']:>8.1f}")
+    for route, data in summary['routes'].items():
+        if data.get('outcomes'):
+            print(f"  {route}: {data['outcomes']}")
+    if 'booking' in summary:
+        print(f"  места: {summary['booking']}")
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    return commit or None, bool(dirty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://127.0.0.1:5000', help='адрес запущенного сервера')
+    target.add_argument('--in-process', action='store_true', help='вызывать приложение напрямую')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='через запятую: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=16, help='одновременных посетителей')
+    parser.add_argument('--duration', type=float, default=20, help='длительность замера сценария, с')
+    parser.add_argument('--warmup', type=float, default=3, help='прогрев перед замером, с')
+    parser.add_argument('--think', type=float, default=0, help='средняя пауза между действиями, мс')
+    parser.add_argument('--typing-delay', type=float, default=0, help='пауза между буквами в search, мс')
+    parser.add_argument('--capacity', type=int, default=2000, help='мест в сеансе booking')
+    parser.add_argument('--max-quantity', type=int, default=3, help='максимум билетов в одном заказе')
+    parser.add_argument('--timeout', type=float, default=30, help='таймаут HTTP-запроса, с')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='', help='пометка прогона (попадёт в JSON и имя файла)')
+    parser.add_argument('--output', help='файл результата (по умолчанию benchmarks/results/...)')
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    catalog = load_catalog()
+    if catalog is None:
+        print("В БД нет музеев или категорий билетов (загрузите db_museum.sql)")
+        sys.exit(2)
+
+    if args.in_process:
+        # Фоновые задачи приложения шумят в замерах
+        os.environ.setdefault('MGORKI_JOBS', '0')
+        import app as application
+        db.POOL_CONFIG.update(pool_size=max(db.POOL_CONFIG['pool_size'], args.concurrency))
+
+        def make_client():
+            return InProcessClient(application.app)
+        target_name = 'in-process'
+    else:
+        def make_client():
+            return HttpClient(args.url, args.timeout)
+        target_name = args.url
+
+    commit, dirty = git_revision()
+    result = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'label': args.label,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'target': target_name,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        'scenarios': {},
+    }
+    for name in names:
+        summary = run_scenario(name, make_client, catalog, args)
+        if summary is None:
+            continue
+        result['scenarios'][name] = summary
+        print_summary(name, summary)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        suffix = '-'.join(filter(None, [commit, 'dirty' if dirty else '', args.label]))
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{suffix or 'run'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультат: {output}")
+
+    oversold = any(s.get('booking', {}).get('oversold') for s in result['scenarios'].values())
+    if oversold:
+        print("ПЕРЕПРОДАЖА!")
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Время генерации расписания для большого каталога.
+
+    python benchmarks/bench_schedule.py --events 10000          # только расчёт слотов
+    python benchmarks/bench_schedule.py --db                    # полный прогон на БД из DB_CONFIG
+
+Без --db считается, сколько стоит найти недостающие слоты в Python для
+первого запуска (расписания нет) и повторного (не хватает одного дня),
+и сколько запросов нужно на вставку против прежних "INSERT на каждый слот".
+С --db вызывается database.generate_weekly_schedule() дважды подряд
+(каталог нужно заранее наполнить событиями).
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database as db  # noqa: E402
+
+
+def bench_slots(events, horizon_days, slot_times):
+    event_ids = list(range(1, events + 1))
+    today = date.today()
+    batch_size = db.SCHEDULE_CONFIG['batch_size']
+
+    started = time.perf_counter()
+    missing = db.missing_schedule_slots(event_ids, set(), today, horizon_days, slot_times)
+    cold = time.perf_counter() - started
+
+    # Повторный запуск на следующий день: есть всё, кроме последнего дня окна
+    times = [db._as_time(t) for t in slot_times]
+    existing = {(e, today + timedelta(days=i), t)
+                for e in event_ids for i in range(horizon_days - 1) for t in times}
+    started = time.perf_counter()
+    missing_next_day = db.missing_schedule_slots(event_ids, existing, today, horizon_days, slot_times)
+    warm = time.perf_counter() - started
+
+    legacy = events * horizon_days * len(slot_times)
+    print(f"Событий: {events}, дней: {horizon_days}, сеансов в день: {len(slot_times)}")
+    print(f"Первый запуск:    {len(missing)} слотов, расчёт {cold * 1000:.0f} мс, "
+          f"INSERT-запросов {math.ceil(len(missing) / batch_size)} (было {legacy})")
+    print(f"Следующий день:   {len(missing_next_day)} слотов, расчёт {warm * 1000:.0f} мс, "
+          f"INSERT-запросов {math.ceil(len(missing_next_day) / batch_size)} (было {legacy})")
+
+
+def bench_db():
+    for run in ('первый', 'повторный'):
+        stats = db.generate_weekly_schedule()
+        if stats is None:
+            print("Не удалось выполнить генерацию (проверьте DB_CONFIG)")
+            return 2
+        print(f"{run} запуск: {stats}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=db.SCHEDULE_CONFIG['horizon_days'])
+    parser.add_argument('--db', action='store_true', help='прогон на настоящей БД')
+    args = parser.parse_args()
+
+    if args.db:
+        sys.exit(bench_db())
+    bench_slots(args.events, args.days, db.SCHEDULE_CONFIG['slot_times'])
+
+
+if __name__ == '__main__':
+    main()
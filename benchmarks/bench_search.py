@@ -0,0 +1,120 @@
+"""
+Задержка поиска /api/search на синтетическом каталоге (без БД).
+
+    python benchmarks/bench_search.py --docs 50000 --queries 2000
+
+Строит индекс search.SearchIndex из сгенерированных карточек и гоняет
+запросы "поиск по мере набора": префиксы слов, полные словоформы,
+запросы из нескольких слов и с опечатками. Печатает время построения
+индекса и p50/p95/p99 задержки одного запроса.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import search  # noqa: E402
+
+BASE_WORDS = [
+    'музей', 'выставка', 'экскурсия', 'ленинские', 'горки', 'усадьба', 'парк', 'история',
+    'исторический', 'электростанция', 'сказка', 'детский', 'программа', 'концерт', 'лекция',
+    'мастер', 'класс', 'гараж', 'мемориальный', 'кабинет', 'квартира', 'ленин', 'зинаида',
+    'прелесть', 'фотография', 'архив', 'коллекция', 'искусство', 'живопись', 'скульптура',
+    'реставрация', 'экспозиция', 'открытие', 'вечер', 'семейный', 'праздник', 'зимний', 'сад',
+]
+ENDINGS = ['', 'а', 'и', 'ы', 'ой', 'ами', 'ах', 'ого', 'ие', 'ую']
+SYLLABLES = ['ка', 'ро', 'ми', 'ле', 'ст', 'ва', 'но', 'ти', 'ру', 'за', 'пе', 'ло', 'де', 'ны', 'са', 'го']
+CATEGORIES = ['museums', 'virtual_exhibitions', 'poster']
+
+
+def make_vocabulary(size, rnd):
+    """Словарь с частотами по закону Ципфа: частые "музейные" слова и длинный хвост"""
+    words = [w + e for w in BASE_WORDS for e in ENDINGS[:rnd.randint(2, len(ENDINGS))]]
+    while len(words) < size:
+        words.append(''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 5))) + rnd.choice(ENDINGS))
+    rnd.shuffle(words)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return words, cum_weights
+
+
+def make_row(doc_id, rnd, words, cum_weights):
+    title = ' '.join(rnd.choices(words, cum_weights=cum_weights, k=rnd.randint(2, 5))).capitalize()
+    desc = ' '.join(rnd.choices(words, cum_weights=cum_weights, k=rnd.randint(8, 25)))
+    return {
+        'id': doc_id,
+        'category': rnd.choice(CATEGORIES),
+        'title_card': title,
+        'short_description_card': f'<p>{desc}</p>',
+        'img_card': f'images/museums/{doc_id}.jpg'
+    }
+
+
+def make_queries(count, rnd, words, cum_weights):
+    queries = []
+    for _ in range(count):
+        kind = rnd.random()
+        word = rnd.choices(words, cum_weights=cum_weights)[0]
+        if kind < 0.5:
+            # Набор по буквам: "вы", "выс", "выст", ...
+            queries.append(word[:rnd.randint(2, len(word))])
+        elif kind < 0.8:
+            queries.append(f'{rnd.choices(words, cum_weights=cum_weights)[0]} {word[:rnd.randint(2, len(word))]}')
+        else:
+            # Опечатка: пропущенная буква
+            i = rnd.randrange(1, len(word))
+            queries.append(word[:i] + word[i + 1:] + ' ')
+    return queries
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--vocabulary', type=int, default=30000, help='размер словаря каталога')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    words, cum_weights = make_vocabulary(args.vocabulary, rnd)
+    rows = [make_row(i, rnd, words, cum_weights) for i in range(1, args.docs + 1)]
+
+    started = time.perf_counter()
+    index = search.SearchIndex()
+    index.add_many(rows)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for row in rows[:200]:
+        row = dict(row, title_card=row['title_card'] + ' обновлено')
+        index.add(row)
+    update_time = (time.perf_counter() - started) / 200
+
+    latencies = []
+    found = 0
+    for q in make_queries(args.queries, rnd, words, cum_weights):
+        started = time.perf_counter()
+        found += bool(index.search(q, args.limit))
+        latencies.append(time.perf_counter() - started)
+
+    print(f"Документов:          {len(index)}, слов в словаре {len(index.vocabulary)}")
+    print(f"Построение индекса:  {build_time:.2f} с")
+    print(f"Обновление записи:   {update_time * 1000:.2f} мс")
+    print(f"Запросов:            {len(latencies)}, с результатами {found}")
+    print(f"Задержка, мс:        p50={percentile(latencies, 50) * 1000:.2f} "
+          f"p95={percentile(latencies, 95) * 1000:.2f} "
+          f"p99={percentile(latencies, 99) * 1000:.2f} "
+          f"max={max(latencies) * 1000:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Сравнение двух результатов bench_routes.py.
+
+    python benchmarks/compare.py benchmarks/results/<было>.json benchmarks/results/<стало>.json
+    python benchmarks/compare.py было.json стало.json --fail-over 15
+
+Для каждого сценария и маршрута печатает пропускную способность и
+p50/p95/p99 обоих прогонов и изменение в процентах. С --fail-over N
+завершается с кодом 1, если p95 какого-то маршрута выросла больше чем
+на N% (или выросла доля ошибок) - для проверки перед слиянием.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50', 'p95', 'p99')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def change(before, after):
+    """Изменение в процентах или None, если сравнивать не с чем"""
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def _fmt_change(value):
+    return '     -' if value is None else f"{value:+6.1f}%"
+
+
+def _error_rate(data):
+    return data['errors'] / data['requests'] if data['requests'] else 0.0
+
+
+def describe(result):
+    meta = result['meta']
+    label = f" [{meta['label']}]" if meta.get('label') else ''
+    dirty = ' +изменения' if meta.get('dirty') else ''
+    return f"{meta.get('commit') or '?'}{dirty}{label}, {meta['started_at']}, {meta['target']}"
+
+
+def compare(before, after, fail_over=None):
+    """Печатает таблицы; возвращает список регрессий (пустой - всё хорошо)"""
+    regressions = []
+    print(f"было:  {describe(before)}")
+    print(f"стало: {describe(after)}")
+    for name, new in after['scenarios'].items():
+        old = before['scenarios'].get(name)
+        if old is None:
+            print(f"\n== {name}: нет в первом прогоне")
+            continue
+        if old['concurrency'] != new['concurrency']:
+            print(f"\n!! {name}: разное число посетителей ({old['concurrency']} и {new['concurrency']})")
+        print(f"\n== {name}")
+        print(f"{'маршрут':<32} {'rps':>19} {'':>7}" + ''.join(f" {m + ', мс':>19} {'':>7}" for m in METRICS))
+        rows = [(route, old['routes'].get(route), data) for route, data in new['routes'].items()]
+        rows.append(('ВСЕГО', old, new))
+        for route, was, now in rows:
+            if was is None:
+                print(f"{route:<32} новый маршрут")
+                continue
+            line = (f"{route:<32} {was['throughput_rps']:>9.1f}→{now['throughput_rps']:<9.1f} "
+                    f"{_fmt_change(change(was['throughput_rps'], now['throughput_rps']))}")
+            for metric in METRICS:
+                a, b = was['latency_ms'][metric], now['latency_ms'][metric]
+                line += f" {a:>9.1f}→{b:<9.1f} {_fmt_change(change(a, b))}"
+            print(line)
+
+            if fail_over is None:
+                continue
+            p95 = change(was['latency_ms']['p95'], now['latency_ms']['p95'])
+            if p95 is not None and p95 > fail_over:
+                regressions.append(f"{name} {route}: p95 {p95:+.1f}%")
+            if _error_rate(now) > _error_rate(was):
+                regressions.append(f"{name} {route}: ошибок {_error_rate(was):.1%} → {_error_rate(now):.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--fail-over', type=float, help='допустимый рост p95, %%')
+    args = parser.parse_args()
+
+    regressions = compare(load(args.before), load(args.after), args.fail_over)
+    if regressions:
+        print("\nРегрессии:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
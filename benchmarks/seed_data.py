@@ -0,0 +1,415 @@
+"""
+Синтетический большой каталог для проверки масштабирования.
+
+Наполняет БД из DB_CONFIG карточками data_content, расписанием
+session_schedule, бронями ticket_bookings и заказами orders в заданных
+объёмах - чтобы увидеть, где ломаются поиск, страницы заказа и
+списки админки, пока этого не увидел прод.
+
+    python benchmarks/seed_data.py --content 50000 --sessions 2000000 --orders 10000000
+    python benchmarks/seed_data.py --content 2000 --sessions 50000 --orders 200000 --method insert
+    python benchmarks/seed_data.py --clean       # удалить всё, что насеяно
+
+Данные соблюдают схему db_museum.sql: значения enum, внешние ключи
+(сеансы - только у музеев и афиши, брони - на насеянные сеансы и
+существующие категории билетов своего типа, заказы - на насеянные
+брони), уникальные ключи (event_id, session_date, session_time),
+order_number, qr_code_token и booking_code. id задаются явно, начиная
+после текущего MAX(id), поэтому связи известны без обратных запросов.
+
+Строки пишутся кусками во временные TSV-файлы и загружаются
+LOAD DATA LOCAL INFILE (на сервере нужен local_infile=ON). Если сервер
+его не разрешает, загрузка идёт многострочными INSERT. Проверки
+уникальности и внешних ключей на время загрузки выключаются - генератор
+гарантирует их сам. Триггеры orders продолжают вести order_stats.
+
+Насеянное помечается: location_of_the_event = SEED_LOCATION у карточек,
+префикс SEED- у order_number и booking_code.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import mysql.connector  # noqa: E402
+from mysql.connector import Error  # noqa: E402
+
+import database as db  # noqa: E402
+from bench_search import make_vocabulary  # noqa: E402
+
+SEED_CONFIG = {
+    'chunk_rows': 200000,       # строк в одном файле LOAD DATA
+    'insert_batch': 2000,       # строк в одном INSERT (без LOAD DATA)
+    'delete_batch': 20000,      # строк в одном DELETE при --clean
+    # Доли категорий карточек (hero_section не сеется - это слайды главной)
+    'category_shares': (('museums', 0.1), ('virtual_exhibitions', 0.3), ('poster', 0.6)),
+    'slot_times': ['10:00:00', '11:00:00', '12:00:00', '13:00:00', '14:00:00',
+                   '15:00:00', '16:00:00', '17:00:00', '18:00:00'],
+    'future_days': 30,          # часть расписания - вперёд от сегодня, остальное в прошлом
+    'session_capacity': 50,
+    'orders_days': 730,         # created_at заказов - за столько дней назад
+}
+
+SEED_LOCATION = 'Синтетический каталог'
+SEED_PREFIX = 'SEED-'
+WEEKDAYS = ('ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ', 'ВС')
+
+# Согласованные статусы заказа: (payment_status, order_status, booking_status, вес)
+ORDER_STATES = (
+    ('paid', 'completed', 'confirmed', 45),
+    ('paid', 'paid', 'confirmed', 25),
+    ('unpaid', 'cancelled', 'cancelled', 15),
+    ('unpaid', 'new', 'pending', 6),
+    ('unpaid', 'awaiting_payment', 'pending', 5),
+    ('refunded', 'cancelled', 'cancelled', 4),
+)
+
+CONTENT_COLUMNS = ('id', 'category', 'img_card', 'title_card', 'short_description_card', 'date_of_the_event',
+                   'location_of_the_event', 'main_image', 'main_text')
+SESSION_COLUMNS = ('id', 'event_id', 'session_date', 'session_time', 'day_of_week', 'total_tickets',
+                   'available_tickets', 'sold_tickets', 'is_active')
+BOOKING_COLUMNS = ('id', 'session_id', 'ticket_category_id', 'user_email', 'user_phone', 'quantity',
+                   'total_price', 'payment_method', 'booking_status', 'booking_code', 'created_at')
+ORDER_COLUMNS = ('id', 'full_name', 'email', 'phone', 'country_code', 'booking_id', 'order_number',
+                 'order_status', 'qr_code_token', 'ticket_verified', 'total_amount', 'payment_status',
+                 'payment_method', 'created_at')
+
+FIRST_NAMES = ('Иван', 'Мария', 'Алексей', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Павел', 'Наталья')
+LAST_NAMES = ('Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Васильев', 'Петрова', 'Соколов', 'Морозова')
+
+
+# ===================================================================================
+# ЗАГРУЗКА
+# ===================================================================================
+
+def _tsv(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    text = str(value)
+    if '\\' in text or '\t' in text or '\n' in text:
+        text = text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    return text
+
+
+class Loader:
+    """Загрузка строк в таблицу: LOAD DATA LOCAL INFILE или многострочные INSERT"""
+
+    def __init__(self, method):
+        self.method = method
+        self.connection = mysql.connector.connect(**db.DB_CONFIG, allow_local_infile=True, autocommit=False)
+        cursor = self.connection.cursor()
+        cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        cursor.close()
+        self.tmpdir = tempfile.mkdtemp(prefix='mgorki-seed-')
+
+    def load(self, table, columns, rows):
+        """Загрузить итератор строк кусками; вернуть число строк"""
+        total = 0
+        started = time.perf_counter()
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= SEED_CONFIG['chunk_rows']:
+                total += self._load_chunk(table, columns, chunk)
+                chunk = []
+                rate = total / (time.perf_counter() - started)
+                print(f"  {table}: {total} строк, {rate:.0f} строк/с")
+        if chunk:
+            total += self._load_chunk(table, columns, chunk)
+        elapsed = time.perf_counter() - started
+        print(f"{table}: {total} строк за {elapsed:.1f} с ({total / max(elapsed, 1e-9):.0f} строк/с, {self.method})")
+        return total
+
+    def _load_chunk(self, table, columns, chunk):
+        if self.method in ('auto', 'load'):
+            try:
+                self._load_data(table, columns, chunk)
+                self.method = 'load'
+                return len(chunk)
+            except Error as e:
+                if self.method == 'load':
+                    raise
+                self.connection.rollback()
+                print(f"LOAD DATA LOCAL INFILE недоступен ({e}), загрузка через INSERT")
+                self.method = 'insert'
+        self._insert(table, columns, chunk)
+        return len(chunk)
+
+    def _load_data(self, table, columns, chunk):
+        path = os.path.join(self.tmpdir, f'{table}.tsv')
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            for row in chunk:
+                f.write('\t'.join(_tsv(v) for v in row))
+                f.write('\n')
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE `{table}`
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({', '.join(f'`{c}`' for c in columns)})
+            """, (path,))
+            cursor.close()
+            self.connection.commit()
+        finally:
+            os.remove(path)
+
+    def _insert(self, table, columns, chunk):
+        batch = SEED_CONFIG['insert_batch']
+        row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        cursor = self.connection.cursor()
+        try:
+            for start in range(0, len(chunk), batch):
+                rows = chunk[start:start + batch]
+                params = [v for row in rows for v in row]
+                cursor.execute(f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in columns)}) VALUES "
+                               + ', '.join([row_sql] * len(rows)), params)
+            self.connection.commit()
+        finally:
+            cursor.close()
+
+    def scalar(self, query, params=()):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+
+    def rows(self, query, params=()):
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def close(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1")
+        cursor.close()
+        self.connection.close()
+        os.rmdir(self.tmpdir)
+
+
+# ===================================================================================
+# ГЕНЕРАЦИЯ
+# ===================================================================================
+
+def _next_id(loader, table):
+    return (loader.scalar(f"SELECT MAX(id) FROM `{table}`") or 0) + 1
+
+
+def _sentence(rnd, words, cum_weights, low, high):
+    return ' '.join(rnd.choices(words, cum_weights=cum_weights, k=rnd.randint(low, high)))
+
+
+def gen_content(rnd, count, first_id, images):
+    """Карточки; возвращает (итератор строк, [(id, категория)])"""
+    words, cum_weights = make_vocabulary(30000, rnd)
+    categories = [name for name, _ in SEED_CONFIG['category_shares']]
+    shares = [share for _, share in SEED_CONFIG['category_shares']]
+    plan = [(first_id + i, rnd.choices(categories, weights=shares)[0]) for i in range(count)]
+    today = date.today()
+
+    def rows():
+        for content_id, category in plan:
+            image = rnd.choice(images[category]) if images.get(category) else None
+            yield (
+                content_id, category, image,
+                _sentence(rnd, words, cum_weights, 2, 6).capitalize()[:150],
+                _sentence(rnd, words, cum_weights, 8, 25)[:255],
+                today + timedelta(days=rnd.randint(-365, 90)) if category == 'poster' else None,
+                SEED_LOCATION, image,
+                _sentence(rnd, words, cum_weights, 60, 200),
+            )
+    return rows(), plan
+
+
+def gen_sessions(rnd, count, first_id, events):
+    """Сеансы поровну по событиям; возвращает (итератор строк, [(первый id, число, тип категории билетов)])"""
+    slot_times = SEED_CONFIG['slot_times']
+    capacity = SEED_CONFIG['session_capacity']
+    per_event, extra = divmod(count, len(events))
+    today = date.today()
+    blocks = []
+    next_id = first_id
+    for index, (event_id, category) in enumerate(events):
+        size = per_event + (1 if index < extra else 0)
+        if size:
+            blocks.append((next_id, size, event_id, 'museum' if category == 'museums' else 'poster'))
+            next_id += size
+
+    def rows():
+        for start_id, size, event_id, _ in blocks:
+            days = -(-size // len(slot_times))
+            first_day = today + timedelta(days=min(SEED_CONFIG['future_days'], days) - days)
+            for offset in range(size):
+                session_date = first_day + timedelta(days=offset // len(slot_times))
+                past = session_date < today
+                sold = rnd.randint(0, capacity) if past else rnd.randint(0, capacity // 2)
+                yield (start_id + offset, event_id, session_date, slot_times[offset % len(slot_times)],
+                       WEEKDAYS[session_date.weekday()], capacity, capacity - sold, sold, 0 if past else 1)
+    return rows(), [(start_id, size, kind) for start_id, size, _, kind in blocks]
+
+
+def gen_bookings_and_orders(rnd, count, first_booking_id, first_order_id, session_blocks, categories):
+    """Брони и заказы один к одному; возвращает (итератор броней, итератор заказов)"""
+    states = [state[:3] for state in ORDER_STATES]
+    state_weights = list(itertools.accumulate(state[3] for state in ORDER_STATES))
+    now = datetime.now().replace(microsecond=0)
+    horizon = SEED_CONFIG['orders_days'] * 86400
+    # Сеанс выбирается как блок события + смещение: без списка всех id в памяти
+    block_weights = list(itertools.accumulate(size for _, size, _ in session_blocks))
+    seed = rnd.getrandbits(32) << 32
+
+    def make(i):
+        # Одинаковые данные для брони и заказа с номером i без хранения в памяти
+        local = random.Random(seed | i)
+        start_id, size, kind = local.choices(session_blocks, cum_weights=block_weights)[0]
+        category = local.choice(categories[kind])
+        quantity = local.randint(1, 4)
+        payment_status, order_status, booking_status = local.choices(states, cum_weights=state_weights)[0]
+        created_at = now - timedelta(seconds=local.randrange(horizon))
+        return {
+            'session_id': start_id + local.randrange(size),
+            'category_id': category['id'],
+            'quantity': quantity,
+            'amount': category['price'] * quantity,
+            'payment_method': 'pushkin_card' if category['pushkin_card_allowed'] and local.random() < 0.3
+                              else 'bank_card',
+            'states': (payment_status, order_status, booking_status),
+            'created_at': created_at,
+            'name': f"{local.choice(LAST_NAMES)} {local.choice(FIRST_NAMES)}",
+            'phone': f"+7 (9{local.randint(10, 99)}) {local.randint(100, 999)}-{local.randint(10, 99)}-"
+                     f"{local.randint(10, 99)}",
+            'token': f"{local.getrandbits(128):032x}",
+        }
+
+    def bookings():
+        for i in range(count):
+            item = make(i)
+            booking_id = first_booking_id + i
+            yield (booking_id, item['session_id'], item['category_id'], f"user{booking_id}@example.com",
+                   item['phone'], item['quantity'], item['amount'], item['payment_method'], item['states'][2],
+                   f"{SEED_PREFIX}{booking_id}", item['created_at'])
+
+    def orders():
+        for i in range(count):
+            item = make(i)
+            order_id = first_order_id + i
+            booking_id = first_booking_id + i
+            payment_status, order_status, _ = item['states']
+            yield (order_id, item['name'], f"user{booking_id}@example.com", item['phone'], '+7', booking_id,
+                   f"{SEED_PREFIX}{order_id}", order_status, f"seed{order_id}-{item['token']}",
+                   order_status == 'completed', item['amount'], payment_status, item['payment_method'],
+                   item['created_at'])
+    return bookings(), orders()
+
+
+# ===================================================================================
+# КОМАНДЫ
+# ===================================================================================
+
+def seed(args):
+    rnd = random.Random(args.seed)
+    loader = Loader(args.method)
+    try:
+        categories = {'museum': [], 'poster': []}
+        for row in loader.rows("SELECT id, category, price, pushkin_card_allowed FROM ticket_categories"):
+            categories[row['category']].append(row)
+        if args.orders and not (categories['museum'] and categories['poster']):
+            print("Нет категорий билетов museum и poster (загрузите db_museum.sql)")
+            return 2
+        images = {}
+        for row in loader.rows("SELECT category, img_card FROM data_content WHERE img_card IS NOT NULL"):
+            images.setdefault(row['category'], []).append(row['img_card'])
+
+        started = time.perf_counter()
+        rows, plan = gen_content(rnd, args.content, _next_id(loader, 'data_content'), images)
+        loader.load('data_content', CONTENT_COLUMNS, rows)
+
+        events = [item for item in plan if item[1] in ('museums', 'poster')]
+        session_blocks = []
+        if args.sessions and events:
+            rows, session_blocks = gen_sessions(rnd, args.sessions, _next_id(loader, 'session_schedule'), events)
+            loader.load('session_schedule', SESSION_COLUMNS, rows)
+        elif args.sessions:
+            print("Сеансы не созданы: нет насеянных музеев и афиши (нужен --content)")
+
+        if args.orders and session_blocks:
+            bookings, orders = gen_bookings_and_orders(rnd, args.orders, _next_id(loader, 'ticket_bookings'),
+                                                       _next_id(loader, 'orders'), session_blocks, categories)
+            loader.load('ticket_bookings', BOOKING_COLUMNS, bookings)
+            loader.load('orders', ORDER_COLUMNS, orders)
+        elif args.orders:
+            print("Заказы не созданы: нет насеянных сеансов (нужен --sessions)")
+
+        print(f"Готово за {time.perf_counter() - started:.0f} с. Обновите статистику: ANALYZE TABLE "
+              "data_content, session_schedule, ticket_bookings, orders")
+        return 0
+    finally:
+        loader.close()
+
+
+def clean(args):
+    """Удалить насеянное: заказы, брони, карточки (сеансы удаляются каскадом)"""
+    loader = Loader('insert')
+    batch = SEED_CONFIG['delete_batch']
+    steps = [
+        ('orders', "DELETE FROM orders WHERE order_number LIKE %s LIMIT %s", (f'{SEED_PREFIX}%', batch)),
+        ('ticket_bookings', "DELETE FROM ticket_bookings WHERE booking_code LIKE %s LIMIT %s",
+         (f'{SEED_PREFIX}%', batch)),
+        # Каскад по сеансам тяжёлый - карточки удаляются небольшими порциями
+        ('data_content', "DELETE FROM data_content WHERE location_of_the_event = %s LIMIT %s",
+         (SEED_LOCATION, 100)),
+    ]
+    try:
+        cursor = loader.connection.cursor()
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        for table, query, params in steps:
+            deleted = 0
+            while True:
+                cursor.execute(query, params)
+                loader.connection.commit()
+                if not cursor.rowcount:
+                    break
+                deleted += cursor.rowcount
+            print(f"{table}: удалено {deleted}")
+        cursor.close()
+        return 0
+    finally:
+        loader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--content', type=int, default=50000, help='карточек data_content')
+    parser.add_argument('--sessions', type=int, default=2000000, help='строк session_schedule')
+    parser.add_argument('--orders', type=int, default=10000000, help='заказов (и столько же броней)')
+    parser.add_argument('--method', choices=['auto', 'load', 'insert'], default='auto',
+                        help='LOAD DATA LOCAL INFILE, INSERT или LOAD с откатом на INSERT')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clean', action='store_true', help='удалить насеянные данные')
+    args = parser.parse_args()
+    try:
+        sys.exit(clean(args) if args.clean else seed(args))
+    except Error as e:
+        print(f"Ошибка БД: {e}")
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
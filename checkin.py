@@ -0,0 +1,275 @@
+"""
+Проход по билетам: пакетная проверка и отложенная запись ticket_verified.
+
+Сканеры на входе присылают токены пачками (/api/checkin). Подпись и
+срок токена проверяются локально (tickets.py), повторы сразу отсекаются
+по набору недавних проходов в памяти, а для остальных заказов одним
+запросом на пачку читается их состояние (оплачен, отменён, уже отмечен) -
+так ловятся возвраты, отмены и проходы через другой воркер или до
+перезапуска. Ответ уходит сразу; ticket_verified пишется в БД фоновым
+потоком раз в flush_interval секунд групповыми UPDATE ... WHERE id IN (...)
+с теми же условиями (оплачен, не отменён, ещё не отмечен).
+
+Набор недавних проходов - свой в каждом процессе. Повтор, пришедший в
+другой воркер до записи в БД (в пределах flush_interval), не поймается;
+после записи его отсечёт чтение состояния из БД.
+
+Несохранённые отметки записываются при остановке процесса (atexit);
+при ошибке БД они остаются в очереди до следующей попытки.
+"""
+import atexit
+import os
+import threading
+import time
+
+import database as db
+import tickets
+
+CHECKIN_CONFIG = {
+    'flush_interval': 1.0,      # как часто писать отметки в БД, сек
+    'flush_chunk': 500,         # id в одном UPDATE
+    'recent_ttl': 12 * 3600,    # сколько помнить проход в памяти, сек
+    'max_batch': 200,           # токенов в одном запросе /api/checkin
+    'shutdown_retries': 3
+}
+
+# Статусы результата для каждого токена
+OK = 'ok'
+VALID = tickets.VALID                   # билет действителен, проход не отмечался (проверка без сканера)
+DUPLICATE = 'duplicate'                 # проход уже был
+DUPLICATE_IN_BATCH = 'duplicate_in_batch'
+INVALID = 'invalid'
+NOT_YET_VALID = 'not_yet_valid'
+EXPIRED = 'expired'
+CANCELLED = 'cancelled'
+UNPAID = 'unpaid'
+ERROR = 'error'                         # БД недоступна, а без неё билет не проверить
+
+
+def _state_status(state):
+    """Статус по строке get_checkin_states; VALID - можно пускать"""
+    if state is None:
+        return INVALID
+    if state['order_status'] == 'cancelled':
+        return CANCELLED
+    if state['payment_status'] != 'paid':
+        return UNPAID
+    if state['ticket_verified']:
+        return DUPLICATE
+    return VALID
+
+
+class CheckinRecorder:
+    """Недавние проходы в памяти и очередь отметок для записи в БД"""
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or CHECKIN_CONFIG['flush_interval']
+        self._recent = {}       # order_id -> время прохода (time.time())
+        self._pending = set()   # order_id, ещё не записанные в БД
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._stats = {'scans': 0, 'accepted': 0, 'duplicates': 0, 'rejected': 0,
+                       'flushes': 0, 'flushed': 0, 'flush_errors': 0}
+
+    # --- проверка ---
+
+    def _claim(self, order_ids, now):
+        """Занять заказы под проход; вернуть {order_id: время прежнего прохода} для уже занятых"""
+        seen = {}
+        with self._lock:
+            if len(self._recent) > 10000:
+                cutoff = now - CHECKIN_CONFIG['recent_ttl']
+                for order_id in [k for k, t in self._recent.items() if t < cutoff]:
+                    del self._recent[order_id]
+            for order_id in order_ids:
+                scanned_at = self._recent.get(order_id)
+                if scanned_at is not None and now - scanned_at < CHECKIN_CONFIG['recent_ttl']:
+                    seen[order_id] = scanned_at
+                else:
+                    self._recent[order_id] = now
+        return seen
+
+    def _release(self, order_ids):
+        with self._lock:
+            for order_id in order_ids:
+                self._recent.pop(order_id, None)
+
+    def _verify(self, tokens, now):
+        """Подпись и срок - локально; старые случайные токены - одним запросом"""
+        results = [{'token': token, 'status': INVALID, 'order_id': None} for token in tokens]
+        legacy = {}
+        for result in results:
+            token = result['token']
+            if not isinstance(token, str) or not token:
+                continue
+            if tickets.is_signed(token):
+                status, claims = tickets.verify(token, now)
+                result['status'] = status
+                if claims:
+                    result['order_id'] = claims['order_id']
+                if status == tickets.VALID:
+                    result['signed'] = True
+            else:
+                legacy.setdefault(token, []).append(result)
+        if legacy:
+            found = db.get_order_ids_by_tokens(list(legacy))
+            for token, token_results in legacy.items():
+                for result in token_results:
+                    if found is None:
+                        result['status'] = ERROR
+                    elif token in found:
+                        result['status'] = tickets.VALID
+                        result['order_id'] = found[token]
+        return results
+
+    def peek(self, token):
+        """Проверить билет, не отмечая проход: {'token', 'status', 'order_id'}"""
+        now = time.time()
+        result = self._verify([token], now)[0]
+        result.pop('signed', None)
+        if result['status'] == VALID:
+            with self._lock:
+                scanned_at = self._recent.get(result['order_id'])
+            if scanned_at is not None and now - scanned_at < CHECKIN_CONFIG['recent_ttl']:
+                result['status'] = DUPLICATE
+                return result
+            states = db.get_checkin_states([result['order_id']])
+            if states is None:
+                result['status'] = ERROR
+            else:
+                result['status'] = _state_status(states.get(result['order_id']))
+        return result
+
+    def check_in(self, tokens):
+        """Проверить пачку токенов; список {'token', 'status', 'order_id'} в том же порядке"""
+        self._ensure_flusher()
+        now = time.time()
+        results = self._verify(tokens, now)
+
+        # 2. Повторы внутри пачки и среди недавних проходов
+        candidates = {}
+        for result in results:
+            if result['status'] != tickets.VALID:
+                continue
+            if result['order_id'] in candidates:
+                result['status'] = DUPLICATE_IN_BATCH
+                continue
+            candidates[result['order_id']] = result
+        seen = self._claim(list(candidates), now)
+        for order_id, scanned_at in seen.items():
+            result = candidates.pop(order_id)
+            result['status'] = DUPLICATE
+            result['scanned_at'] = time.strftime('%H:%M:%S', time.localtime(scanned_at))
+
+        # 3. Состояние новых заказов - одним запросом на пачку
+        states = db.get_checkin_states(list(candidates)) if candidates else {}
+        released = []
+        for order_id, result in candidates.items():
+            if states is None:
+                # БД недоступна: подпись и срок проверены - пускаем, чтобы не останавливать
+                # вход; отменённый заказ всё равно не отметит условный UPDATE при записи
+                if result.get('signed'):
+                    result['status'] = OK
+                else:
+                    result['status'] = ERROR
+                    released.append(order_id)
+                continue
+            status = _state_status(states.get(order_id))
+            if status == VALID:
+                result['status'] = OK
+            else:
+                result['status'] = status
+                # Уже отмеченный в БД заказ остаётся в наборе недавних - следующий повтор без запроса
+                if status != DUPLICATE:
+                    released.append(order_id)
+        self._release(released)
+
+        accepted = [r['order_id'] for r in results if r['status'] == OK]
+        with self._lock:
+            self._pending.update(accepted)
+            self._stats['scans'] += len(results)
+            self._stats['accepted'] += len(accepted)
+            self._stats['duplicates'] += sum(r['status'] in (DUPLICATE, DUPLICATE_IN_BATCH) for r in results)
+            self._stats['rejected'] += sum(r['status'] not in (OK, DUPLICATE, DUPLICATE_IN_BATCH) for r in results)
+        for result in results:
+            result.pop('signed', None)
+        return results
+
+    # --- запись в БД ---
+
+    def flush(self):
+        """Записать накопленные отметки; при ошибке они остаются в очереди. Возвращает число записанных"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = sorted(self._pending), set()
+            written = 0
+            chunk = CHECKIN_CONFIG['flush_chunk']
+            for start in range(0, len(pending), chunk):
+                order_ids = pending[start:start + chunk]
+                if db.mark_tickets_verified(order_ids) is None:
+                    with self._lock:
+                        self._pending.update(pending[start:])
+                        self._stats['flush_errors'] += 1
+                    break
+                written += len(order_ids)
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed'] += written
+            return written
+
+    def _flush_forever(self):
+        while not self._stop.wait(self.flush_interval):
+            if self._pending:
+                self.flush()
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            # После fork очередь родителя запишет сам родитель
+            if self._pid is not None and self._pid != os.getpid():
+                self._pending.clear()
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._flush_forever, name='mgorki-checkin', daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        """Остановить поток и записать всё, что осталось (вызывается при выходе процесса)"""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(self.flush_interval * 2)
+        for _ in range(CHECKIN_CONFIG['shutdown_retries']):
+            if not self._pending:
+                return
+            self.flush()
+            if self._pending:
+                time.sleep(0.5)
+        if self._pending:
+            print(f"Не удалось записать отметки прохода: {sorted(self._pending)}")
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['pending'] = len(self._pending)
+            result['recent'] = len(self._recent)
+        return result
+
+
+recorder = CheckinRecorder()
+atexit.register(recorder.shutdown)
+
+
+def check_in(tokens):
+    return recorder.check_in(tokens)
+
+
+def peek(token):
+    return recorder.peek(token)
+
+
+def get_checkin_stats():
+    return recorder.stats()
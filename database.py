@@ -1,5 +1,13 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
 
 DB_CONFIG = {
     'host': '127.0.0.1',
@@ -9,38 +17,1040 @@ DB_CONFIG = {
     'port': 3306
 }
 
+# Настройки пула соединений (на один процесс/воркер)
+POOL_CONFIG = {
+    'pool_size': 5,          # сколько соединений держать открытыми постоянно
+    'max_overflow': 10,      # сколько временных соединений можно открыть сверх pool_size
+    'pool_timeout': 10,      # сколько секунд ждать свободное соединение
+    'pool_recycle': 1800,    # через сколько секунд пересоздавать соединение
+    'pre_ping_after': 30,    # проверять соединение, если оно простаивало дольше (0 - всегда)
+    'connect_timeout': 5     # таймаут установки нового соединения
+}
+
+# Автоматическое расписание сеансов (flask generate-schedule)
+SCHEDULE_CONFIG = {
+    'horizon_days': 7,                                  # на сколько дней вперёд
+    'slot_times': ['10:00:00', '14:00:00', '18:00:00'], # время сеансов
+    'total_tickets': 50,                                # мест в сеансе
+    'batch_size': 1000                                  # строк в одном INSERT
+}
+
+# Настройки кэша справочных данных (data_content, ticket_categories)
+CACHE_CONFIG = {
+    'ttl': 300,              # сколько секунд хранить результат запроса
+    'max_entries': 2048      # сколько результатов хранить (LRU)
+}
+
+# Реплики только для чтения: MGORKI_DB_REPLICAS="host[:port],..." (пользователь,
+# пароль и база - как в DB_CONFIG). Без реплик всё идёт на DB_CONFIG.
+REPLICA_CONFIG = {
+    'pin_seconds': 5,        # сколько после записи читать с основной (read-your-writes)
+    'max_lag': 3,            # реплика с отставанием больше (сек) выводится из ротации
+    'check_interval': 2,     # как часто проверять отставание реплик
+    'retry_after': 15        # через сколько проверять упавшую реплику снова
+}
+
+
+def _replica_configs(raw):
+    configs = []
+    for part in raw.split(','):
+        host, _, port = part.strip().partition(':')
+        if host:
+            configs.append(dict(DB_CONFIG, host=host, port=int(port or DB_CONFIG['port'])))
+    return configs
+
+
+DB_REPLICAS = _replica_configs(os.environ.get('MGORKI_DB_REPLICAS', ''))
+
+
+# ===================================================================================
+# ПУЛ СОЕДИНЕНИЙ
+# ===================================================================================
+
+class PooledConnection:
+    """Соединение из пула: close() возвращает его в пул, а не закрывает"""
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise InterfaceError("Соединение уже возвращено в пул")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        if self._raw is None:
+            raise InterfaceError("Соединение уже возвращено в пул")
+        plans = getattr(_explain, 'plans', None)
+        if plans is not None:
+            return ExplainCursor(self._raw, plans)
+        cursor = self._raw.cursor(*args, **kwargs)
+        return TimedCursor(cursor) if _query_listeners else cursor
+
+    def is_connected(self):
+        # Не пингуем сервер: живость проверяет пул при выдаче соединения
+        return self._raw is not None
+
+    def invalidate(self):
+        """Выбросить соединение вместо возврата в пул (после сетевой ошибки)"""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._discard(raw)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created_at)
+
+
+# ===================================================================================
+# ПОДПИСКА НА ЗАПРОСЫ (метрики и журнал медленных запросов, см. metrics.py)
+# ===================================================================================
+
+_query_listeners = []
+_connect_listeners = []
+
+
+def add_query_listener(callback):
+    """callback(query, params, seconds, error, rows) после каждого запроса через пул.
+
+    seconds - время execute и чтения строк; error - исключение или None;
+    rows - прочитано строк (для изменяющих запросов - затронуто).
+    Пока подписчиков нет, курсоры не оборачиваются.
+    """
+    _query_listeners.append(callback)
+
+
+def add_connect_listener(callback):
+    """callback(seconds, ok): сколько заняло получение соединения из пула"""
+    _connect_listeners.append(callback)
+
+
+def _notify(listeners, *args):
+    for callback in listeners:
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Ошибка обработчика метрик БД: {e}")
+
+
+class TimedCursor:
+    """Курсор, который сообщает подписчикам время каждого запроса.
+
+    Время чтения строк (fetch*) прибавляется к своему запросу, поэтому
+    подписчики узнают о запросе при следующем execute или при close().
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._current = None    # [query, params, seconds, error, rows]
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _finish(self):
+        if self._current is not None:
+            current, self._current = self._current, None
+            if current[4] is None:
+                current[4] = max(getattr(self._cursor, 'rowcount', 0) or 0, 0)
+            _notify(_query_listeners, *current)
+
+    def _timed(self, query, params, call):
+        self._finish()
+        self._current = [query, params, 0.0, None, None]
+        started = time.perf_counter()
+        try:
+            return call()
+        except Exception as e:
+            self._current[3] = e
+            raise
+        finally:
+            self._current[2] += time.perf_counter() - started
+
+    def execute(self, query, params=None, *args, **kwargs):
+        return self._timed(query, params, lambda: self._cursor.execute(query, params, *args, **kwargs))
+
+    def executemany(self, query, seq_params, *args, **kwargs):
+        return self._timed(query, None, lambda: self._cursor.executemany(query, seq_params, *args, **kwargs))
+
+    def _fetch(self, call, many=True):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = call()
+            return result
+        finally:
+            current = self._current
+            if current is not None:
+                current[2] += time.perf_counter() - started
+                fetched = len(result) if many and result else int(not many and result is not None)
+                current[4] = (current[4] or 0) + fetched
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone, many=False)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._fetch(lambda: self._cursor.fetchmany(*args, **kwargs))
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+
+# Режим проверки планов (explain_check.py): курсоры пула вместо запроса
+# выполняют EXPLAIN и запоминают план, данные не читаются и не меняются
+_explain = threading.local()
+
+
+class ExplainCursor:
+    """Курсор, который вместо SELECT/UPDATE/DELETE выполняет EXPLAIN"""
+
+    EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+    def __init__(self, raw, plans):
+        self._cursor = raw.cursor(dictionary=True)
+        self._plans = plans
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        words = query.split(None, 1)
+        if words and words[0].upper() in self.EXPLAINED:
+            self._cursor.execute('EXPLAIN ' + query, params or ())
+            self._plans.append((query, params, self._cursor.fetchall()))
+
+    def executemany(self, query, seq_params):
+        pass
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        self._cursor.close()
+
+
+@contextmanager
+def explain_plans():
+    """Внутри блока запросы этого потока не выполняются, а собираются их планы:
+    with explain_plans() as plans: ... -> [(query, params, строки EXPLAIN)]"""
+    plans = []
+    _explain.plans = plans
+    try:
+        yield plans
+    finally:
+        _explain.plans = None
+
+
+class ConnectionPool:
+    """Пул соединений MySQL с переполнением, таймаутом ожидания,
+    проверкой живости при выдаче и пересозданием старых соединений"""
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, pool_timeout=10,
+                 pool_recycle=1800, pre_ping_after=30, connect_timeout=5):
+        self.db_config = dict(db_config, connect_timeout=connect_timeout, autocommit=True)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.pre_ping_after = pre_ping_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []  # (raw, created_at, released_at), последний - самый "горячий"
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connect_time_total': 0.0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        raw = mysql.connector.connect(**self.db_config)
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            self._stats['connections_created'] += 1
+            self._stats['connect_time_total'] += elapsed
+        return raw, time.monotonic()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Error:
+            pass
+
+    def _is_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        """Взять соединение из пула (ждёт не дольше pool_timeout секунд)"""
+        started = time.monotonic()
+        deadline = started + self.pool_timeout
+        waited = False
+        item = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    item = self._idle.pop()
+                    break
+                if self._open < self.pool_size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"Нет свободных соединений в пуле за {self.pool_timeout} с")
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        try:
+            if item is not None:
+                raw, created_at, released_at = item
+                now = time.monotonic()
+                if self.pool_recycle and now - created_at > self.pool_recycle:
+                    self._close_quietly(raw)
+                    self._count('recycled')
+                    raw, created_at = self._connect()
+                elif now - released_at >= self.pre_ping_after and not self._is_alive(raw):
+                    self._close_quietly(raw)
+                    self._count('health_check_failures')
+                    raw, created_at = self._connect()
+            else:
+                raw, created_at = self._connect()
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _release(self, raw, created_at):
+        if raw.in_transaction:
+            # Незавершённая транзакция не должна перейти к следующему владельцу
+            try:
+                raw.rollback()
+            except Error:
+                self._discard(raw)
+                return
+        with self._cond:
+            self._in_use -= 1
+            if len(self._idle) >= self.pool_size:
+                # Лишние (overflow) соединения закрываем сразу
+                self._open -= 1
+                close = True
+            else:
+                self._idle.append((raw, created_at, time.monotonic()))
+                close = False
+            self._cond.notify()
+        if close:
+            self._close_quietly(raw)
+
+    def _discard(self, raw):
+        self._close_quietly(raw)
+        with self._cond:
+            self._in_use -= 1
+            self._open -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+    def dispose(self):
+        """Закрыть все простаивающие соединения"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def stats(self):
+        """Текущее состояние пула и накопленная статистика ожиданий"""
+        with self._cond:
+            result = dict(self._stats)
+            result.update({
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting
+            })
+        result['wait_time_avg'] = result['wait_time_total'] / result['waits'] if result['waits'] else 0.0
+        return result
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Пул текущего процесса (создаётся лениво и заново после fork)"""
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+            pool = _pool
+    return pool
+
+
+def get_pool_stats():
+    """Статистика пула: занятые, ожидающие, время ожидания"""
+    return get_pool().stats()
+
+
+def _acquire(pool, on_error=None):
+    """Соединение из пула с замером для подписчиков; None при ошибке"""
+    started = time.perf_counter()
+    try:
+        connection = pool.acquire()
+    except Error as e:
+        if on_error is not None:
+            on_error(e)
+        else:
+            print(f"Ошибка подключения к БД: {e}")
+        if _connect_listeners:
+            _notify(_connect_listeners, time.perf_counter() - started, False)
+        return None
+    if _connect_listeners:
+        _notify(_connect_listeners, time.perf_counter() - started, True)
+    return connection
+
 
 def get_connection():
-    """Получить соединение с БД"""
+    """Получить соединение с основной БД из пула (close() возвращает его в пул).
+
+    Соединение берут для транзакций и записей, поэтому чтения этого
+    потока после него тоже идут на основную (см. pin_primary).
+    """
+    _mark_write()
+    return _acquire(get_pool())
+
+
+# ===================================================================================
+# РЕПЛИКИ ДЛЯ ЧТЕНИЯ
+# ===================================================================================
+#
+# SELECT вне транзакции (execute_query, cached_query) идут на реплики по
+# кругу, всё остальное - на основную. После записи поток читает с
+# основной pin_seconds секунд, а Flask переносит это окно в сессию
+# клиента (см. begin_routing / routing_pin в app.py), чтобы следующая
+# страница после оформления или оплаты заказа увидела свою запись даже
+# в другом воркере. Кэш справочных данных, изменённых недавно в этом
+# процессе, тоже перечитывается с основной.
+#
+# Фоновый поток раз в check_interval проверяет отставание реплик
+# (SHOW REPLICA STATUS). Реплика с отставанием больше max_lag, с
+# остановленной репликацией или с ошибкой соединения выводится из
+# ротации до следующей удачной проверки; пока рабочих реплик нет,
+# чтения идут на основную.
+
+_routing = threading.local()
+
+
+def _mark_write():
+    if DB_REPLICAS:
+        _routing.wrote = True
+        _routing.pin_until = time.time() + REPLICA_CONFIG['pin_seconds']
+
+
+def pin_primary(seconds=None):
+    """Читать с основной БД в этом потоке ближайшие seconds секунд"""
+    _routing.pin_until = time.time() + (REPLICA_CONFIG['pin_seconds'] if seconds is None else seconds)
+
+
+def primary_pinned():
+    return getattr(_routing, 'pin_until', 0) > time.time()
+
+
+def begin_routing(pin_until=0):
+    """Начало запроса к сайту: окно чтения с основной из сессии клиента (time.time())"""
+    _routing.pin_until = pin_until or 0
+    _routing.wrote = False
+
+
+def routing_pin():
+    """Конец запроса: до какого времени клиенту читать с основной, если запрос писал в БД, иначе None"""
+    if DB_REPLICAS and getattr(_routing, 'wrote', False):
+        return _routing.pin_until
+    return None
+
+
+_READ_ONLY_SKIP = ('FOR UPDATE', 'FOR SHARE', 'LOCK IN SHARE MODE', 'GET_LOCK', 'LAST_INSERT_ID')
+
+
+def _is_read_only(query):
+    head = query.lstrip()[:6].upper()
+    if head != 'SELECT':
+        return False
+    upper = query.upper()
+    return not any(marker in upper for marker in _READ_ONLY_SKIP)
+
+
+class Replica:
+    """Реплика: свой пул и состояние в ротации"""
+
+    def __init__(self, config):
+        self.config = config
+        self.name = f"{config['host']}:{config['port']}"
+        self.pool = ConnectionPool(config, **POOL_CONFIG)
+        self.healthy = False        # в ротации только после первой удачной проверки
+        self.lag = None
+        self.reason = 'ещё не проверялась'
+        self.down_until = 0.0
+        self.stats = {'reads': 0, 'failures': 0, 'removed': 0}
+
+    def mark_down(self, reason, retry_after=None):
+        was_healthy = self.healthy
+        self.healthy = False
+        self.reason = str(reason)
+        self.down_until = time.monotonic() + (REPLICA_CONFIG['retry_after'] if retry_after is None else retry_after)
+        if was_healthy:
+            self.stats['removed'] += 1
+            print(f"Реплика {self.name} выведена из ротации: {reason}")
+
+    def check(self):
+        """Проверить соединение и отставание; вернуть отставание в секундах или None"""
+        errors = []
+        connection = _acquire(self.pool, on_error=errors.append)
+        if connection is None:
+            self.stats['failures'] += 1
+            self.mark_down(errors[0] if errors else 'нет соединения')
+            return None
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Error:
+                # MySQL до 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            rows = cursor.fetchall()
+        except (InterfaceError, OperationalError) as e:
+            cursor = None
+            connection.invalidate()
+            self.stats['failures'] += 1
+            self.mark_down(e)
+            return None
+        except Error as e:
+            self.mark_down(f"не удалось прочитать статус репликации: {e}")
+            return None
+        finally:
+            if cursor is not None:
+                cursor.close()
+            connection.close()
+
+        if not rows:
+            self.mark_down('сервер не является репликой')
+            return None
+        status = rows[0]
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        self.lag = lag
+        if lag is None:
+            self.mark_down('репликация остановлена', retry_after=0)
+        elif lag > REPLICA_CONFIG['max_lag']:
+            self.mark_down(f'отставание {lag} с', retry_after=0)
+        else:
+            if not self.healthy:
+                print(f"Реплика {self.name} в ротации (отставание {lag} с)")
+            self.healthy = True
+            self.reason = None
+        return lag
+
+
+class ReplicaSet:
+    """Реплики процесса, выбор по кругу и фоновая проверка отставания"""
+
+    def __init__(self, configs):
+        self.replicas = [Replica(config) for config in configs]
+        self.pid = os.getpid()
+        self._next = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def choose(self):
+        """Следующая реплика в ротации или None"""
+        self._ensure_checker()
+        with self._lock:
+            count = len(self.replicas)
+            for step in range(count):
+                replica = self.replicas[(self._next + step) % count]
+                if replica.healthy:
+                    self._next = (self._next + step + 1) % count
+                    return replica
+        return None
+
+    def check_all(self):
+        now = time.monotonic()
+        for replica in self.replicas:
+            if replica.healthy or now >= replica.down_until:
+                replica.check()
+
+    def _check_forever(self):
+        while True:
+            try:
+                self.check_all()
+            except Exception as e:
+                print(f"Ошибка проверки реплик: {e}")
+            time.sleep(REPLICA_CONFIG['check_interval'])
+
+    def _ensure_checker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._check_forever, name='mgorki-replicas', daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        return [dict(replica.stats, name=replica.name, healthy=replica.healthy, lag=replica.lag,
+                     reason=replica.reason, pool=replica.pool.stats())
+                for replica in self.replicas]
+
+
+_replica_set = None
+
+
+def get_replica_set():
+    """Реплики текущего процесса (создаются лениво и заново после fork) или None"""
+    global _replica_set
+    if not DB_REPLICAS:
+        return None
+    replica_set = _replica_set
+    if replica_set is None or replica_set.pid != os.getpid():
+        with _pool_lock:
+            if _replica_set is None or _replica_set.pid != os.getpid():
+                _replica_set = ReplicaSet(DB_REPLICAS)
+            replica_set = _replica_set
+    return replica_set
+
+
+def get_replica_stats():
+    """Реплики: в ротации ли, отставание, чтения и ошибки"""
+    replica_set = get_replica_set()
+    return replica_set.stats() if replica_set is not None else []
+
+
+_REPLICA_MISS = object()
+
+
+def _read_from_replica(query, params):
+    """Выполнить SELECT на реплике; _REPLICA_MISS - реплики нет или она отказала"""
+    replica_set = get_replica_set()
+    replica = replica_set.choose() if replica_set is not None else None
+    if replica is None:
+        return _REPLICA_MISS
+    connection = _acquire(replica.pool, on_error=lambda e: replica.mark_down(e))
+    if connection is None:
+        replica.stats['failures'] += 1
+        return _REPLICA_MISS
+    cursor = None
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, params or ())
+        result = cursor.fetchall()
+        replica.stats['reads'] += 1
+        return result
+    except (InterfaceError, OperationalError) as e:
+        # Сетевая ошибка - запрос повторяется на основной
+        cursor = None
+        connection.invalidate()
+        replica.stats['failures'] += 1
+        replica.mark_down(e)
+        return _REPLICA_MISS
     except Error as e:
-        print(f"Ошибка подключения к БД: {e}")
+        print(f"Ошибка выполнения запроса: {e}")
         return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
 
 
-def execute_query(query, params=None, fetch=True):
-    """Выполнить запрос и вернуть результат"""
-    connection = get_connection()
+def execute_query(query, params=None, fetch=True, primary=False):
+    """Выполнить запрос и вернуть результат.
+
+    SELECT вне окна записи уходит на реплику (если они есть);
+    primary=True - читать только с основной. Внутри transaction() -
+    на соединении транзакции.
+    """
+    tx = _current_transaction()
+    if tx is not None:
+        return tx._execute(query, params, 'rows' if fetch else 'lastrowid')
+    if fetch and DB_REPLICAS and not primary and not primary_pinned() \
+            and getattr(_explain, 'plans', None) is None and _is_read_only(query):
+        result = _read_from_replica(query, params)
+        if result is not _REPLICA_MISS:
+            return result
+    if not fetch:
+        _mark_write()
+    connection = _acquire(get_pool())
     if not connection:
         return None
+    cursor = None
     try:
         cursor = connection.cursor(dictionary=True)
         cursor.execute(query, params or ())
         if fetch:
             result = cursor.fetchall()
         else:
-            connection.commit()
+            if connection.in_transaction:
+                connection.commit()
             result = cursor.lastrowid
         return result
+    except (InterfaceError, OperationalError) as e:
+        print(f"Ошибка выполнения запроса: {e}")
+        cursor = None
+        connection.invalidate()
+        return None
     except Error as e:
         print(f"Ошибка выполнения запроса: {e}")
         return None
     finally:
-        if connection.is_connected():
+        if cursor is not None:
             cursor.close()
-            connection.close()
+        connection.close()
+
+
+def execute_update(query, params=None):
+    """Выполнить изменяющий запрос и вернуть (rowcount, lastrowid)"""
+    tx = _current_transaction()
+    if tx is not None:
+        return tx._execute(query, params, 'update')
+    connection = get_connection()
+    if not connection:
+        return None
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(query, params or ())
+        if connection.in_transaction:
+            connection.commit()
+        return cursor.rowcount, cursor.lastrowid
+    except (InterfaceError, OperationalError) as e:
+        print(f"Ошибка выполнения запроса: {e}")
+        cursor = None
+        connection.invalidate()
+        return None
+    except Error as e:
+        print(f"Ошибка выполнения запроса: {e}")
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
+
+
+# ===================================================================================
+# ТРАНЗАКЦИИ
+# ===================================================================================
+#
+#     with db.transaction() as tx:
+#         status, session_id = db.reserve_seats(...)
+#         booking_id = db.create_booking(...)
+#         with tx.savepoint():
+#             ...
+#
+# Внутри блока execute_query/execute_update этого потока (и все функции
+# модуля поверх них) выполняются на одном соединении с основной БД без
+# отдельных COMMIT; в конце блока - один COMMIT, при исключении - ROLLBACK.
+# Ошибка запроса внутри блока по-прежнему даёт None из функции, но
+# транзакция запоминает её: на выходе из блока всё откатывается и
+# поднимается TransactionError, даже если вызывающий код None не проверил.
+# Вложенный transaction() - это точка сохранения внешней транзакции.
+
+class TransactionError(Error):
+    """Транзакция откачена из-за ошибки запроса внутри неё"""
+
+
+_transactions = threading.local()
+
+
+def _current_transaction():
+    return getattr(_transactions, 'current', None)
+
+
+class Transaction:
+    """Единица работы на одном соединении из пула"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.failed = None          # первая ошибка запроса
+        self.finished = False
+        self.statements = 0
+        self._savepoints = 0
+
+    def _execute(self, query, params, fetch):
+        """Как execute_query/execute_update, но без COMMIT: None при ошибке"""
+        if self.finished:
+            raise TransactionError("Транзакция уже завершена")
+        cursor = None
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            cursor.execute(query, params or ())
+            self.statements += 1
+            if fetch == 'rows':
+                return cursor.fetchall()
+            if fetch == 'update':
+                return cursor.rowcount, cursor.lastrowid
+            return cursor.lastrowid
+        except Error as e:
+            print(f"Ошибка выполнения запроса в транзакции: {e}")
+            if self.failed is None:
+                self.failed = e
+            return None
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def execute(self, query, params=None):
+        """Изменяющий запрос: (rowcount, lastrowid) или None"""
+        return self._execute(query, params, 'update')
+
+    def query(self, query, params=None):
+        """Выборка: список строк-словарей или None"""
+        return self._execute(query, params, 'rows')
+
+    def insert_many(self, table, columns, rows, batch_size=None, ignore=False):
+        """Вставить строки многострочными INSERT по batch_size; число вставленных или None"""
+        batch_size = batch_size or SCHEDULE_CONFIG['batch_size']
+        rows = list(rows)
+        row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        head = f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) VALUES "
+        inserted = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            result = self.execute(head + ', '.join([row_sql] * len(batch)), [v for row in batch for v in row])
+            if result is None:
+                return None
+            inserted += result[0]
+        return inserted
+
+    @contextmanager
+    def savepoint(self):
+        """Точка сохранения: ошибка внутри откатывает только её и поднимается наружу"""
+        self._savepoints += 1
+        name = f"sp_{self._savepoints}"
+        failed_before = self.failed
+        if self.execute(f"SAVEPOINT {name}") is None:
+            raise TransactionError(str(self.failed))
+        try:
+            yield self
+        except BaseException:
+            self._rollback_to(name, failed_before)
+            raise
+        if self.failed is not failed_before:
+            error = self.failed
+            self._rollback_to(name, failed_before)
+            raise TransactionError(str(error))
+        self.execute(f"RELEASE SAVEPOINT {name}")
+
+    def _rollback_to(self, name, failed_before):
+        self.failed = failed_before
+        if self.execute(f"ROLLBACK TO SAVEPOINT {name}") is None:
+            # Например, после взаимоблокировки MySQL уже откатил всю транзакцию
+            raise TransactionError(str(self.failed))
+
+    def rollback(self):
+        """Откатить всё и закончить транзакцию (выход из блока ничего не фиксирует)"""
+        if not self.finished:
+            self.finished = True
+            try:
+                self.connection.rollback()
+            except Error as e:
+                print(f"Ошибка отката транзакции: {e}")
+
+    def commit(self):
+        if self.finished:
+            return
+        if self.failed is not None:
+            self.rollback()
+            raise TransactionError(str(self.failed))
+        self.finished = True
+        self.connection.commit()
+
+
+@contextmanager
+def transaction():
+    """Единица работы: один COMMIT на все запросы блока (см. выше)"""
+    outer = _current_transaction()
+    if outer is not None:
+        with outer.savepoint():
+            yield outer
+        return
+
+    connection = get_connection()
+    if not connection:
+        raise TransactionError("Нет соединения с БД")
+    tx = Transaction(connection)
+    try:
+        connection.start_transaction()
+        _transactions.current = tx
+        try:
+            yield tx
+        finally:
+            _transactions.current = None
+        tx.commit()
+    except (InterfaceError, OperationalError):
+        tx.finished = True
+        connection.invalidate()
+        raise
+    except BaseException:
+        tx.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+# ===================================================================================
+# КЭШ ЗАПРОСОВ
+# ===================================================================================
+
+class QueryCache:
+    """Кэш результатов запросов в памяти процесса: TTL, вытеснение LRU
+    и версия каждой таблицы, которая растёт при любой записи в неё.
+
+    Ключ - кортеж (таблица, вид выборки, аргумент). Значения отдаются
+    без копирования, поэтому изменять полученные списки и словари нельзя.
+    Другие воркеры узнают об изменениях не позже, чем через ttl секунд.
+    """
+
+    def __init__(self, ttl=300, max_entries=2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._versions = {}
+        self._written = {}   # таблица -> time.monotonic() последней записи
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def version(self, table):
+        """Текущая версия таблицы (меняется при каждой записи)"""
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+            version = self._versions.get(key[0], 0)
+
+        value = loader()
+        if value is None:
+            # Ошибку БД не кэшируем
+            return value
+
+        with self._lock:
+            # Если таблицу изменили, пока шёл запрос, результат мог устареть
+            if self._versions.get(key[0], 0) == version:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, table, *keys):
+        """Удалить указанные ключи таблицы и поднять её версию"""
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            self._written[table] = time.monotonic()
+            for key in keys:
+                if self._entries.pop((table,) + key, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def written_within(self, table, seconds):
+        """Таблицу меняли в этом процессе за последние seconds секунд"""
+        with self._lock:
+            written = self._written.get(table)
+        return written is not None and time.monotonic() - written < seconds
+
+    def clear(self):
+        with self._lock:
+            for table in {key[0] for key in self._entries}:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['entries'] = len(self._entries)
+            result['versions'] = dict(self._versions)
+        lookups = result['hits'] + result['misses']
+        result['hit_ratio'] = result['hits'] / lookups if lookups else 0.0
+        return result
+
+
+query_cache = QueryCache(**CACHE_CONFIG)
+
+
+def cached_query(key, query, params=None):
+    """SELECT через кэш: key = (таблица, вид выборки, аргумент)"""
+    # Недавно изменённое перечитываем с основной: отстающая реплика
+    # положила бы в кэш старые данные на весь ttl
+    def load():
+        primary = bool(DB_REPLICAS) and query_cache.written_within(
+            key[0], REPLICA_CONFIG['pin_seconds'] + REPLICA_CONFIG['max_lag'])
+        return execute_query(query, params, primary=primary)
+    return query_cache.get_or_load(key, load)
+
+
+def get_table_version(table):
+    """Версия таблицы в кэше этого процесса"""
+    return query_cache.version(table)
+
+
+def get_cache_stats():
+    """Попадания/промахи кэша и версии таблиц"""
+    return query_cache.stats()
 
 
 # ===================================================================================
@@ -50,26 +1060,59 @@ def execute_query(query, params=None, fetch=True):
 def get_content_by_category(category):
     """Получить контент по категории"""
     query = "SELECT * FROM data_content WHERE category = %s"
-    return execute_query(query, (category,))
+    return cached_query(('data_content', 'category', category), query, (category,))
 
 
 def get_content_by_id(content_id):
     """Получить контент по ID"""
     query = "SELECT * FROM data_content WHERE id = %s"
-    result = execute_query(query, (content_id,))
+    result = cached_query(('data_content', 'id', int(content_id)), query, (content_id,))
     return result[0] if result else None
 
 
-def search_content(query_text):
-    """Поиск по названию или описанию (выставки, экскурсии, афиша)"""
+def get_content_revision(content_id):
+    """Версия и время изменения записи (для ETag / Last-Modified) или None"""
+    query = "SELECT id, revision, updated_at FROM data_content WHERE id = %s"
+    result = cached_query(('data_content', 'revision', int(content_id)), query, (content_id,))
+    return result[0] if result else None
+
+
+def get_category_revision(category):
+    """Сводная версия списка категории: число записей, старший id, сумма версий, время изменения"""
     query = """
-        SELECT id, category, title_card, short_description_card, img_card 
-        FROM data_content 
-        WHERE (title_card LIKE %s OR short_description_card LIKE %s)
-          AND category IN ('virtual_exhibitions', 'poster', 'museums')
+        SELECT COUNT(*) AS items, MAX(id) AS max_id,
+               SUM(revision) AS revisions, MAX(updated_at) AS updated_at
+        FROM data_content WHERE category = %s
     """
-    like_param = f"%{query_text}%"
-    return execute_query(query, (like_param, like_param))
+    result = cached_query(('data_content', 'revisions', category), query, (category,))
+    return result[0] if result else None
+
+
+def _content_category(content_id):
+    """Категория записи data_content (для точечной инвалидации кэша)"""
+    result = execute_query("SELECT category FROM data_content WHERE id = %s", (content_id,))
+    return result[0]['category'] if result else None
+
+
+_content_listeners = []
+
+
+def add_content_listener(callback):
+    """Подписаться на изменения data_content: callback(content_id)"""
+    _content_listeners.append(callback)
+
+
+def invalidate_content(content_id=None, *categories):
+    """Сбросить кэш записи data_content и списков её категорий"""
+    keys = [(kind, c) for c in categories if c for kind in ('category', 'revisions')]
+    if content_id:
+        keys += [('id', int(content_id)), ('revision', int(content_id))]
+    query_cache.invalidate('data_content', *keys)
+    for callback in _content_listeners:
+        try:
+            callback(content_id)
+        except Exception as e:
+            print(f"Ошибка обработчика изменения контента: {e}")
 
 
 # ===================================================================================
@@ -79,26 +1122,42 @@ def search_content(query_text):
 def get_all_ticket_categories():
     """Получить все категории билетов"""
     query = "SELECT * FROM ticket_categories"
-    return execute_query(query)
+    return cached_query(('ticket_categories', 'all', None), query)
 
 def get_ticket_categories_by_type(category_type):
     """Получить категории билетов по типу (museum, poster)"""
     query = "SELECT * FROM ticket_categories WHERE category = %s"
-    return execute_query(query, (category_type,))
+    return cached_query(('ticket_categories', 'type', category_type), query, (category_type,))
 
 
 def get_ticket_category_by_id(category_id):
     """Получить категорию билета по ID"""
     query = "SELECT * FROM ticket_categories WHERE id = %s"
-    result = execute_query(query, (category_id,))
+    result = cached_query(('ticket_categories', 'id', int(category_id)), query, (category_id,))
     return result[0] if result else None
 
+
+def _ticket_category_type(cat_id):
+    result = execute_query("SELECT category FROM ticket_categories WHERE id = %s", (cat_id,))
+    return result[0]['category'] if result else None
+
+
+def invalidate_ticket_category(cat_id=None, *category_types):
+    """Сбросить кэш категории билета и списков, где она встречается"""
+    keys = [('all', None)] + [('type', t) for t in category_types if t]
+    if cat_id:
+        keys.append(('id', int(cat_id)))
+    query_cache.invalidate('ticket_categories', *keys)
+
+
 def insert_ticket_category(category_type, title, description, price):
     query = """
         INSERT INTO ticket_categories (category, title, description, price)
         VALUES (%s, %s, %s, %s)
     """
-    return execute_query(query, (category_type, title, description, price), fetch=False)
+    new_id = execute_query(query, (category_type, title, description, price), fetch=False)
+    invalidate_ticket_category(new_id, category_type)
+    return new_id
 
 def update_ticket_category(cat_id, category_type, title, description, price):
     query = """
@@ -106,11 +1165,17 @@ def update_ticket_category(cat_id, category_type, title, description, price):
         SET category=%s, title=%s, description=%s, price=%s
         WHERE id=%s
     """
-    return execute_query(query, (category_type, title, description, price, cat_id), fetch=False)
+    old_type = _ticket_category_type(cat_id)
+    result = execute_query(query, (category_type, title, description, price, cat_id), fetch=False)
+    invalidate_ticket_category(cat_id, category_type, old_type)
+    return result
 
 def delete_ticket_category(cat_id):
     query = "DELETE FROM ticket_categories WHERE id = %s"
-    return execute_query(query, (cat_id,), fetch=False)
+    old_type = _ticket_category_type(cat_id)
+    result = execute_query(query, (cat_id,), fetch=False)
+    invalidate_ticket_category(cat_id, old_type)
+    return result
 
 
 # ===================================================================================
@@ -130,6 +1195,19 @@ def get_active_sessions(event_id, start_date, end_date):
     return execute_query(query, (event_id, start_date, end_date))
 
 
+def get_sessions_availability(event_id, start_date, end_date):
+    """Только то, что нужно странице заказа: id, дата, время и свободные места"""
+    query = """
+        SELECT id, session_date, session_time, available_tickets FROM session_schedule
+        WHERE is_active = 1
+        AND event_id = %s
+        AND session_date >= %s
+        AND session_date <= %s
+        ORDER BY session_date, session_time
+    """
+    return execute_query(query, (event_id, start_date, end_date))
+
+
 def get_session_by_date_time(event_id, session_date, session_time):
     """Получить сеанс по дате и времени для конкретного события"""
     query = "SELECT * FROM session_schedule WHERE event_id = %s AND session_date = %s AND session_time = %s"
@@ -146,56 +1224,230 @@ def update_session_tickets(session_id, available, sold):
     return execute_query(query, (available, sold, session_id), fetch=False)
 
 
-def generate_weekly_schedule():
-    """Создает расписание билетов на 7 дней вперед при каждом запуске проекта"""
+# Результаты reserve_seats
+RESERVE_OK = 'ok'
+RESERVE_SOLD_OUT = 'sold_out'
+RESERVE_NOT_FOUND = 'not_found'
+RESERVE_ERROR = 'error'
+
+
+def reserve_seats(event_id, session_date, session_time, quantity):
+    """Атомарно списать места сеанса одним условным UPDATE.
+
+    Списание происходит только если мест хватает, поэтому параллельные
+    покупатели не могут продать больше, чем есть. id сеанса возвращается
+    через LAST_INSERT_ID(id) без отдельного SELECT. Результат - пара
+    (статус, session_id), статус - одна из констант RESERVE_*.
+    """
+    query = """
+        UPDATE session_schedule
+        SET available_tickets = available_tickets - %s,
+            sold_tickets = sold_tickets + %s,
+            id = LAST_INSERT_ID(id)
+        WHERE event_id = %s AND session_date = %s AND session_time = %s
+          AND is_active = 1
+          AND available_tickets >= %s
+    """
+    result = execute_update(query, (quantity, quantity, event_id, session_date, session_time, quantity))
+    if result is None:
+        return RESERVE_ERROR, None
+    rowcount, session_id = result
+    if rowcount == 1:
+        return RESERVE_OK, session_id
+
+    # Медленный путь только при отказе: отличаем "нет мест" от "нет сеанса"
+    session_obj = get_session_by_date_time(event_id, session_date, session_time)
+    if not session_obj or not session_obj.get('is_active'):
+        return RESERVE_NOT_FOUND, None
+    return RESERVE_SOLD_OUT, session_obj['id']
+
+
+def release_seats(session_id, quantity):
+    """Вернуть ранее списанные места сеанса"""
+    query = """
+        UPDATE session_schedule
+        SET available_tickets = available_tickets + %s,
+            sold_tickets = sold_tickets - %s
+        WHERE id = %s AND sold_tickets >= %s
+    """
+    result = execute_update(query, (quantity, quantity, session_id, quantity))
+    return bool(result and result[0] == 1)
+
+
+# Дни недели в порядке date.weekday()
+WEEKDAY_NAMES = ('ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ', 'ВС')
+
+
+def _as_time(value):
+    """'10:00' / '10:00:00' / timedelta из MySQL -> timedelta"""
+    if isinstance(value, timedelta):
+        return value
+    parts = [int(p) for p in str(value).split(':')]
+    parts += [0] * (3 - len(parts))
+    return timedelta(hours=parts[0], minutes=parts[1], seconds=parts[2])
+
+
+def missing_schedule_slots(event_ids, existing, start_date, horizon_days, slot_times):
+    """Слоты (event_id, дата, время), которых ещё нет в existing"""
+    times = [_as_time(t) for t in slot_times]
+    dates = [start_date + timedelta(days=i) for i in range(horizon_days)]
+    return [(event_id, day, t)
+            for event_id in event_ids
+            for day in dates
+            for t in times
+            if (event_id, day, t) not in existing]
+
+
+def generate_weekly_schedule(horizon_days=None, slot_times=None, total_tickets=None):
+    """Достроить расписание сеансов на horizon_days дней вперёд.
+
+    Вставляются только отсутствующие слоты, пачками многострочных INSERT,
+    в одной транзакции. Возвращает словарь со статистикой или None при ошибке.
+    """
+    horizon_days = horizon_days or SCHEDULE_CONFIG['horizon_days']
+    slot_times = slot_times or SCHEDULE_CONFIG['slot_times']
+    total_tickets = total_tickets or SCHEDULE_CONFIG['total_tickets']
+    batch_size = SCHEDULE_CONFIG['batch_size']
+
     connection = get_connection()
     if not connection:
-        return
+        return None
+    cursor = None
+    started = time.perf_counter()
     try:
-        cursor = connection.cursor(dictionary=True)
+        connection.start_transaction()
+        cursor = connection.cursor()
+        cursor.execute("SELECT CURDATE()")
+        today = cursor.fetchone()[0]
+        end_date = today + timedelta(days=horizon_days - 1)
+
+        # 1. Прошедшие сеансы больше не продаются
+        cursor.execute("UPDATE session_schedule SET is_active = 0 WHERE session_date < %s AND is_active = 1",
+                       (today,))
+        deactivated = cursor.rowcount
+
+        # 2. Какие слоты уже есть в окне расписания
         cursor.execute("SELECT id FROM data_content")
-        events = cursor.fetchall()
-        
-        # 1. Удаляем всё, что старше сегодняшнего дня
-        cursor.execute("UPDATE session_schedule SET is_active = 0 WHERE session_date < CURDATE()")
+        event_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT event_id, session_date, session_time
+            FROM session_schedule
+            WHERE session_date BETWEEN %s AND %s
+        """, (today, end_date))
+        existing = {(event_id, day, _as_time(t)) for event_id, day, t in cursor.fetchall()}
 
-        # 2. Создаем расписание на 7 дней вперед (от 0 до 6)
+        # 3. Вставляем только недостающие, пачками
+        missing = missing_schedule_slots(event_ids, existing, today, horizon_days, slot_times)
         query = """
             INSERT IGNORE INTO session_schedule
             (event_id, session_date, session_time, day_of_week, total_tickets, available_tickets, sold_tickets, is_active)
-            VALUES (
-                %s,
-                CURDATE() + INTERVAL %s DAY,
-                %s,
-                ELT(DAYOFWEEK(CURDATE() + INTERVAL %s DAY), 'ВС', 'ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ'),
-                50, 50, 0, 1
-            )
+            VALUES (%s, %s, %s, %s, %s, %s, 0, 1)
         """
-
-        times = ['10:00:00', '14:00:00', '18:00:00']
-
-        for event in events:
-            for i in range(7):
-                for t in times:
-                    cursor.execute(query, (event['id'], i, t, i))
+        inserted = 0
+        statements = 0
+        for i in range(0, len(missing), batch_size):
+            rows = [(event_id, day, str(t), WEEKDAY_NAMES[day.weekday()], total_tickets, total_tickets)
+                    for event_id, day, t in missing[i:i + batch_size]]
+            cursor.executemany(query, rows)
+            inserted += cursor.rowcount
+            statements += 1
 
         connection.commit()
-        print("Недельное расписание билетов успешно сгенерировано/обновлено.")
+        stats = {
+            'events': len(event_ids),
+            'existing': len(existing),
+            'missing': len(missing),
+            'inserted': inserted,
+            'deactivated': deactivated,
+            'insert_statements': statements,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+        print(f"Расписание сеансов обновлено: {stats}")
+        return stats
     except Error as e:
         print(f"Ошибка при генерации расписания: {e}")
+        return None
     finally:
-        if connection.is_connected():
+        if cursor is not None:
             cursor.close()
-            connection.close()
+        connection.close()
 
-def get_all_sessions_with_events():
-    query = """
+SESSIONS_PAGE_SIZE = 50
+
+
+def _sessions_filter(date_from=None, date_to=None, event_id=None, is_active=None):
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append("s.session_date >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("s.session_date <= %s")
+        params.append(date_to)
+    if event_id:
+        conditions.append("s.event_id = %s")
+        params.append(int(event_id))
+    if is_active is not None:
+        conditions.append("s.is_active = %s")
+        params.append(1 if is_active else 0)
+    return conditions, params
+
+
+def session_cursor(row):
+    """Ключ строки для пагинации: 'ГГГГ-ММ-ДД_ЧЧ:ММ:СС_id'"""
+    return f"{row['session_date']}_{_as_time(row['session_time'])}_{row['id']}"
+
+
+def parse_session_cursor(cursor):
+    """Обратное к session_cursor; None для мусора"""
+    try:
+        session_date, session_time, session_id = cursor.split('_')
+        return date.fromisoformat(session_date), _as_time(session_time), int(session_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_sessions_page(date_from=None, date_to=None, event_id=None, is_active=None,
+                      after=None, limit=SESSIONS_PAGE_SIZE):
+    """Страница расписания для админки: даты по убыванию, время по возрастанию.
+
+    after - ключ последней строки предыдущей страницы (session_cursor).
+    Порядок совпадает с индексами (…, session_date DESC, session_time),
+    поэтому страница читается как короткий диапазон индекса.
+    Возвращает (сеансы, ключ следующей страницы или None).
+    """
+    conditions, params = _sessions_filter(date_from, date_to, event_id, is_active)
+    key = parse_session_cursor(after) if after else None
+    if key:
+        session_date, session_time, session_id = key
+        conditions.append("""(s.session_date < %s OR (s.session_date = %s AND
+            (s.session_time > %s OR (s.session_time = %s AND s.id > %s))))""")
+        params += [session_date, session_date, session_time, session_time, session_id]
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
         SELECT s.*, d.title_card as event_title
         FROM session_schedule s
         JOIN data_content d ON s.event_id = d.id
-        ORDER BY s.session_date DESC, s.session_time ASC
+        {where}
+        ORDER BY s.session_date DESC, s.session_time ASC, s.id ASC
+        LIMIT %s
     """
-    return execute_query(query)
+    rows = execute_query(query, params + [limit + 1])
+    if rows is None:
+        return None, None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, session_cursor(rows[-1])
+    return rows, None
+
+
+def count_sessions(date_from=None, date_to=None, event_id=None, is_active=None):
+    """Число сеансов под фильтром (по индексу, без JOIN)"""
+    conditions, params = _sessions_filter(date_from, date_to, event_id, is_active)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    result = execute_query(f"SELECT COUNT(*) AS total FROM session_schedule s {where}", params)
+    return result[0]['total'] if result else None
 
 def get_session_by_id(session_id):
     query = "SELECT * FROM session_schedule WHERE id = %s"
@@ -246,6 +1498,12 @@ def create_booking(session_id, ticket_category_id, user_email, user_phone, quant
                           booking_code), fetch=False)
 
 
+def cancel_booking(booking_id):
+    """Отменить бронирование (места возвращаются отдельно)"""
+    query = "UPDATE ticket_bookings SET booking_status = 'cancelled' WHERE id = %s"
+    return execute_query(query, (booking_id,), fetch=False)
+
+
 # ===================================================================================
 # ФУНКЦИИ ДЛЯ orders
 # ===================================================================================
@@ -269,6 +1527,57 @@ def get_order_by_id(order_id):
     return result[0] if result else None
 
 
+def get_order_ticket(order_id):
+    """Заказ с сеансом брони: всё, что нужно для подписанного токена билета"""
+    query = """
+        SELECT o.id, o.payment_status, o.order_status, b.session_id, s.session_date, s.session_time
+        FROM orders o
+        JOIN ticket_bookings b ON b.id = o.booking_id
+        JOIN session_schedule s ON s.id = b.session_id
+        WHERE o.id = %s
+    """
+    result = execute_query(query, (order_id,))
+    return result[0] if result else None
+
+
+def set_order_qr_token(order_id, qr_code_token):
+    """Заменить токен билета (и ссылку на проверку) заказа"""
+    query = "UPDATE orders SET qr_code_token = %s, qr_code_url = %s WHERE id = %s"
+    return execute_query(query, (qr_code_token, f"/qr/{qr_code_token}", order_id), fetch=False)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def get_order_ids_by_tokens(tokens):
+    """{токен: id заказа} для старых (случайных) токенов одним запросом; None при ошибке"""
+    query = f"SELECT id, qr_code_token FROM orders WHERE qr_code_token IN ({_placeholders(tokens)})"
+    result = execute_query(query, tuple(tokens), primary=True)
+    return None if result is None else {row['qr_code_token']: row['id'] for row in result}
+
+
+def get_checkin_states(order_ids):
+    """{id: строка} с оплатой, статусом и отметкой прохода для пачки заказов; None при ошибке"""
+    query = f"""
+        SELECT id, payment_status, order_status, ticket_verified
+        FROM orders WHERE id IN ({_placeholders(order_ids)})
+    """
+    result = execute_query(query, tuple(order_ids), primary=True)
+    return None if result is None else {row['id']: row for row in result}
+
+
+def mark_tickets_verified(order_ids):
+    """Отметить проход по многим оплаченным и не отменённым заказам; число изменённых строк или None при ошибке"""
+    query = f"""
+        UPDATE orders SET ticket_verified = 1
+        WHERE id IN ({_placeholders(order_ids)}) AND ticket_verified = 0
+          AND payment_status = 'paid' AND order_status <> 'cancelled'
+    """
+    result = execute_update(query, tuple(order_ids))
+    return None if result is None else result[0]
+
+
 # ===================================================================================
 # ФУНКЦИИ ДЛЯ АДМИНКИ
 # ===================================================================================
@@ -292,7 +1601,9 @@ def insert_content(category, title, short_desc, img_card,
               date_event, location_event,
               main_image, main_text,
               b_img1, b_txt1, b_img2, b_txt2, b_img3, b_txt3)
-    return execute_query(query, params, fetch=False)
+    new_id = execute_query(query, params, fetch=False)
+    invalidate_content(new_id, category)
+    return new_id
 
 
 def update_content(content_id, title, short_desc, img_card,
@@ -307,29 +1618,213 @@ def update_content(content_id, title, short_desc, img_card,
             main_image=%s, main_text=%s,
             block_image_1=%s, block_text_1=%s,
             block_image_2=%s, block_text_2=%s,
-            block_image_3=%s, block_text_3=%s
+            block_image_3=%s, block_text_3=%s,
+            revision = revision + 1
         WHERE id=%s
     """
     params = (title, short_desc, img_card,
               date_event, location_event,
               main_image, main_text,
               b_img1, b_txt1, b_img2, b_txt2, b_img3, b_txt3, content_id)
-    return execute_query(query, params, fetch=False)
+    category = _content_category(content_id)
+    result = execute_query(query, params, fetch=False)
+    invalidate_content(content_id, category)
+    return result
 
 
 def delete_content(content_id):
     """Удалить контент"""
     query = "DELETE FROM data_content WHERE id = %s"
-    return execute_query(query, (content_id,), fetch=False)
+    category = _content_category(content_id)
+    result = execute_query(query, (content_id,), fetch=False)
+    invalidate_content(content_id, category)
+    return result
+
+
+ORDERS_PAGE_SIZE = 50
+
+
+def get_orders_page(order_status=None, payment_status=None, date_from=None, date_to=None,
+                    before_id=None, limit=ORDERS_PAGE_SIZE):
+    """Страница заказов для админки, новые сверху.
+
+    Пагинация по ключу: следующая страница начинается с заказов, у которых
+    id меньше before_id, поэтому стоимость не зависит от номера страницы.
+    Возвращает (заказы, before_id для следующей страницы или None).
+    """
+    conditions = []
+    params = []
+    if order_status:
+        conditions.append("order_status = %s")
+        params.append(order_status)
+    if payment_status:
+        conditions.append("payment_status = %s")
+        params.append(payment_status)
+    if date_from:
+        conditions.append("created_at >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("created_at < %s + INTERVAL 1 DAY")
+        params.append(date_to)
+    if before_id:
+        conditions.append("id < %s")
+        params.append(int(before_id))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"SELECT * FROM orders {where} ORDER BY id DESC LIMIT %s"
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = execute_query(query, params + [limit + 1])
+    if rows is None:
+        return None, None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]['id']
+    return rows, None
+
 
+def get_recent_orders(limit=5):
+    """Последние заказы для дашборда"""
+    return execute_query("SELECT * FROM orders ORDER BY id DESC LIMIT %s", (limit,))
 
-def get_all_orders():
-    """Получить все заказы для админки"""
-    query = "SELECT * FROM orders ORDER BY id DESC"
-    return execute_query(query)
+
+def get_order_stats():
+    """Счётчики заказов для дашборда.
+
+    Читаются из order_stats, которую ведут триггеры на orders, - несколько
+    строк при любом числе заказов. Если таблицы ещё нет (старая схема),
+    считаются агрегатом по orders.
+    """
+    rows = execute_query("SELECT order_status, payment_status, orders_count, amount_total FROM order_stats")
+    if rows is None:
+        rows = execute_query("""
+            SELECT order_status, payment_status, COUNT(*) AS orders_count, SUM(total_amount) AS amount_total
+            FROM orders
+            GROUP BY order_status, payment_status
+        """) or []
+
+    stats = {'total': 0, 'paid': 0, 'unpaid': 0, 'cancelled': 0, 'revenue': 0, 'by_status': {}}
+    for row in rows:
+        count = int(row['orders_count'])
+        stats['total'] += count
+        status = row['order_status'] or 'new'
+        stats['by_status'][status] = stats['by_status'].get(status, 0) + count
+        if status == 'cancelled':
+            stats['cancelled'] += count
+        elif row['payment_status'] == 'paid':
+            stats['paid'] += count
+            stats['revenue'] += row['amount_total'] or 0
+        elif row['payment_status'] in ('unpaid', '', None):
+            stats['unpaid'] += count
+    return stats
 
 
 def update_order_status(order_id, status):
     """Обновить статус заказа"""
     query = "UPDATE orders SET order_status = %s WHERE id = %s"
     return execute_query(query, (status, order_id), fetch=False)
+
+
+# ===================================================================================
+# ОБСЛУЖИВАНИЕ (фоновые задачи, см. jobs.py)
+# ===================================================================================
+
+def _expire_unpaid_batch(hold_minutes, batch_size):
+    """Отменить одну пачку просроченных броней и вернуть их места"""
+    connection = get_connection()
+    if not connection:
+        return None
+    cursor = None
+    try:
+        connection.start_transaction()
+        cursor = connection.cursor(dictionary=True)
+        # SKIP LOCKED: брони, которые прямо сейчас оплачиваются, пропускаем
+        cursor.execute("""
+            SELECT b.id AS booking_id, b.session_id, b.quantity, o.id AS order_id
+            FROM ticket_bookings b
+            LEFT JOIN orders o ON o.booking_id = b.id
+            WHERE b.booking_status = 'pending'
+              AND b.created_at < NOW() - INTERVAL %s MINUTE
+              AND (o.id IS NULL
+                   OR (o.payment_status = 'unpaid' AND o.order_status IN ('new', 'awaiting_payment')))
+            ORDER BY b.id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (hold_minutes, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            connection.rollback()
+            return 0
+
+        booking_ids = [row['booking_id'] for row in rows]
+        cursor.execute(
+            f"UPDATE ticket_bookings SET booking_status = 'cancelled' "
+            f"WHERE id IN ({', '.join(['%s'] * len(booking_ids))})", booking_ids)
+
+        order_ids = [row['order_id'] for row in rows if row['order_id']]
+        if order_ids:
+            cursor.execute(
+                f"UPDATE orders SET order_status = 'cancelled' "
+                f"WHERE id IN ({', '.join(['%s'] * len(order_ids))})", order_ids)
+
+        seats = {}
+        for row in rows:
+            seats[row['session_id']] = seats.get(row['session_id'], 0) + row['quantity']
+        # Сеансы обновляем в порядке id, чтобы не ловить взаимные блокировки
+        for session_id in sorted(seats):
+            cursor.execute("""
+                UPDATE session_schedule
+                SET available_tickets = available_tickets + %s,
+                    sold_tickets = GREATEST(sold_tickets - %s, 0)
+                WHERE id = %s
+            """, (seats[session_id], seats[session_id], session_id))
+
+        connection.commit()
+        return len(rows)
+    except Error as e:
+        print(f"Ошибка при отмене просроченных броней: {e}")
+        try:
+            connection.rollback()
+        except Error:
+            connection.invalidate()
+        return None
+    finally:
+        if cursor is not None:
+            cursor.close()
+        connection.close()
+
+
+def expire_unpaid_orders(hold_minutes=30, batch_size=500):
+    """Отменить неоплаченные заказы и брони старше hold_minutes минут.
+
+    Каждая пачка - отдельная транзакция: бронь и заказ отменяются,
+    места возвращаются в session_schedule. Возвращает число отменённых броней.
+    """
+    expired = 0
+    while True:
+        count = _expire_unpaid_batch(hold_minutes, batch_size)
+        if not count:
+            break
+        expired += count
+        if count < batch_size:
+            break
+    return expired
+
+
+def deactivate_past_sessions(batch_size=5000):
+    """Снять с продажи сеансы, которые уже начались. Возвращает число сеансов"""
+    query = """
+        UPDATE session_schedule
+        SET is_active = 0
+        WHERE is_active = 1
+          AND (session_date < CURDATE() OR (session_date = CURDATE() AND session_time < CURTIME()))
+        LIMIT %s
+    """
+    deactivated = 0
+    while True:
+        result = execute_update(query, (batch_size,))
+        if not result:
+            break
+        deactivated += result[0]
+        if result[0] < batch_size:
+            break
+    return deactivated
@@ -42,7 +42,9 @@ CREATE TABLE `data_content` (
   `block_image_2` varchar(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
   `block_text_2` text COLLATE utf8mb4_unicode_ci,
   `block_image_3` varchar(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
-  `block_text_3` text COLLATE utf8mb4_unicode_ci
+  `block_text_3` text COLLATE utf8mb4_unicode_ci,
+  `revision` int NOT NULL DEFAULT '1',
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 --
@@ -92,6 +94,74 @@ CREATE TABLE `orders` (
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+--
+-- Триггеры `orders`: счётчики для дашборда админки в `order_stats`
+--
+DELIMITER $$
+CREATE TRIGGER `orders_stats_insert` AFTER INSERT ON `orders` FOR EACH ROW BEGIN
+  INSERT INTO `order_stats` (`order_status`, `payment_status`, `orders_count`, `amount_total`)
+  VALUES (IFNULL(NEW.order_status, ''), IFNULL(NEW.payment_status, ''), 1, NEW.total_amount)
+  ON DUPLICATE KEY UPDATE `orders_count` = `orders_count` + 1, `amount_total` = `amount_total` + NEW.total_amount;
+END
+$$
+CREATE TRIGGER `orders_stats_update` AFTER UPDATE ON `orders` FOR EACH ROW BEGIN
+  IF NOT (NEW.order_status <=> OLD.order_status)
+     OR NOT (NEW.payment_status <=> OLD.payment_status)
+     OR NEW.total_amount <> OLD.total_amount THEN
+    UPDATE `order_stats`
+      SET `orders_count` = `orders_count` - 1, `amount_total` = `amount_total` - OLD.total_amount
+      WHERE `order_status` = IFNULL(OLD.order_status, '') AND `payment_status` = IFNULL(OLD.payment_status, '');
+    INSERT INTO `order_stats` (`order_status`, `payment_status`, `orders_count`, `amount_total`)
+    VALUES (IFNULL(NEW.order_status, ''), IFNULL(NEW.payment_status, ''), 1, NEW.total_amount)
+    ON DUPLICATE KEY UPDATE `orders_count` = `orders_count` + 1, `amount_total` = `amount_total` + NEW.total_amount;
+  END IF;
+END
+$$
+CREATE TRIGGER `orders_stats_delete` AFTER DELETE ON `orders` FOR EACH ROW BEGIN
+  UPDATE `order_stats`
+    SET `orders_count` = `orders_count` - 1, `amount_total` = `amount_total` - OLD.total_amount
+    WHERE `order_status` = IFNULL(OLD.order_status, '') AND `payment_status` = IFNULL(OLD.payment_status, '');
+END
+$$
+DELIMITER ;
+
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `order_stats`
+--
+
+CREATE TABLE `order_stats` (
+  `order_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+  `payment_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+  `orders_count` int NOT NULL DEFAULT '0',
+  `amount_total` decimal(14,2) NOT NULL DEFAULT '0.00'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `schema_migrations`
+--
+
+CREATE TABLE `schema_migrations` (
+  `version` int NOT NULL,
+  `name` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
+  `applied_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  `duration_ms` int DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+--
+-- Дамп данных таблицы `schema_migrations` (дамп уже содержит эти изменения)
+--
+
+INSERT INTO `schema_migrations` (`version`, `name`, `applied_at`, `duration_ms`) VALUES
+(1, 'Счётчики заказов order_stats для дашборда', '2026-06-15 20:01:00', 0),
+(2, 'Индексы списка заказов в админке', '2026-06-15 20:01:00', 0),
+(3, 'Индексы расписания в админке', '2026-06-15 20:01:00', 0),
+(4, 'Индексы горячих запросов сайта и фоновых задач', '2026-06-15 20:01:00', 0),
+(5, 'Версия и время изменения материалов (ETag / Last-Modified)', '2026-06-15 20:01:00', 0);
+
 -- --------------------------------------------------------
 
 --
@@ -555,7 +625,8 @@ INSERT INTO `ticket_categories` (`id`, `category`, `title`, `description`, `pric
 -- Индексы таблицы `data_content`
 --
 ALTER TABLE `data_content`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_content_category` (`category`,`id`);
 
 --
 -- Индексы таблицы `orders`
@@ -564,14 +635,33 @@ ALTER TABLE `orders`
   ADD PRIMARY KEY (`id`),
   ADD UNIQUE KEY `order_number` (`order_number`),
   ADD UNIQUE KEY `qr_code_token` (`qr_code_token`),
-  ADD KEY `booking_id` (`booking_id`);
+  ADD KEY `booking_id` (`booking_id`),
+  ADD KEY `idx_orders_status_id` (`order_status`,`id`),
+  ADD KEY `idx_orders_payment_id` (`payment_status`,`id`),
+  ADD KEY `idx_orders_created_id` (`created_at`,`id`);
+
+--
+-- Индексы таблицы `order_stats`
+--
+ALTER TABLE `order_stats`
+  ADD PRIMARY KEY (`order_status`,`payment_status`);
+
+--
+-- Индексы таблицы `schema_migrations`
+--
+ALTER TABLE `schema_migrations`
+  ADD PRIMARY KEY (`version`);
 
 --
 -- Индексы таблицы `session_schedule`
 --
 ALTER TABLE `session_schedule`
   ADD PRIMARY KEY (`id`),
-  ADD UNIQUE KEY `unique_event_session` (`event_id`,`session_date`,`session_time`);
+  ADD UNIQUE KEY `unique_event_session` (`event_id`,`session_date`,`session_time`),
+  ADD KEY `idx_sessions_date_time` (`session_date` DESC,`session_time`),
+  ADD KEY `idx_sessions_event_date_time` (`event_id`,`session_date` DESC,`session_time`),
+  ADD KEY `idx_sessions_active_date_time` (`is_active`,`session_date` DESC,`session_time`),
+  ADD KEY `idx_sessions_event_active_date` (`event_id`,`is_active`,`session_date`,`session_time`);
 
 --
 -- Индексы таблицы `ticket_bookings`
@@ -580,13 +670,15 @@ ALTER TABLE `ticket_bookings`
   ADD PRIMARY KEY (`id`),
   ADD UNIQUE KEY `booking_code` (`booking_code`),
   ADD KEY `session_id` (`session_id`),
-  ADD KEY `ticket_category_id` (`ticket_category_id`);
+  ADD KEY `ticket_category_id` (`ticket_category_id`),
+  ADD KEY `idx_bookings_status_created` (`booking_status`,`created_at`);
 
 --
 -- Индексы таблицы `ticket_categories`
 --
 ALTER TABLE `ticket_categories`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_ticket_categories_category` (`category`);
 
 --
 -- AUTO_INCREMENT для сохранённых таблиц
@@ -0,0 +1,74 @@
+"""
+Проверка планов горячих запросов database.py.
+
+Каждая функция из HOT_PATHS вызывается в режиме database.explain_plans():
+запросы не выполняются, вместо них MySQL возвращает EXPLAIN. Проверка
+падает, если какой-то запрос читает таблицу целиком (type = ALL) и у
+MySQL нет подходящего индекса (possible_keys пуст). Полный проход при
+наличии индекса - это выбор оптимизатора на маленькой таблице, он
+выводится как предупреждение.
+
+    flask --app app db-explain
+"""
+from datetime import date, timedelta
+
+import database as db
+
+# Маленькие справочники, которые читаются целиком по замыслу
+FULL_SCAN_ALLOWED = {'ticket_categories', 'order_stats'}
+
+_today = date.today()
+_week_later = _today + timedelta(days=7)
+
+HOT_PATHS = [
+    ('get_content_by_category', lambda: db.get_content_by_category('museums')),
+    ('get_content_by_id', lambda: db.get_content_by_id(1)),
+    ('get_content_revision', lambda: db.get_content_revision(1)),
+    ('get_category_revision', lambda: db.get_category_revision('museums')),
+    ('get_ticket_category_by_id', lambda: db.get_ticket_category_by_id(1)),
+    ('get_active_sessions', lambda: db.get_active_sessions(1, _today, _week_later)),
+    ('get_sessions_availability', lambda: db.get_sessions_availability(1, _today, _week_later)),
+    ('get_session_by_date_time', lambda: db.get_session_by_date_time(1, _today, '10:00:00')),
+    ('reserve_seats', lambda: db.reserve_seats(1, _today, '10:00:00', 1)),
+    ('release_seats', lambda: db.release_seats(1, 1)),
+    ('get_order_by_id', lambda: db.get_order_by_id(1)),
+    ('get_recent_orders', lambda: db.get_recent_orders(5)),
+    ('get_orders_page', lambda: db.get_orders_page()),
+    ('get_orders_page(status)', lambda: db.get_orders_page(order_status='paid', before_id=100)),
+    ('get_orders_page(payment)', lambda: db.get_orders_page(payment_status='unpaid')),
+    ('get_orders_page(dates)', lambda: db.get_orders_page(date_from=_today, date_to=_today)),
+    ('get_sessions_page', lambda: db.get_sessions_page()),
+    ('get_sessions_page(event)', lambda: db.get_sessions_page(event_id=1, after=f'{_today}_10:00:00_1')),
+    ('get_sessions_page(active)', lambda: db.get_sessions_page(is_active=True, date_from=_today)),
+    ('count_sessions(dates)', lambda: db.count_sessions(date_from=_today, date_to=_week_later)),
+    ('expire_unpaid_orders', lambda: db.expire_unpaid_orders(30, 100)),
+    ('deactivate_past_sessions', lambda: db.deactivate_past_sessions()),
+]
+
+
+def check(log=print):
+    """Прогнать HOT_PATHS; вернуть список ошибок (пустой - всё хорошо)"""
+    errors = []
+    db.query_cache.clear()
+    try:
+        for name, call in HOT_PATHS:
+            with db.explain_plans() as plans:
+                call()
+            if not plans:
+                errors.append(f"{name}: не удалось получить план (нет запросов или ошибка БД)")
+                continue
+            for query, _, rows in plans:
+                for row in rows:
+                    table = row.get('table')
+                    if row.get('type') != 'ALL' or table in FULL_SCAN_ALLOWED:
+                        continue
+                    short_query = ' '.join(query.split())[:120]
+                    if row.get('possible_keys'):
+                        log(f"  ! {name}: полный проход по {table} (индекс есть, но не выбран) - {short_query}")
+                    else:
+                        errors.append(f"{name}: полный проход по {table} без индекса - {short_query}")
+            log(f"{'FAIL' if any(e.startswith(name + ':') for e in errors) else 'ok  '} {name}")
+    finally:
+        # В кэш могли попасть пустые результаты режима EXPLAIN
+        db.query_cache.clear()
+    return errors
@@ -0,0 +1,221 @@
+"""
+Адаптивные картинки: уменьшенные копии загруженных изображений.
+
+Для каждого исходника из static/images рисуется набор ширин в WebP
+и в запасном формате (JPEG, для картинок с прозрачностью - PNG).
+Файлы и их размеры лежат в static/images/variants, описание каждого
+исходника - в variants/meta/<хэш пути>.json. Шаблоны выводят
+<picture> со srcset/sizes через image_tag(); если копий нет
+(Pillow не установлен или backfill ещё не запускали), выводится
+обычный <img> на исходник.
+
+    flask --app app backfill-images      # нарезать копии для всех картинок из data_content
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from markupsafe import Markup, escape
+
+IMAGE_CONFIG = {
+    'static_dir': os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static'),
+    'variants_dir': 'images/variants',    # относительно static
+    'widths': [320, 640, 960, 1280, 1920],
+    'webp_quality': 80,
+    'jpeg_quality': 82,
+    'meta_recheck': 60                    # как часто перепроверять отсутствующее описание, сек
+}
+
+IMAGE_COLUMNS = ('img_card', 'main_image', 'block_image_1', 'block_image_2', 'block_image_3')
+
+_meta = {}            # путь -> описание или (None, время проверки)
+_meta_stamp = None    # mtime каталога описаний, при котором заполнен _meta
+_lock = threading.Lock()
+
+
+# ===================================================================================
+# НАРЕЗКА
+# ===================================================================================
+
+def _static_path(path):
+    return os.path.join(IMAGE_CONFIG['static_dir'], path)
+
+
+def _meta_path(path):
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+    return _static_path(f"{IMAGE_CONFIG['variants_dir']}/meta/{digest}.json")
+
+
+def _save_atomic(target, write):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, target)
+
+
+def process(path):
+    """Нарезать копии для static/<path>. Возвращает описание или None"""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        print("Pillow не установлен: копии картинок не создаются")
+        return None
+
+    source = _static_path(path)
+    try:
+        with open(source, 'rb') as f:
+            content = f.read()
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError) as e:
+        print(f"Не удалось открыть картинку {path}: {e}")
+        return None
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpg'
+
+    # Имя копии зависит от содержимого: новый файл с тем же именем получит новые адреса
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    base = f"{IMAGE_CONFIG['variants_dir']}/{stem}-{digest}"
+
+    widths = sorted({w for w in IMAGE_CONFIG['widths'] if w < image.width} | {min(image.width, max(IMAGE_CONFIG['widths']))})
+    meta = {'source': path, 'width': image.width, 'height': image.height,
+            'fallback': fallback, 'webp': [], 'fallback_srcset': []}
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+
+        webp_path = f"{base}-{width}.webp"
+        _save_atomic(_static_path(webp_path),
+                     lambda p: resized.save(p, 'WEBP', quality=IMAGE_CONFIG['webp_quality'], method=6))
+        meta['webp'].append([width, webp_path])
+
+        fallback_path = f"{base}-{width}.{fallback}"
+        if fallback == 'png':
+            _save_atomic(_static_path(fallback_path), lambda p: resized.save(p, 'PNG', optimize=True))
+        else:
+            _save_atomic(_static_path(fallback_path),
+                         lambda p: resized.save(p, 'JPEG', quality=IMAGE_CONFIG['jpeg_quality'],
+                                                optimize=True, progressive=True))
+        meta['fallback_srcset'].append([width, fallback_path])
+
+    _save_atomic(_meta_path(path), lambda p: _write_json(p, meta))
+    with _lock:
+        _meta[path] = meta
+    return meta
+
+
+def _write_json(target, data):
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def remove_variants(path):
+    """Удалить копии и описание картинки (когда удаляется исходник)"""
+    meta = get_meta(path)
+    with _lock:
+        _meta.pop(path, None)
+    if not meta:
+        return
+    for _, variant in meta['webp'] + meta['fallback_srcset']:
+        try:
+            os.remove(_static_path(variant))
+        except OSError:
+            pass
+    try:
+        os.remove(_meta_path(path))
+    except OSError:
+        pass
+
+
+def backfill(paths, force=False, log=print):
+    """Нарезать копии для всех путей, у которых их ещё нет. Возвращает число обработанных"""
+    processed = 0
+    for path in sorted(set(p for p in paths if p)):
+        if not os.path.exists(_static_path(path)):
+            log(f"  нет файла: {path}")
+            continue
+        if not force and get_meta(path):
+            continue
+        started = time.perf_counter()
+        meta = process(path)
+        if meta:
+            processed += 1
+            log(f"  {path}: {meta['width']}x{meta['height']}, {len(meta['webp'])} ширин, "
+                f"{(time.perf_counter() - started) * 1000:.0f} мс")
+    return processed
+
+
+# ===================================================================================
+# ШАБЛОНЫ
+# ===================================================================================
+
+def get_meta(path):
+    """Описание копий картинки или None (отсутствие кэшируется на meta_recheck секунд)"""
+    if not path:
+        return None
+    with _lock:
+        cached = _meta.get(path)
+    if isinstance(cached, dict):
+        return cached
+    if cached is not None and time.monotonic() - cached[1] < IMAGE_CONFIG['meta_recheck']:
+        return None
+    try:
+        with open(_meta_path(path), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+    with _lock:
+        _meta[path] = meta if meta else (None, time.monotonic())
+    return meta
+
+
+def variants_stamp():
+    """Метка каталога описаний: меняется, когда копии нарезаны или удалены (в любом процессе)"""
+    global _meta_stamp
+    try:
+        stamp = os.stat(_static_path(f"{IMAGE_CONFIG['variants_dir']}/meta")).st_mtime_ns
+    except OSError:
+        stamp = 0
+    if stamp != _meta_stamp:
+        with _lock:
+            # Каталог изменился: описания из памяти (и "копий нет") могли устареть
+            _meta.clear()
+            _meta_stamp = stamp
+    return stamp
+
+
+def srcset(variants, static_url):
+    return ', '.join(f"{static_url(path)} {width}w" for width, path in variants)
+
+
+def image_tag(path, static_url, alt='', sizes='100vw', class_='', loading='lazy', fetchpriority=None):
+    """<picture> с WebP и запасным форматом или <img> на исходник, если копий нет"""
+    attrs = f'alt="{escape(alt)}"'
+    if class_:
+        attrs += f' class="{escape(class_)}"'
+    if loading:
+        attrs += f' loading="{loading}"'
+    if fetchpriority:
+        attrs += f' fetchpriority="{fetchpriority}"'
+    attrs += ' decoding="async"'
+
+    meta = get_meta(path)
+    if not meta:
+        return Markup(f'<img src="{escape(static_url(path))}" {attrs}>')
+
+    fallback = meta['fallback_srcset']
+    # src - средняя копия: для браузеров без srcset
+    default = fallback[min(len(fallback) - 1, 1)][1]
+    return Markup(
+        f'<picture style="display: contents">'
+        f'<source type="image/webp" srcset="{srcset(meta["webp"], static_url)}" sizes="{sizes}">'
+        f'<img src="{escape(static_url(default))}" srcset="{srcset(fallback, static_url)}" sizes="{sizes}" '
+        f'width="{meta["width"]}" height="{meta["height"]}" {attrs}>'
+        f'</picture>'
+    )
@@ -0,0 +1,213 @@
+"""
+Фоновые задачи обслуживания: отмена неоплаченных заказов и снятие
+прошедших сеансов с продажи.
+
+Задачи крутятся в отдельном потоке каждого воркера, но выполняет
+каждую задачу только один процесс - тот, кто держит именованную
+блокировку MySQL (GET_LOCK). Блокировка живёт, пока живо её соединение,
+поэтому при падении лидера задачу подхватывает другой воркер.
+"""
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+import database as db
+
+# ===================================================================================
+# НАСТРОЙКИ
+# ===================================================================================
+
+JOBS_CONFIG = {
+    'tick': 5,                   # как часто проверять, не пора ли запускать задачи, сек
+    'order_hold_minutes': 30,    # сколько держим места за неоплаченным заказом
+    'expire_interval': 60,
+    'expire_batch_size': 500,
+    'sessions_interval': 300,
+}
+
+
+# ===================================================================================
+# ЛИДЕРСТВО
+# ===================================================================================
+
+class LeaderLock:
+    """Именованные блокировки MySQL на отдельном (не из пула) соединении"""
+
+    def __init__(self, prefix=None):
+        self.prefix = prefix or f"{db.DB_CONFIG['database']}:jobs:"
+        self._connection = None
+        self._held = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = mysql.connector.connect(**db.DB_CONFIG, autocommit=True)
+            self._held.clear()
+        return self._connection
+
+    def _reset(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Error:
+                pass
+        self._connection = None
+        self._held.clear()
+
+    def acquire(self, name):
+        """True, если блокировка задачи name у этого процесса"""
+        key = self.prefix + name
+        with self._lock:
+            try:
+                cursor = self._connect().cursor()
+                try:
+                    if name in self._held:
+                        cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (key,))
+                        if cursor.fetchone()[0] == 1:
+                            return True
+                        self._held.discard(name)
+                    cursor.execute("SELECT GET_LOCK(%s, 0)", (key,))
+                    if cursor.fetchone()[0] == 1:
+                        self._held.add(name)
+                        return True
+                    return False
+                finally:
+                    cursor.close()
+            except Error as e:
+                print(f"Ошибка блокировки фоновой задачи {name}: {e}")
+                self._reset()
+                return False
+
+    def release_all(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    cursor = self._connection.cursor()
+                    cursor.execute("SELECT RELEASE_ALL_LOCKS()")
+                    cursor.fetchall()
+                    cursor.close()
+                except Error:
+                    pass
+            self._reset()
+
+
+# ===================================================================================
+# ЗАПУСК ЗАДАЧ
+# ===================================================================================
+
+class Job:
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.next_run = 0.0
+        self.stats = {
+            'interval': interval,
+            'runs': 0,
+            'failures': 0,
+            'skipped_not_leader': 0,
+            'last_run': None,
+            'last_duration': None,
+            'max_duration': 0.0,
+            'total_duration': 0.0,
+            'last_result': None,
+            'last_error': None
+        }
+
+
+class JobRunner:
+    """Поток, который по расписанию запускает зарегистрированные задачи"""
+
+    def __init__(self, tick=None, leader=None):
+        self.tick = tick or JOBS_CONFIG['tick']
+        self.leader = leader or LeaderLock()
+        self.jobs = {}
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, name, func, interval):
+        self.jobs[name] = Job(name, func, interval)
+
+    def run_job(self, job):
+        """Запустить задачу, если этот процесс - её лидер"""
+        if not self.leader.acquire(job.name):
+            job.stats['skipped_not_leader'] += 1
+            return None
+        started = time.perf_counter()
+        result = None
+        try:
+            result = job.func()
+            job.stats['last_result'] = result
+            job.stats['last_error'] = None
+        except Exception as e:
+            job.stats['failures'] += 1
+            job.stats['last_error'] = str(e)
+            print(f"Ошибка фоновой задачи {job.name}: {e}")
+        elapsed = time.perf_counter() - started
+        job.stats['runs'] += 1
+        job.stats['last_run'] = time.time()
+        job.stats['last_duration'] = elapsed
+        job.stats['total_duration'] += elapsed
+        job.stats['max_duration'] = max(job.stats['max_duration'], elapsed)
+        return result
+
+    def run_pending(self):
+        now = time.monotonic()
+        for job in list(self.jobs.values()):
+            if now >= job.next_run:
+                job.next_run = now + job.interval
+                self.run_job(job)
+
+    def run_all(self):
+        return {name: self.run_job(job) for name, job in self.jobs.items()}
+
+    def run_forever(self):
+        try:
+            while not self._stop.is_set():
+                self.run_pending()
+                self._stop.wait(self.tick)
+        finally:
+            self.leader.release_all()
+
+    def start(self):
+        """Запустить поток в текущем процессе (повторные вызовы ничего не делают)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            # После fork блокировки и соединение родителя не наши
+            if self._pid is not None and self._pid != os.getpid():
+                self.leader = LeaderLock(self.leader.prefix)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='mgorki-jobs', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        result = {}
+        for name, job in self.jobs.items():
+            stats = dict(job.stats)
+            stats['avg_duration'] = stats['total_duration'] / stats['runs'] if stats['runs'] else 0.0
+            stats['leader'] = name in self.leader._held
+            result[name] = stats
+        return result
+
+
+runner = JobRunner()
+runner.add('expire_unpaid_orders',
+           lambda: db.expire_unpaid_orders(JOBS_CONFIG['order_hold_minutes'], JOBS_CONFIG['expire_batch_size']),
+           JOBS_CONFIG['expire_interval'])
+runner.add('deactivate_past_sessions', db.deactivate_past_sessions, JOBS_CONFIG['sessions_interval'])
+
+
+def get_jobs_stats():
+    return runner.stats()
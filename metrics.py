@@ -0,0 +1,237 @@
+"""
+Метрики приложения в формате Prometheus и заголовок Server-Timing.
+
+Считается время каждого запроса к сайту по маршрутам, число запросов к
+БД и время в БД на один запрос (N+1 видно по гистограмме
+mgorki_http_request_db_queries), время получения соединения из пула и
+время рендера шаблонов. Данные собираются через подписки database.py и
+сигналы Flask, метрики - свои в каждом процессе (воркере).
+
+    /admin/metrics     - текст для Prometheus (админ или Authorization: Bearer <MGORKI_METRICS_TOKEN>)
+
+С MGORKI_SERVER_TIMING=1 каждый ответ получает заголовок
+Server-Timing: db;dur=...;desc="N queries", conn;dur=..., tpl;dur=..., app;dur=...
+"""
+import os
+import re
+import threading
+import time
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+import database as db
+import pagecache
+
+METRICS_CONFIG = {
+    'prefix': 'mgorki',
+    'server_timing': os.environ.get('MGORKI_SERVER_TIMING', '0') == '1',
+    # Границы корзин гистограмм, сек
+    'latency_buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'query_buckets': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    'count_buckets': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+}
+
+_STATEMENT = re.compile(r'^\s*(\w+)')
+
+
+# ===================================================================================
+# ХРАНИЛИЩЕ
+# ===================================================================================
+
+class Histogram:
+    """Гистограмма с метками: накопительные корзины, сумма и число наблюдений"""
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}    # значения меток -> [счётчики корзин..., сумма, число]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in items:
+            labels = _labels(self.labels, label_values)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, le=_number(bound))} {count}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, le="+Inf")} {series[-1]}')
+            lines.append(f"{self.name}_sum{labels} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in items]
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _gauges(name, help_text, values):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{key="{key}"}} {_number(value)}' for key, value in sorted(values.items())
+              if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    return lines
+
+
+_p = METRICS_CONFIG['prefix']
+
+request_duration = Histogram(f"{_p}_http_request_duration_seconds", "Время ответа по маршрутам",
+                             METRICS_CONFIG['latency_buckets'], ('route', 'method', 'status'))
+request_queries = Histogram(f"{_p}_http_request_db_queries", "Запросов к БД на один запрос к сайту",
+                            METRICS_CONFIG['count_buckets'], ('route',))
+request_db_time = Histogram(f"{_p}_http_request_db_seconds", "Время в БД на один запрос к сайту",
+                            METRICS_CONFIG['latency_buckets'], ('route',))
+query_duration = Histogram(f"{_p}_db_query_duration_seconds", "Время запросов к БД по видам",
+                           METRICS_CONFIG['query_buckets'], ('statement',))
+query_errors = Counter(f"{_p}_db_query_errors_total", "Запросы к БД, завершившиеся ошибкой", ('statement',))
+connect_duration = Histogram(f"{_p}_db_connection_acquire_seconds",
+                             "Время получения соединения из пула (ожидание и открытие)",
+                             METRICS_CONFIG['query_buckets'], ('outcome',))
+template_duration = Histogram(f"{_p}_template_render_seconds", "Время рендера шаблонов",
+                              METRICS_CONFIG['latency_buckets'], ('template',))
+
+REGISTRY = [request_duration, request_queries, request_db_time, query_duration, query_errors,
+            connect_duration, template_duration]
+
+
+# ===================================================================================
+# СБОР
+# ===================================================================================
+
+def _current():
+    """Счётчики текущего запроса к сайту или None (фоновые потоки, CLI)"""
+    return g.get('_metrics') if has_request_context() else None
+
+
+def _on_query(query, params, seconds, error, rows):
+    match = _STATEMENT.match(query or '')
+    statement = match.group(1).upper() if match else 'OTHER'
+    query_duration.observe(seconds, statement)
+    if error is not None:
+        query_errors.inc(statement)
+    current = _current()
+    if current is not None:
+        current['queries'] += 1
+        current['db'] += seconds
+
+
+def _on_connect(seconds, ok):
+    connect_duration.observe(seconds, 'ok' if ok else 'error')
+    current = _current()
+    if current is not None:
+        current['conn'] += seconds
+
+
+def _before_render(app, template, context, **extra):
+    current = _current()
+    if current is not None:
+        current['render_started'] = time.perf_counter()
+
+
+def _rendered(app, template, context, **extra):
+    current = _current()
+    if current is None or current.get('render_started') is None:
+        return
+    seconds = time.perf_counter() - current.pop('render_started')
+    template_duration.observe(seconds, template.name or 'string')
+    current['tpl'] += seconds
+
+
+def _start_request():
+    g._metrics = {'started': time.perf_counter(), 'queries': 0, 'db': 0.0, 'conn': 0.0, 'tpl': 0.0}
+
+
+def _finish_request(response):
+    current = g.pop('_metrics', None)
+    if current is None:
+        return response
+    elapsed = time.perf_counter() - current['started']
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_duration.observe(elapsed, route, request.method, str(response.status_code))
+    request_queries.observe(current['queries'], route)
+    request_db_time.observe(current['db'], route)
+    if METRICS_CONFIG['server_timing']:
+        response.headers.add('Server-Timing', ', '.join([
+            f'db;dur={current["db"] * 1000:.1f};desc="{current["queries"]} queries"',
+            f'conn;dur={current["conn"] * 1000:.1f}',
+            f'tpl;dur={current["tpl"] * 1000:.1f}',
+            f'app;dur={elapsed * 1000:.1f}',
+        ]))
+    return response
+
+
+def init_app(app):
+    """Подписаться на запросы к БД, рендер шаблонов и запросы к сайту"""
+    db.add_query_listener(_on_query)
+    db.add_connect_listener(_on_connect)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+# ===================================================================================
+# ВЫВОД
+# ===================================================================================
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _gauges(f"{_p}_db_pool", "Состояние пула соединений", db.get_pool_stats())
+    lines += _gauges(f"{_p}_query_cache", "Кэш справочных запросов", db.get_cache_stats())
+    lines += _gauges(f"{_p}_page_cache", "Кэш готовых страниц", pagecache.get_page_cache_stats())
+    replicas = {}
+    for replica in db.get_replica_stats():
+        replicas.update({f"{replica['name']}:healthy": int(replica['healthy']),
+                         f"{replica['name']}:reads": replica['reads'],
+                         f"{replica['name']}:failures": replica['failures']})
+        if replica['lag'] is not None:
+            replicas[f"{replica['name']}:lag_seconds"] = replica['lag']
+    if replicas:
+        lines += _gauges(f"{_p}_db_replica", "Реплики для чтения", replicas)
+    return '\n'.join(lines) + '\n'
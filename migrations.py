@@ -0,0 +1,235 @@
+"""
+Версионные миграции схемы db_museum.
+
+Каждая миграция - номер, описание и список шагов. Шаги идемпотентны
+(индекс или триггер создаются, только если их ещё нет), поэтому
+прерванную миграцию можно просто запустить снова. Применённые номера
+хранятся в schema_migrations; одновременный запуск из нескольких
+воркеров исключает блокировка GET_LOCK.
+
+    flask --app app db-migrate            # применить новые
+    flask --app app db-migrate --status   # что применено, что нет
+"""
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+import database as db
+
+LOCK_TIMEOUT = 60
+
+
+# ===================================================================================
+# ШАГИ МИГРАЦИЙ
+# ===================================================================================
+
+def _exists(cursor, query, params):
+    cursor.execute(query, params)
+    return cursor.fetchone()[0] > 0
+
+
+def sql(statement):
+    """Произвольный идемпотентный запрос (CREATE TABLE IF NOT EXISTS и т.п.)"""
+    def step(cursor):
+        cursor.execute(statement)
+        if cursor.with_rows:
+            cursor.fetchall()
+    step.description = statement.strip().splitlines()[0]
+    return step
+
+
+def add_index(table, name, columns):
+    """ALTER TABLE ... ADD KEY, если индекса с таким именем нет"""
+    def step(cursor):
+        if not _exists(cursor, """
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """, (table, name)):
+            cursor.execute(f"ALTER TABLE `{table}` ADD KEY `{name}` ({columns})")
+    step.description = f"индекс {table}.{name} ({columns})"
+    return step
+
+
+def add_column(table, name, definition):
+    """ALTER TABLE ... ADD COLUMN, если колонки с таким именем нет"""
+    def step(cursor):
+        if not _exists(cursor, """
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """, (table, name)):
+            cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{name}` {definition}")
+    step.description = f"колонка {table}.{name}"
+    return step
+
+
+def create_trigger(name, definition):
+    """CREATE TRIGGER, если триггера нет (definition - всё после имени)"""
+    def step(cursor):
+        if not _exists(cursor, """
+            SELECT COUNT(*) FROM information_schema.triggers
+            WHERE trigger_schema = DATABASE() AND trigger_name = %s
+        """, (name,)):
+            cursor.execute(f"CREATE TRIGGER `{name}` {definition}")
+    step.description = f"триггер {name}"
+    return step
+
+
+_ORDER_STATS_ADD = """
+  INSERT INTO `order_stats` (`order_status`, `payment_status`, `orders_count`, `amount_total`)
+  VALUES (IFNULL(NEW.order_status, ''), IFNULL(NEW.payment_status, ''), 1, NEW.total_amount)
+  ON DUPLICATE KEY UPDATE `orders_count` = `orders_count` + 1, `amount_total` = `amount_total` + NEW.total_amount;
+"""
+_ORDER_STATS_SUB = """
+  UPDATE `order_stats`
+    SET `orders_count` = `orders_count` - 1, `amount_total` = `amount_total` - OLD.total_amount
+    WHERE `order_status` = IFNULL(OLD.order_status, '') AND `payment_status` = IFNULL(OLD.payment_status, '');
+"""
+
+
+# ===================================================================================
+# СПИСОК МИГРАЦИЙ (только дописывать в конец, номера не менять)
+# ===================================================================================
+
+MIGRATIONS = [
+    (1, 'Счётчики заказов order_stats для дашборда', [
+        sql("""
+            CREATE TABLE IF NOT EXISTS `order_stats` (
+              `order_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+              `payment_status` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '',
+              `orders_count` int NOT NULL DEFAULT '0',
+              `amount_total` decimal(14,2) NOT NULL DEFAULT '0.00',
+              PRIMARY KEY (`order_status`, `payment_status`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """),
+        create_trigger('orders_stats_insert',
+                       f"AFTER INSERT ON `orders` FOR EACH ROW BEGIN {_ORDER_STATS_ADD} END"),
+        create_trigger('orders_stats_update', f"""AFTER UPDATE ON `orders` FOR EACH ROW BEGIN
+  IF NOT (NEW.order_status <=> OLD.order_status)
+     OR NOT (NEW.payment_status <=> OLD.payment_status)
+     OR NEW.total_amount <> OLD.total_amount THEN
+    {_ORDER_STATS_SUB}
+    {_ORDER_STATS_ADD}
+  END IF;
+END"""),
+        create_trigger('orders_stats_delete',
+                       f"AFTER DELETE ON `orders` FOR EACH ROW BEGIN {_ORDER_STATS_SUB} END"),
+        # Пересчёт с нуля: повторный запуск даёт тот же результат
+        sql("""
+            INSERT INTO `order_stats` (`order_status`, `payment_status`, `orders_count`, `amount_total`)
+            SELECT IFNULL(order_status, ''), IFNULL(payment_status, ''), COUNT(*), SUM(total_amount)
+            FROM `orders` GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE `orders_count` = VALUES(`orders_count`),
+                                    `amount_total` = VALUES(`amount_total`)
+        """),
+    ]),
+    (2, 'Индексы списка заказов в админке', [
+        add_index('orders', 'idx_orders_status_id', '`order_status`, `id`'),
+        add_index('orders', 'idx_orders_payment_id', '`payment_status`, `id`'),
+        add_index('orders', 'idx_orders_created_id', '`created_at`, `id`'),
+    ]),
+    (3, 'Индексы расписания в админке', [
+        add_index('session_schedule', 'idx_sessions_date_time', '`session_date` DESC, `session_time`'),
+        add_index('session_schedule', 'idx_sessions_event_date_time',
+                  '`event_id`, `session_date` DESC, `session_time`'),
+        add_index('session_schedule', 'idx_sessions_active_date_time',
+                  '`is_active`, `session_date` DESC, `session_time`'),
+    ]),
+    (4, 'Индексы горячих запросов сайта и фоновых задач', [
+        # get_content_by_category: каждая страница-список
+        add_index('data_content', 'idx_content_category', '`category`, `id`'),
+        # get_active_sessions: страница заказа
+        add_index('session_schedule', 'idx_sessions_event_active_date',
+                  '`event_id`, `is_active`, `session_date`, `session_time`'),
+        # expire_unpaid_orders: просроченные неоплаченные брони
+        add_index('ticket_bookings', 'idx_bookings_status_created', '`booking_status`, `created_at`'),
+        add_index('ticket_categories', 'idx_ticket_categories_category', '`category`'),
+    ]),
+    (5, 'Версия и время изменения материалов (ETag / Last-Modified)', [
+        add_column('data_content', 'revision', "int NOT NULL DEFAULT '1'"),
+        add_column('data_content', 'updated_at',
+                   'timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'),
+    ]),
+]
+
+
+# ===================================================================================
+# ЗАПУСК
+# ===================================================================================
+
+def _connect():
+    return mysql.connector.connect(**db.DB_CONFIG, autocommit=True)
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `schema_migrations` (
+          `version` int NOT NULL,
+          `name` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
+          `applied_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+          `duration_ms` int DEFAULT NULL,
+          PRIMARY KEY (`version`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    """)
+
+
+def applied_versions(cursor):
+    _ensure_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def status():
+    """[(номер, описание, применена ли)] или None при ошибке подключения"""
+    connection = None
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        applied = applied_versions(cursor)
+        cursor.close()
+        return [(version, name, version in applied) for version, name, _ in MIGRATIONS]
+    except Error as e:
+        print(f"Ошибка чтения миграций: {e}")
+        return None
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def migrate(log=print):
+    """Применить все новые миграции по порядку. Возвращает список номеров или None"""
+    connection = None
+    lock_name = f"{db.DB_CONFIG['database']}:migrate"
+    try:
+        connection = _connect()
+        cursor = connection.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            log("Миграции уже выполняет другой процесс")
+            return None
+        try:
+            applied = applied_versions(cursor)
+            done = []
+            for version, name, steps in MIGRATIONS:
+                if version in applied:
+                    continue
+                log(f"Миграция {version}: {name}")
+                started = time.perf_counter()
+                for step in steps:
+                    log(f"  - {step.description}")
+                    step(cursor)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                cursor.execute("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s)",
+                               (version, name, duration_ms))
+                done.append(version)
+            return done
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+            cursor.fetchall()
+            cursor.close()
+    except Error as e:
+        print(f"Ошибка миграции: {e}")
+        return None
+    finally:
+        if connection is not None:
+            connection.close()
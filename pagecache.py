@@ -0,0 +1,211 @@
+"""
+Кэш готовых HTML-страниц для анонимных посетителей.
+
+Работает внутри conditional_content (app.py): ключ - ETag страницы
+(маршрут, аргументы, версии записей data_content, шаблоны, статика)
+и строка запроса, поэтому правка материала сама даёт новый ключ.
+Свежая копия отдаётся ttl секунд без рендера шаблона. После этого
+копию перерисовывает только один запрос (single-flight), остальные
+до stale_ttl получают прежнюю - без толпы одинаковых рендеров после
+истечения. Пока копии нет совсем, одновременные промахи ждут первый.
+
+Мимо кэша: не GET/HEAD, вошедший администратор (session['logged_in']),
+сессия с неразобранными flash-сообщениями. Не сохраняются ответы не 200,
+с Set-Cookie, с изменённой сессией и больше max_body байт.
+
+Правка записи в админке (database.invalidate_content) точечно удаляет
+страницы этой записи и списков её категории.
+"""
+import os
+import threading
+import time
+
+from flask import current_app, request, session
+
+import database as db
+
+PAGECACHE_CONFIG = {
+    'enabled': os.environ.get('MGORKI_PAGE_CACHE', '1') != '0',
+    'ttl': 60,                  # сек, копия свежая
+    'stale_ttl': 600,           # сек, копию ещё можно отдать, пока её перерисовывают
+    'max_entries': 256,
+    'max_body': 512 * 1024,     # байт
+    'wait_timeout': 10          # сек ожидания первого рендера, потом рисуем сами
+}
+
+SKIPPED_HEADERS = ('Content-Length', 'Set-Cookie')
+
+
+class _Flight:
+    """Рендер страницы, который ждут одновременные промахи по ключу"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class _Page:
+    __slots__ = ('body', 'status', 'headers', 'tags', 'fresh_until', 'stale_until')
+
+    def __init__(self, response, tags):
+        now = time.monotonic()
+        self.body = response.get_data()
+        self.status = response.status_code
+        self.headers = [(k, v) for k, v in response.headers if k not in SKIPPED_HEADERS]
+        self.tags = frozenset(tags)
+        self.fresh_until = now + PAGECACHE_CONFIG['ttl']
+        self.stale_until = now + PAGECACHE_CONFIG['stale_ttl']
+
+
+class PageCache:
+    def __init__(self):
+        self._pages = {}      # ключ -> _Page
+        self._flights = {}    # ключ -> _Flight
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale': 0, 'misses': 0, 'coalesced': 0,
+                       'bypassed': 0, 'uncacheable': 0, 'purged': 0}
+
+    def serve(self, key, tags, render):
+        """Ответ из кэша или render(); render вызывается в контексте запроса"""
+        now = time.monotonic()
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None and page.stale_until <= now:
+                del self._pages[key]
+                page = None
+            if page is not None and page.fresh_until > now:
+                self._stats['hits'] += 1
+                return _response(page, 'hit')
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+                self._stats['misses'] += 1
+            elif page is not None:
+                # Копию уже перерисовывают - отдаём прежнюю
+                self._stats['stale'] += 1
+                return _response(page, 'stale')
+            else:
+                self._stats['coalesced'] += 1
+
+        if not owner:
+            if flight.done.wait(PAGECACHE_CONFIG['wait_timeout']) and flight.value is not None:
+                return _response(flight.value, 'hit')
+            return render()
+
+        page = None
+        try:
+            response = render()
+            if _storable(response):
+                page = _Page(response, tags)
+            response.headers['X-Page-Cache'] = 'miss'
+        finally:
+            with self._lock:
+                if page is not None:
+                    self._prune()
+                    self._pages[key] = page
+                else:
+                    self._stats['uncacheable'] += 1
+                flight.value = page
+                del self._flights[key]
+            flight.done.set()
+        return response
+
+    def bypass(self):
+        with self._lock:
+            self._stats['bypassed'] += 1
+
+    def _prune(self):
+        if len(self._pages) < PAGECACHE_CONFIG['max_entries']:
+            return
+        now = time.monotonic()
+        for key in [k for k, page in self._pages.items() if page.stale_until <= now]:
+            del self._pages[key]
+        while len(self._pages) >= PAGECACHE_CONFIG['max_entries']:
+            self._pages.pop(next(iter(self._pages)))
+
+    def purge(self, match):
+        """Удалить страницы, для тегов которых match(tags) истинно"""
+        with self._lock:
+            keys = [k for k, page in self._pages.items() if match(page.tags)]
+            for key in keys:
+                del self._pages[key]
+            self._stats['purged'] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        return self.purge(lambda tags: True)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result['entries'] = len(self._pages)
+            result['bytes'] = sum(len(page.body) for page in self._pages.values())
+            result['rendering'] = len(self._flights)
+        return result
+
+
+def _response(page, state):
+    response = current_app.response_class(page.body, status=page.status, headers=page.headers)
+    response.headers['X-Page-Cache'] = state
+    return response
+
+
+def _storable(response):
+    return (response.status_code == 200 and not response.is_streamed
+            and 'Set-Cookie' not in response.headers and not session.modified
+            and len(response.get_data()) <= PAGECACHE_CONFIG['max_body'])
+
+
+page_cache = PageCache()
+
+
+# ===================================================================================
+# ИСПОЛЬЗОВАНИЕ ИЗ МАРШРУТОВ
+# ===================================================================================
+
+def applies():
+    """Можно ли отдать текущий запрос из кэша"""
+    if not PAGECACHE_CONFIG['enabled']:
+        return False
+    if (request.method not in ('GET', 'HEAD') or session.get('logged_in')
+            or session.get('_flashes')):
+        page_cache.bypass()
+        return False
+    return True
+
+
+def page_tags(view_args, categories):
+    """Страница записи помечается её id, список - категориями"""
+    ids = [v for v in view_args.values() if isinstance(v, int)]
+    if ids:
+        return {('content', v) for v in ids}
+    return {('category', c) for c in categories}
+
+
+def serve(etag, tags, render):
+    key = (etag, request.query_string)
+    return page_cache.serve(key, tags, render)
+
+
+def on_content_changed(content_id):
+    """Удалить страницы изменённой записи и списков её категории"""
+    if not content_id:
+        page_cache.purge(lambda tags: any(kind == 'category' for kind, _ in tags))
+        return
+    row = db.get_content_by_id(content_id)
+    stale = {('content', int(content_id))}
+    if row:
+        stale.add(('category', row['category']))
+        page_cache.purge(lambda tags: not tags.isdisjoint(stale))
+    else:
+        # Запись удалена - категорию уже не узнать, списки сбрасываем все
+        page_cache.purge(lambda tags: not tags.isdisjoint(stale)
+                         or any(kind == 'category' for kind, _ in tags))
+
+
+db.add_content_listener(on_content_changed)
+
+
+def get_page_cache_stats():
+    return page_cache.stats()
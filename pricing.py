@@ -0,0 +1,133 @@
+"""
+Расчёт стоимости корзины билетов.
+
+Цены берутся из снимка таблицы ticket_categories: он строится один раз
+из кэша запросов database.py и пересобирается, только когда кэш отдал
+новый список (правка в админке или истёк TTL). Поэтому расчёт корзины
+не ходит в БД и стоит несколько обращений к словарю.
+"""
+import threading
+from decimal import Decimal
+
+import database as db
+
+PUSHKIN_PAYMENT_METHOD = 'pushkin_card'
+MAX_TICKETS_PER_CATEGORY = 50
+
+
+class QuoteError(ValueError):
+    """Корзину нельзя оценить: текст ошибки показывается покупателю"""
+
+
+# ===================================================================================
+# СНИМОК ЦЕН
+# ===================================================================================
+
+class PriceSnapshot:
+    """Категории билетов по id с ценами в Decimal"""
+
+    def __init__(self, rows):
+        self.source = rows
+        self.categories = {}
+        for row in rows or []:
+            self.categories[int(row['id'])] = {
+                'id': int(row['id']),
+                'type': row['category'],
+                'title': row['title'],
+                'price': Decimal(str(row['price'])),
+                'pushkin_card_allowed': bool(row.get('pushkin_card_allowed'))
+            }
+
+    def get(self, category_id):
+        return self.categories.get(category_id)
+
+
+_snapshot = PriceSnapshot([])
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Актуальный снимок цен; пересобирается при смене версии в кэше"""
+    global _snapshot
+    rows = db.get_all_ticket_categories()
+    if rows is None:
+        # БД недоступна: считаем по последним известным ценам
+        return _snapshot
+    if rows is not _snapshot.source:
+        with _snapshot_lock:
+            if rows is not _snapshot.source:
+                _snapshot = PriceSnapshot(rows)
+    return _snapshot
+
+
+# ===================================================================================
+# РАСЧЁТ КОРЗИНЫ
+# ===================================================================================
+
+def _parse_items(items):
+    """{category_id: quantity} из JSON-корзины -> [(int, int)] без нулевых строк"""
+    if not isinstance(items, dict):
+        raise QuoteError('Некорректный состав заказа')
+    parsed = []
+    for category_id, quantity in items.items():
+        try:
+            category_id = int(category_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise QuoteError('Некорректное количество билетов')
+        if quantity < 0 or quantity > MAX_TICKETS_PER_CATEGORY:
+            raise QuoteError('Некорректное количество билетов')
+        if quantity:
+            parsed.append((category_id, quantity))
+    return parsed
+
+
+def quote(items, payment_method=None, category_type=None):
+    """Стоимость корзины {category_id: quantity}.
+
+    Возвращает словарь со строками корзины, общим количеством и суммой
+    и признаком pushkin_eligible (все билеты можно оплатить Пушкинской картой).
+    Если выбрана оплата Пушкинской картой, а билеты ей не подходят,
+    или в корзине неизвестная категория - QuoteError.
+    """
+    snapshot = get_snapshot()
+    lines = []
+    total_amount = Decimal('0')
+    total_tickets = 0
+    for category_id, quantity in _parse_items(items):
+        category = snapshot.get(category_id)
+        if not category or (category_type and category['type'] != category_type):
+            raise QuoteError('Выбранная категория билетов недоступна')
+        amount = category['price'] * quantity
+        lines.append({
+            'category_id': category_id,
+            'title': category['title'],
+            'price': category['price'],
+            'quantity': quantity,
+            'amount': amount,
+            'pushkin_card_allowed': category['pushkin_card_allowed']
+        })
+        total_amount += amount
+        total_tickets += quantity
+
+    pushkin_eligible = bool(lines) and all(line['pushkin_card_allowed'] for line in lines)
+    if payment_method == PUSHKIN_PAYMENT_METHOD and not pushkin_eligible:
+        raise QuoteError('Для оплаты Пушкинской картой выберите только подходящие билеты')
+
+    return {
+        'lines': lines,
+        'total_tickets': total_tickets,
+        'total_amount': total_amount,
+        'pushkin_eligible': pushkin_eligible
+    }
+
+
+def quote_to_json(result):
+    """Decimal -> число для jsonify"""
+    return {
+        'lines': [dict(line, price=float(line['price']), amount=float(line['amount']))
+                  for line in result['lines']],
+        'total_tickets': result['total_tickets'],
+        'total_amount': float(result['total_amount']),
+        'pushkin_eligible': result['pushkin_eligible']
+    }
@@ -0,0 +1,97 @@
+"""
+QR-коды билетов, которые рисует само приложение (вместо api.qrserver.com).
+
+Картинка для пары (данные, формат) рисуется один раз, затем берётся из
+памяти (LRU) или с диска. Имя файла - хэш данных, так что токен билета
+на диске в открытом виде не лежит.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import segno
+
+QR_CONFIG = {
+    'cache_dir': os.path.join(os.path.abspath(os.path.dirname(__file__)), 'cache', 'qr'),
+    'memory_entries': 512,
+    'scale': 8,           # пикселей на модуль в PNG
+    'border': 2,
+    'error': 'm'          # уровень коррекции ошибок
+}
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def cache_key(data, fmt):
+    """Имя картинки в кэше: зависит от данных, формата и параметров рисования"""
+    raw = f"{data}|{fmt}|{QR_CONFIG['scale']}|{QR_CONFIG['border']}|{QR_CONFIG['error']}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def render(data, fmt):
+    """Нарисовать QR-код: байты PNG или SVG"""
+    qr = segno.make(data, error=QR_CONFIG['error'])
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        qr.save(buffer, kind='svg', scale=QR_CONFIG['scale'] // 2, border=QR_CONFIG['border'], xmldecl=False)
+    else:
+        qr.save(buffer, kind='png', scale=QR_CONFIG['scale'], border=QR_CONFIG['border'])
+    return buffer.getvalue()
+
+
+def _remember(key, body):
+    with _lock:
+        _memory[key] = body
+        _memory.move_to_end(key)
+        while len(_memory) > QR_CONFIG['memory_entries']:
+            _memory.popitem(last=False)
+
+
+def _disk_path(key, fmt):
+    return os.path.join(QR_CONFIG['cache_dir'], key[:2], f"{key}.{fmt}")
+
+
+def get_cached(data, fmt):
+    """(ключ, байты) из памяти или с диска; байты None, если картинки ещё нет"""
+    key = cache_key(data, fmt)
+    with _lock:
+        body = _memory.get(key)
+        if body is not None:
+            _memory.move_to_end(key)
+            return key, body
+    try:
+        with open(_disk_path(key, fmt), 'rb') as f:
+            body = f.read()
+    except OSError:
+        return key, None
+    _remember(key, body)
+    return key, body
+
+
+def get_or_render(data, fmt):
+    """(ключ, байты): из кэша, а при промахе нарисовать и сохранить"""
+    key, body = get_cached(data, fmt)
+    if body is not None:
+        return key, body
+
+    body = render(data, fmt)
+    path = _disk_path(key, fmt)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Через временный файл: параллельный читатель не увидит половину картинки
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Не удалось сохранить QR-код в кэш: {e}")
+    _remember(key, body)
+    return key, body
@@ -0,0 +1,442 @@
+"""
+Полнотекстовый поиск по data_content для /api/search.
+
+Индекс строится в памяти процесса один раз и дальше обновляется точечно
+при изменении контента через админку. Поддерживаются русские словоформы
+(стеммер Портера/Snowball), автодополнение последнего слова по префиксу
+и опечатки (совпадение по триграммам). Описания для выдачи очищаются от
+HTML заранее, при индексации.
+"""
+import bisect
+import heapq
+import html
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+import database as db
+
+SEARCH_CATEGORIES = ('virtual_exhibitions', 'poster', 'museums')
+
+# Вес слова в заголовке и в кратком описании
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+# Множители для неточных совпадений
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.5
+
+MAX_PREFIX_EXPANSIONS = 64
+MAX_FUZZY_CANDIDATES = 5
+FUZZY_MIN_SIMILARITY = 0.5
+SNIPPET_LENGTH = 100
+
+# Сколько последних запросов помнить (поиск по мере набора часто повторяется)
+RESULT_CACHE_SIZE = 1024
+
+# Полная перестройка индекса (подхватывает правки из других воркеров)
+REBUILD_INTERVAL = 600
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'на', 'с', 'со', 'по', 'для', 'не', 'о', 'об', 'из',
+    'к', 'у', 'за', 'от', 'до', 'а', 'но', 'или', 'же', 'ли', 'бы'
+}
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+TAG_RE = re.compile(r'<[^>]+>')
+SPACES_RE = re.compile(r'\s+')
+
+
+# ===================================================================================
+# СТЕММЕР (Snowball для русского языка)
+# ===================================================================================
+
+_RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE_RE = re.compile(r'(с[яь])$')
+_ADJECTIVE_RE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB_RE = re.compile(r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить'
+                      r'|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+_NOUN_RE = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь'
+                      r'|ию|ью|ю|ия|ья|я)$')
+_I_RE = re.compile(r'и$')
+_DERIVATIONAL_RE = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER_RE = re.compile(r'ость?$')
+_SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+_SOFT_SIGN_RE = re.compile(r'ь$')
+_NN_RE = re.compile(r'нн$')
+
+
+def stem(word):
+    """Основа русского слова (латиница и числа возвращаются как есть)"""
+    match = _RV_RE.match(word)
+    if not match:
+        return word
+    pre, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND_RE.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE_RE.sub('', rv, 1)
+        temp = _ADJECTIVE_RE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE_RE.sub('', temp, 1)
+        else:
+            temp = _VERB_RE.sub('', rv, 1)
+            rv = _NOUN_RE.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = _I_RE.sub('', rv, 1)
+    if _DERIVATIONAL_RE.match(rv):
+        rv = _DER_RE.sub('', rv, 1)
+
+    temp = _SOFT_SIGN_RE.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE_RE.sub('', rv, 1)
+        rv = _NN_RE.sub('н', rv, 1)
+    else:
+        rv = temp
+    return pre + rv
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, ё заменяется на е"""
+    return TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+def index_words(text):
+    return [w for w in tokenize(text) if len(w) > 1 and w not in STOP_WORDS]
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def clean_text(text):
+    """Текст без HTML-тегов и лишних пробелов"""
+    text = html.unescape(TAG_RE.sub(' ', text or ''))
+    return SPACES_RE.sub(' ', text).strip()
+
+
+def make_snippet(text, length=SNIPPET_LENGTH):
+    text = clean_text(text)
+    if len(text) > length:
+        text = text[:length] + '...'
+    return text
+
+
+# ===================================================================================
+# ИНДЕКС
+# ===================================================================================
+
+class SearchIndex:
+    """Инвертированный индекс: основа слова -> {id документа: вес}"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}
+        self._doc_terms = {}
+        self.stems = defaultdict(dict)
+        self.words = defaultdict(dict)
+        self.vocabulary = []
+        self.trigrams = defaultdict(set)
+        self._bulk = False
+        self._results = OrderedDict()
+        self._token_matches = OrderedDict()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, row):
+        """Добавить или заменить документ (строку data_content)"""
+        with self._lock:
+            self.remove(row['id'])
+            self._results.clear()
+            self._token_matches.clear()
+            if row.get('category') not in SEARCH_CATEGORIES:
+                return
+
+            words = Counter()
+            for w in index_words(row.get('title_card')):
+                words[w] += TITLE_WEIGHT
+            for w in index_words(clean_text(row.get('short_description_card'))):
+                words[w] += DESCRIPTION_WEIGHT
+            stems = Counter()
+            for w, weight in words.items():
+                stems[stem(w)] += weight
+
+            doc_id = row['id']
+            self.docs[doc_id] = {
+                'id': doc_id,
+                'category': row['category'],
+                'title': row.get('title_card') or '',
+                'desc': make_snippet(row.get('short_description_card')),
+                'img_card': row.get('img_card') or ''
+            }
+            self._doc_terms[doc_id] = (stems, words)
+            for s, weight in stems.items():
+                self.stems[s][doc_id] = weight
+            for w, weight in words.items():
+                postings = self.words[w]
+                if not postings:
+                    if not self._bulk:
+                        bisect.insort(self.vocabulary, w)
+                    for t in trigrams(w):
+                        self.trigrams[t].add(w)
+                postings[doc_id] = weight
+
+    def add_many(self, rows):
+        """Массовая загрузка: словарь сортируется один раз в конце"""
+        with self._lock:
+            self._bulk = True
+            try:
+                for row in rows:
+                    self.add(row)
+            finally:
+                self._bulk = False
+                self.vocabulary = sorted(self.words)
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self.docs.pop(doc_id, None) is None:
+                return
+            self._results.clear()
+            self._token_matches.clear()
+            stems, words = self._doc_terms.pop(doc_id)
+            for s in stems:
+                postings = self.stems[s]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.stems[s]
+            for w in words:
+                postings = self.words[w]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.words[w]
+                    i = bisect.bisect_left(self.vocabulary, w)
+                    if i < len(self.vocabulary) and self.vocabulary[i] == w:
+                        del self.vocabulary[i]
+                    for t in trigrams(w):
+                        bucket = self.trigrams.get(t)
+                        if bucket is not None:
+                            bucket.discard(w)
+                            if not bucket:
+                                del self.trigrams[t]
+
+    def _prefix_words(self, prefix):
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        result = []
+        while i < len(self.vocabulary) and len(result) < MAX_PREFIX_EXPANSIONS:
+            w = self.vocabulary[i]
+            if not w.startswith(prefix):
+                break
+            result.append(w)
+            i += 1
+        return result
+
+    def _fuzzy_words(self, word):
+        grams = trigrams(word)
+        overlap = Counter()
+        for t in grams:
+            for w in self.trigrams.get(t, ()):
+                overlap[w] += 1
+        candidates = []
+        for w, common in overlap.items():
+            similarity = 2 * common / (len(grams) + len(w) + 1)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                candidates.append((similarity, w))
+        return [w for _, w in heapq.nlargest(MAX_FUZZY_CANDIDATES, candidates)]
+
+    @staticmethod
+    def _merge(matches, postings, factor):
+        for doc_id, weight in postings.items():
+            weight *= factor
+            if weight > matches.get(doc_id, 0):
+                matches[doc_id] = weight
+
+    def _matches(self, token, is_prefix):
+        """Документы, подходящие под одно слово запроса: {id: вес}"""
+        key = (token, is_prefix)
+        matches = self._token_matches.get(key)
+        if matches is not None:
+            self._token_matches.move_to_end(key)
+            return matches
+
+        exact = self.stems.get(stem(token))
+        if not is_prefix and exact:
+            # Точное совпадение основы: постинги используются без копирования
+            matches = exact
+        else:
+            matches = dict(exact or {})
+            if is_prefix:
+                for w in self._prefix_words(token):
+                    self._merge(matches, self.words[w], PREFIX_FACTOR)
+            if not matches and len(token) >= 4:
+                for w in self._fuzzy_words(token):
+                    self._merge(matches, self.words[w], FUZZY_FACTOR)
+
+        self._token_matches[key] = matches
+        if len(self._token_matches) > RESULT_CACHE_SIZE:
+            self._token_matches.popitem(last=False)
+        return matches
+
+    def search(self, query, limit=20):
+        """Лучшие limit документов, содержащих все слова запроса"""
+        tokens = [w for w in tokenize(query) if w not in STOP_WORDS]
+        if not tokens:
+            return []
+        # Последнее слово ещё набирается, если после него нет пробела
+        last_is_prefix = not query[-1:].isspace()
+        key = (tuple(tokens), last_is_prefix, limit)
+
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return cached
+            result = self._search(tokens, last_is_prefix, limit)
+            self._results[key] = result
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+            return result
+
+    def _search(self, tokens, last_is_prefix, limit):
+        """Поиск без кэша (вызывается под блокировкой)"""
+        total = len(self.docs) or 1
+        per_token = []
+        for i, token in enumerate(tokens):
+            matches = self._matches(token, last_is_prefix and i == len(tokens) - 1)
+            if not matches:
+                return []
+            per_token.append(matches)
+
+        if len(per_token) == 1:
+            # Одно слово: порядок определяется только весом, считать idf не нужно
+            matches = per_token[0]
+            best = heapq.nlargest(limit, matches, key=matches.__getitem__)
+            return [self.docs[doc_id] for doc_id in best]
+
+        per_token.sort(key=len)
+        candidates = set(per_token[0])
+        for matches in per_token[1:]:
+            candidates.intersection_update(matches)
+            if not candidates:
+                return []
+
+        scores = {}
+        for matches in per_token:
+            df = len(matches)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for doc_id in candidates:
+                weight = matches[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0) + idf * weight * 2.2 / (weight + 1.2)
+
+        best = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        return [self.docs[doc_id] for doc_id in best]
+
+
+# ===================================================================================
+# ИНДЕКС ПРОЦЕССА
+# ===================================================================================
+
+index = SearchIndex()
+_built_at = None
+_rebuild_lock = threading.Lock()
+_rebuilding = False
+# Правки, ещё не попавшие в индекс: пришли во время загрузки или при ошибке БД
+_pending_changes = []
+
+
+def load_documents():
+    query = """
+        SELECT id, category, title_card, short_description_card, img_card
+        FROM data_content
+        WHERE category IN ('virtual_exhibitions', 'poster', 'museums')
+    """
+    return db.execute_query(query)
+
+
+def load_document(content_id):
+    """[строка] или [], если записи нет (или она не для поиска); None при ошибке БД"""
+    query = """
+        SELECT id, category, title_card, short_description_card, img_card
+        FROM data_content
+        WHERE id = %s AND category IN ('virtual_exhibitions', 'poster', 'museums')
+    """
+    return db.execute_query(query, (content_id,), primary=True)
+
+
+def _apply_pending():
+    pending = list(dict.fromkeys(_pending_changes))
+    del _pending_changes[:]
+    for content_id in pending:
+        on_content_changed(content_id)
+
+
+def rebuild():
+    """Построить индекс заново и атомарно подменить текущий"""
+    global index, _built_at, _rebuilding
+    _rebuilding = True
+    try:
+        rows = load_documents()
+        if rows is None:
+            return False
+        fresh = SearchIndex()
+        fresh.add_many(rows)
+        index = fresh
+        _built_at = time.monotonic()
+    finally:
+        _rebuilding = False
+    # Правки, пришедшие во время загрузки, могли не попасть в новый индекс
+    _apply_pending()
+    return True
+
+
+def _rebuild_in_background():
+    try:
+        rebuild()
+    finally:
+        _rebuild_lock.release()
+
+
+def ensure_index():
+    """Первый вызов строит индекс, устаревший индекс перестраивается в фоне"""
+    if _built_at is None:
+        with _rebuild_lock:
+            if _built_at is None:
+                rebuild()
+    elif time.monotonic() - _built_at > REBUILD_INTERVAL and _rebuild_lock.acquire(blocking=False):
+        threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    elif _pending_changes and not _rebuilding:
+        _apply_pending()
+    return index
+
+
+def search(query, limit=20):
+    """Ранжированный поиск по музеям, выставкам и афише"""
+    return ensure_index().search(query, limit)
+
+
+def on_content_changed(content_id):
+    """Точечно обновить индекс после изменения записи data_content"""
+    if not content_id:
+        return
+    if _rebuilding:
+        _pending_changes.append(content_id)
+    if _built_at is None:
+        return
+    rows = load_document(content_id)
+    if rows is None:
+        # Ошибка БД ещё не значит, что записи нет: повторим при следующем поиске
+        _pending_changes.append(content_id)
+    elif rows:
+        index.add(rows[0])
+    else:
+        index.remove(int(content_id))
+
+
+db.add_content_listener(on_content_changed)
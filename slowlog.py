@@ -0,0 +1,231 @@
+"""
+Журнал медленных запросов к БД.
+
+Каждый запрос через пул (подписка database.add_query_listener) сводится
+к отпечатку: литералы и параметры заменены на ?, списки IN (...) и
+VALUES свёрнуты, пробелы нормализованы. По отпечатку копится скользящая
+статистика: число, суммарное и p95 время, строки. Запрос дольше
+threshold_ms попадает в примеры, а для SELECT/UPDATE/DELETE
+фоновый поток снимает EXPLAIN (не чаще раза в explain_interval секунд на
+отпечаток, на отдельном соединении - сам запрос не ждёт).
+
+В примерах параметры замаскированы: числа остаются, строки и прочее -
+только тип и длина (в заказах это имена, e-mail и телефоны). Настоящие
+параметры уходят лишь в очередь EXPLAIN.
+
+    /admin/slow-queries         - страница в админке
+    /admin/slow-queries.json    - то же в JSON
+"""
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+import database as db
+
+SLOWLOG_CONFIG = {
+    'threshold_ms': float(os.environ.get('MGORKI_SLOW_QUERY_MS', '100')),
+    'window': 512,              # последних длительностей на отпечаток (для p95)
+    'max_fingerprints': 500,
+    'samples': 5,               # медленных примеров на отпечаток
+    'explain_interval': 60,     # сек между EXPLAIN одного отпечатка
+    'explain_queue': 100
+}
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_PARAM = re.compile(r"%s|%\(\w+\)s")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_ROWS = re.compile(r"(\(\?\+\)|\(\?\))(?:\s*,\s*(?:\(\?\+\)|\(\?\)))+")
+
+
+def fingerprint(query):
+    """SELECT * FROM t WHERE id IN (%s, %s) LIMIT 5 -> SELECT * FROM t WHERE id IN (?+) LIMIT ?"""
+    text = _STRING.sub('?', query)
+    text = _PARAM.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _SPACE.sub(' ', text).strip()
+    text = _IN_LIST.sub('(?+)', text)
+    return _VALUES_ROWS.sub(r'\1, ...', text)
+
+
+class _Entry:
+    __slots__ = ('statement', 'count', 'errors', 'total', 'max', 'rows', 'slow', 'durations',
+                 'samples', 'plan', 'plan_at', 'explain_requested', 'first_seen', 'last_seen')
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = self.errors = self.rows = self.slow = 0
+        self.total = self.max = 0.0
+        self.durations = deque(maxlen=SLOWLOG_CONFIG['window'])
+        self.samples = deque(maxlen=SLOWLOG_CONFIG['samples'])
+        self.plan = None
+        self.plan_at = None
+        self.explain_requested = 0.0
+        self.first_seen = self.last_seen = time.time()
+
+
+class SlowQueryLog:
+    def __init__(self):
+        self._entries = {}
+        self._fingerprints = {}     # текст запроса -> отпечаток (запросы в коде почти всегда одни и те же)
+        self._lock = threading.Lock()
+        self._guard = threading.local()
+        self._explain_queue = queue.Queue(SLOWLOG_CONFIG['explain_queue'])
+        self._thread = None
+        self._pid = None
+        self._dropped = 0
+
+    # --- запись ---
+
+    def _fingerprint(self, query):
+        result = self._fingerprints.get(query)
+        if result is None:
+            if len(self._fingerprints) > 4 * SLOWLOG_CONFIG['max_fingerprints']:
+                self._fingerprints.clear()
+            result = self._fingerprints[query] = fingerprint(query)
+        return result
+
+    def record(self, query, params, seconds, error, rows):
+        """Подписчик database.add_query_listener"""
+        # Запросы самого журнала (EXPLAIN из фонового потока) не учитываются
+        if getattr(self._guard, 'active', False) or not query:
+            return
+        statement = self._fingerprint(query)
+        slow = seconds * 1000 >= SLOWLOG_CONFIG['threshold_ms']
+        explain = False
+        with self._lock:
+            entry = self._entries.get(statement)
+            if entry is None:
+                if len(self._entries) >= SLOWLOG_CONFIG['max_fingerprints']:
+                    self._dropped += 1
+                    return
+                entry = self._entries[statement] = _Entry(statement)
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.rows += rows or 0
+            entry.durations.append(seconds)
+            entry.last_seen = time.time()
+            if error is not None:
+                entry.errors += 1
+            if slow:
+                entry.slow += 1
+                entry.samples.append({'at': entry.last_seen, 'duration_ms': round(seconds * 1000, 2),
+                                      'rows': rows, 'params': _sample_params(params),
+                                      'error': str(error) if error else None})
+                now = time.monotonic()
+                if (query.split(None, 1)[0].upper() in EXPLAINED
+                        and now - entry.explain_requested >= SLOWLOG_CONFIG['explain_interval']):
+                    entry.explain_requested = now
+                    explain = True
+        if slow:
+            print(f"Медленный запрос ({seconds * 1000:.0f} мс): {statement[:200]}")
+        if explain:
+            self._request_explain(statement, query, params)
+
+    # --- EXPLAIN в фоне ---
+
+    def _request_explain(self, statement, query, params):
+        self._ensure_worker()
+        try:
+            self._explain_queue.put_nowait((statement, query, params))
+        except queue.Full:
+            pass
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._explain_forever, name='mgorki-slowlog', daemon=True)
+            self._thread.start()
+
+    def _explain_forever(self):
+        self._guard.active = True
+        while True:
+            statement, query, params = self._explain_queue.get()
+            try:
+                plan = db.execute_query('EXPLAIN ' + query, params)
+                with self._lock:
+                    entry = self._entries.get(statement)
+                    if entry is not None and plan is not None:
+                        entry.plan = [{k: _plain(v) for k, v in row.items()} for row in plan]
+                        entry.plan_at = time.time()
+            except Exception as e:
+                print(f"Ошибка EXPLAIN для {statement[:200]}: {e}")
+
+    # --- чтение ---
+
+    def snapshot(self):
+        """Отпечатки по убыванию суммарного времени"""
+        with self._lock:
+            entries = list(self._entries.values())
+            result = []
+            for entry in entries:
+                durations = sorted(entry.durations)
+                p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))] if durations else 0.0
+                result.append({
+                    'id': hashlib.sha1(entry.statement.encode('utf-8')).hexdigest()[:12],
+                    'statement': entry.statement,
+                    'count': entry.count,
+                    'errors': entry.errors,
+                    'slow': entry.slow,
+                    'total_ms': round(entry.total * 1000, 2),
+                    'avg_ms': round(entry.total * 1000 / entry.count, 3),
+                    'p95_ms': round(p95 * 1000, 3),
+                    'max_ms': round(entry.max * 1000, 3),
+                    'rows': entry.rows,
+                    'rows_avg': round(entry.rows / entry.count, 1),
+                    'first_seen': entry.first_seen,
+                    'last_seen': entry.last_seen,
+                    'samples': list(entry.samples),
+                    'plan': entry.plan,
+                    'plan_at': entry.plan_at
+                })
+            dropped = self._dropped
+        result.sort(key=lambda e: e['total_ms'], reverse=True)
+        return {'threshold_ms': SLOWLOG_CONFIG['threshold_ms'], 'dropped': dropped, 'statements': result}
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._dropped = 0
+
+
+def _plain(value):
+    return value if isinstance(value, (int, float, str, type(None))) else str(value)
+
+
+def _mask(value):
+    """Число или None как есть, остальное - '<тип:длина>' без содержимого"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    try:
+        return f"<{type(value).__name__}:{len(value)}>"
+    except TypeError:
+        return f"<{type(value).__name__}>"
+
+
+def _sample_params(params):
+    if params is None:
+        return None
+    return [_mask(value) for value in (params.values() if isinstance(params, dict) else params)]
+
+
+slow_log = SlowQueryLog()
+
+
+def init():
+    """Подписаться на запросы database.py"""
+    db.add_query_listener(slow_log.record)
+
+
+def get_slow_queries():
+    return slow_log.snapshot()
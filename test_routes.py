@@ -1,5 +1,9 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
+import availability
+import checkin
 import database as db
+import jobs
+import pagecache
 
 # ===================================================================================
 # МАРШРУТЫ ДЛЯ ТЕСТИРОВАНИЯ
@@ -18,6 +22,48 @@ def test_db():
     return "❌ Ошибка подключения к БД"
 
 
+@test_bp.route('/pool-stats')
+def pool_stats():
+    """Статистика пула соединений текущего воркера"""
+    return jsonify(db.get_pool_stats())
+
+
+@test_bp.route('/replica-stats')
+def replica_stats():
+    """Реплики для чтения: в ротации ли, отставание, чтения и ошибки"""
+    return jsonify(db.get_replica_stats())
+
+
+@test_bp.route('/cache-stats')
+def cache_stats():
+    """Попадания и промахи кэша справочных данных"""
+    return jsonify(db.get_cache_stats())
+
+
+@test_bp.route('/page-cache-stats')
+def page_cache_stats():
+    """Кэш готовых страниц: попадания, устаревшие копии, объединённые промахи"""
+    return jsonify(pagecache.get_page_cache_stats())
+
+
+@test_bp.route('/jobs-stats')
+def jobs_stats():
+    """Запуски, ошибки и длительность фоновых задач"""
+    return jsonify(jobs.get_jobs_stats())
+
+
+@test_bp.route('/availability-stats')
+def availability_stats():
+    """Микрокэш свободных мест и подписчики потока событий"""
+    return jsonify(availability.get_availability_stats())
+
+
+@test_bp.route('/checkin-stats')
+def checkin_stats():
+    """Проходы по билетам и отметки, ещё не записанные в БД"""
+    return jsonify(checkin.get_checkin_stats())
+
+
 @test_bp.route('/show-tables')
 def show_tables():
     """Показать все таблицы в БД"""
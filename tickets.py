@@ -0,0 +1,121 @@
+"""
+Подписанные токены билетов для QR-кодов.
+
+Токен сам несёт номер заказа, сеанс и окно действия и подписан HMAC,
+поэтому /qr/<token> проверяет его без запроса к БД - только отметка
+прохода пишется в orders. Вид токена: <kid>.<base64url(данные + подпись)>,
+меньше 50 символов, чтобы QR-код оставался маленьким.
+
+Ключи задаются переменной окружения MGORKI_TICKET_KEYS="kid:секрет,...":
+первым ключом подписываются новые билеты, остальные только проверяются.
+Для смены ключа новый ставится первым, старый остаётся в списке, пока
+не истекут выданные им билеты.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+
+TICKET_CONFIG = {
+    'valid_before_hours': 0,    # за сколько часов до дня сеанса билет уже действует
+    'valid_after_hours': 6,     # сколько часов после конца дня сеанса ещё пускать
+    'signature_bytes': 16       # длина подписи в токене (HMAC-SHA256 обрезается)
+}
+
+TOKEN_VERSION = 1
+_PAYLOAD = struct.Struct('>BIIII')    # версия, order_id, session_id, nbf, exp
+
+# Результаты проверки
+VALID = 'valid'
+INVALID = 'invalid'
+NOT_YET_VALID = 'not_yet_valid'
+EXPIRED = 'expired'
+
+
+def _load_keys():
+    """[(kid, ключ)] из MGORKI_TICKET_KEYS; без переменной - ключ для разработки"""
+    raw = os.environ.get('MGORKI_TICKET_KEYS', '')
+    keys = []
+    for part in raw.split(','):
+        kid, _, secret = part.strip().partition(':')
+        if kid and secret:
+            keys.append((kid, secret.encode('utf-8')))
+    if not keys:
+        print("MGORKI_TICKET_KEYS не задан: билеты подписываются ключом для разработки")
+        keys = [('dev', b'your-ticket-key-here')]
+    return keys
+
+
+_keys = _load_keys()
+_keys_by_id = dict(_keys)
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(secret, kid, payload):
+    # kid входит в подпись: токен нельзя "переложить" под другой ключ
+    return hmac.new(secret, kid.encode('utf-8') + b'.' + payload,
+                    hashlib.sha256).digest()[:TICKET_CONFIG['signature_bytes']]
+
+
+def is_signed(token):
+    """Токен нового вида (старые - случайная строка без точки)"""
+    return '.' in (token or '')
+
+
+def validity_window(session_date):
+    """(nbf, exp) в секундах: день сеанса с запасом из TICKET_CONFIG"""
+    day_start = datetime.combine(session_date, datetime.min.time())
+    nbf = day_start - timedelta(hours=TICKET_CONFIG['valid_before_hours'])
+    exp = day_start + timedelta(days=1, hours=TICKET_CONFIG['valid_after_hours'])
+    return int(time.mktime(nbf.timetuple())), int(time.mktime(exp.timetuple()))
+
+
+def mint(order_id, session_id, session_date):
+    """Подписанный токен билета текущим (первым) ключом"""
+    kid, secret = _keys[0]
+    nbf, exp = validity_window(session_date)
+    payload = _PAYLOAD.pack(TOKEN_VERSION, order_id, session_id, nbf, exp)
+    return f"{kid}.{_b64encode(payload + _sign(secret, kid, payload))}"
+
+
+def verify(token, now=None):
+    """(статус, данные) без обращения к БД.
+
+    Данные - {'order_id', 'session_id', 'nbf', 'exp', 'kid'} для VALID,
+    NOT_YET_VALID и EXPIRED; для INVALID - None.
+    """
+    kid, _, body = (token or '').partition('.')
+    secret = _keys_by_id.get(kid)
+    if secret is None or not body:
+        return INVALID, None
+    try:
+        raw = _b64decode(body)
+    except (binascii.Error, ValueError):
+        return INVALID, None
+    if len(raw) != _PAYLOAD.size + TICKET_CONFIG['signature_bytes']:
+        return INVALID, None
+    payload, signature = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(signature, _sign(secret, kid, payload)):
+        return INVALID, None
+    version, order_id, session_id, nbf, exp = _PAYLOAD.unpack(payload)
+    if version != TOKEN_VERSION:
+        return INVALID, None
+
+    claims = {'order_id': order_id, 'session_id': session_id, 'nbf': nbf, 'exp': exp, 'kid': kid}
+    now = time.time() if now is None else now
+    if now < nbf:
+        return NOT_YET_VALID, claims
+    if now >= exp:
+        return EXPIRED, claims
+    return VALID, claims